@@ -0,0 +1,324 @@
+"""
+Benchmarks for the EMIP Toolkit (EMTK)
+
+Runs parsing, fixation detection, AOI detection, hit testing and rendering on fixed-size inputs and reports
+wall time, throughput and peak memory of each stage. Inputs are raw data from emip_synthetic and a
+stimulus image drawn from the bundled datasets/EMIP2021 token files, so runs are reproducible without the EMIP dataset.
+
+Usage:
+    python emip_benchmark.py --output results.json
+    python emip_benchmark.py --baseline results.json --threshold 0.2
+
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw, ImageFont
+
+import emip_synthetic
+import emip_toolkit as tk
+
+# Number of participants, trials per participant and seconds per trial of raw data files at scale 1
+SMI_SIZE = (2, 4, 20)
+
+EYELINK_SIZE = (2, 4, 10)
+
+# Number of samples classified by I-DT at scale 1
+IDT_SIZE = 100000
+
+STIMULUS_WIDTH, STIMULUS_HEIGHT = 1920, 1080
+
+
+def draw_stimulus(token_file):
+    """Draws a code stimulus from a token file of datasets/EMIP2021, one line of code per AOI line
+
+    Parameters
+    ----------
+    token_file : str
+        path of the token file
+
+    Returns
+    -------
+    PIL.Image
+        the stimulus image
+    """
+
+    tokens = pd.read_csv(token_file, sep="\t")
+    lines = {}
+    for token, aoi in zip(tokens["token"].astype(str), tokens["AOI"]):
+        lines.setdefault(int(aoi.split(' ')[1]), []).append(token)
+
+    try:
+        font = ImageFont.load_default(size=20)
+    except TypeError:
+        font = ImageFont.load_default()
+
+    img = Image.new("RGB", (STIMULUS_WIDTH, STIMULUS_HEIGHT), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    for number in sorted(lines):
+        draw.text((100, 150 + 30 * (number - 1)), " ".join(lines[number]), fill=(0, 0, 0), font=font)
+
+    return img
+
+
+def measure(stage, repeat):
+    """Runs a stage repeat times and once more under tracemalloc
+
+    Parameters
+    ----------
+    stage : callable
+        returns the number of items it processed
+
+    repeat : int
+        number of timed runs, the fastest is reported
+
+    Returns
+    -------
+    dict
+        seconds, items, throughput and peak_memory in bytes
+    """
+
+    seconds = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            items = stage()
+            seconds.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            stage()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    best = min(seconds)
+
+    return {"seconds": best,
+            "items": items,
+            "throughput": items / best if best > 0 else float("inf"),
+            "peak_memory": peak_memory}
+
+
+def run(dataset_path="datasets/EMIP2021/", scale=1.0, repeat=3, stages=None):
+    """Runs the benchmark stages
+
+    Parameters
+    ----------
+    dataset_path : str, optional
+        path of the bundled token files
+
+    scale : float, optional
+        multiplies the size of the synthetic inputs
+
+    repeat : int, optional
+        number of timed runs of each stage
+
+    stages : list, optional
+        names of the stages to run, all by default
+
+    Returns
+    -------
+    dict
+        meta information about the run and the results of each stage
+    """
+
+    idt_samples = max(int(IDT_SIZE * scale), 1)
+
+    results = {"meta": {"python": platform.python_version(),
+                        "numpy": np.__version__,
+                        "pandas": pd.__version__,
+                        "platform": platform.platform(),
+                        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        "scale": scale,
+                        "repeat": repeat},
+               "stages": {}}
+
+    with tempfile.TemporaryDirectory() as directory:
+        participants, trials, duration = SMI_SIZE
+        files = [os.path.join(directory, "%d_rawdata.tsv" % participant)
+                 for participant in range(1, participants + 1)]
+        smi_samples = sum(emip_synthetic.write_smi(filename, trials, duration * scale, stimuli=["rectangle_java.jpg"],
+                                                   seed=participant)
+                          for participant, filename in enumerate(files))
+
+        participants, trials, duration = EYELINK_SIZE
+        eyelink_root = os.path.join(directory, "AlMadi2018")
+        asc_files = emip_synthetic.write_eyelink_dataset(eyelink_root, participants, trials, duration * scale)
+        asc_samples = 0
+        for filename in asc_files:
+            with open(filename) as asc_file:
+                asc_samples += sum(1 for line in asc_file if line[:1].isdigit())
+
+        img = draw_stimulus(dataset_path + "rectangle.tsv")
+        image_file = os.path.join(directory, "rectangle_java.jpg")
+        img.save(image_file)
+
+        rng = np.random.default_rng(0)
+        events = emip_synthetic.scanpath(rng, idt_samples * 4, emip_synthetic.code_layout(rng))
+        times, x_cords, y_cords, _ = emip_synthetic.gaze_samples(rng, events, 4)
+        timestamps = (times[:idt_samples] * 1000).astype(np.int64)
+        x_cords = np.nan_to_num(x_cords[:idt_samples], nan=-1)
+        y_cords = np.nan_to_num(y_cords[:idt_samples], nan=-1)
+        raw_samples = [[t, x, y] for t, x, y in zip(timestamps.tolist(), x_cords.tolist(), y_cords.tolist())]
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            experiment = tk.read_SMIRed250(files[0], "tsv")
+            aois = tk.find_aoi("rectangle_java.jpg", directory + "/")
+
+        # Tokens and srcML tags of the bundled file, as add_tokens_to_AOIs and add_srcml_to_AOIs add them
+        tokens = pd.read_csv(dataset_path + "rectangle.tsv", sep="\t")
+        aois_tokens = tk.add_srcml_to_AOIs(aois, dataset_path)
+        aois_tokens["token"] = aois_tokens["name"].map(dict(zip(tokens["AOI"], tokens["token"].astype(str))))
+        aois_tokens["token"] = aois_tokens["token"].fillna("")
+
+        fixations = sum(trial.get_fixation_number() for trial in experiment.trial)
+
+        def parse_smi():
+            for filename in files:
+                tk.read_SMIRed250(filename, "tsv")
+            return smi_samples
+
+        def parse_eyelink():
+            for filename in asc_files:
+                tk.read_EyeLink1000(filename, "asc", vcl_index=eyelink_root)
+            return asc_samples
+
+        def idt_classifier():
+            tk.idt_classifier(raw_samples)
+            return idt_samples
+
+        def idt_classifier_array():
+            tk.idt_classifier_array(timestamps, x_cords, y_cords)
+            return idt_samples
+
+        def ivt_classifier():
+            tk.ivt_classifier(timestamps, x_cords, y_cords)
+            return idt_samples
+
+        def find_aoi():
+            return len(tk.find_aoi(image_file.split(os.sep)[-1], directory + "/"))
+
+        def find_aoi_line():
+            return len(tk.find_aoi(image_file.split(os.sep)[-1], directory + "/", level="line"))
+
+        def add_srcml():
+            tk.read_srcML_table.cache_clear()
+            return len(tk.add_srcml_to_AOIs(aois, dataset_path))
+
+        def hit_test():
+            for each in experiment.trial:
+                tk.hit_test(each, aois_tokens)
+            return fixations
+
+        def render():
+            tk.read_stimulus.cache_clear()
+            tk.render_trials(experiment, directory + "/", directory + "/render-", draw_raw_data=True,
+                             draw_aoi=aois)
+            return len(experiment.trial)
+
+        available = {"parse_smi": (parse_smi, "samples"),
+                     "parse_eyelink": (parse_eyelink, "samples"),
+                     "idt_classifier": (idt_classifier, "samples"),
+                     "idt_classifier_array": (idt_classifier_array, "samples"),
+                     "ivt_classifier": (ivt_classifier, "samples"),
+                     "find_aoi": (find_aoi, "aois"),
+                     "find_aoi_line": (find_aoi_line, "aois"),
+                     "add_srcml": (add_srcml, "aois"),
+                     "hit_test": (hit_test, "fixations"),
+                     "render": (render, "trials")}
+
+        for name in stages or available:
+            stage, unit = available[name]
+            results["stages"][name] = dict(measure(stage, repeat), unit=unit)
+
+    return results
+
+
+def compare(results, baseline, threshold=0.2):
+    """Compares a run with a baseline run
+
+    Parameters
+    ----------
+    results, baseline : dict
+        runs returned by run()
+
+    threshold : float, optional
+        a stage regresses when it is this much slower than the baseline, 0.2 is 20%
+
+    Returns
+    -------
+    pandas.DataFrame
+        baseline and current seconds and peak memory of each stage found in both runs, their ratios
+        and whether the stage regressed
+    """
+
+    rows = []
+    for name, stage in results["stages"].items():
+        if name not in baseline["stages"]:
+            continue
+
+        base = baseline["stages"][name]
+        time_ratio = stage["seconds"] / base["seconds"] if base["seconds"] > 0 else float("inf")
+        memory_ratio = stage["peak_memory"] / base["peak_memory"] if base["peak_memory"] > 0 else float("inf")
+
+        rows.append([name, base["seconds"], stage["seconds"], time_ratio, base["peak_memory"],
+                     stage["peak_memory"], memory_ratio, time_ratio > 1 + threshold])
+
+    return pd.DataFrame(rows, columns=['stage', 'baseline_seconds', 'seconds', 'time_ratio', 'baseline_peak_memory',
+                                       'peak_memory', 'memory_ratio', 'regression'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the EMIP Toolkit")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare the results with this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown over the baseline reported as a regression, 0.2 is 20%%")
+    parser.add_argument("--scale", type=float, default=1.0, help="size of the synthetic inputs")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of each stage")
+    parser.add_argument("--stage", action="append", dest="stages", help="stage to run, all by default")
+    parser.add_argument("--datasets", default="datasets/EMIP2021/", help="path of the bundled token files")
+    args = parser.parse_args(argv)
+
+    results = run(args.datasets, args.scale, args.repeat, args.stages)
+
+    table = pd.DataFrame([[name, stage["seconds"], stage["items"], stage["throughput"], stage["unit"] + "/s",
+                           stage["peak_memory"]]
+                          for name, stage in results["stages"].items()],
+                         columns=['stage', 'seconds', 'items', 'throughput', 'unit', 'peak_memory'])
+    print(table.to_string(index=False))
+
+    if args.output:
+        with open(args.output, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as json_file:
+            baseline = json.load(json_file)
+
+        comparison = compare(results, baseline, args.threshold)
+        print()
+        print(comparison.to_string(index=False))
+
+        if comparison['regression'].any():
+            print("regression in:", ", ".join(comparison[comparison['regression']]['stage']))
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
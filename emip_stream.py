@@ -0,0 +1,553 @@
+"""
+Live gaze ingest for the EMIP Toolkit (EMTK)
+
+Accepts gaze samples over local TCP or UDP sockets, finds fixations as the samples arrive with OnlineIDT,
+hit tests each fixation against the AOIs of the trial image and publishes it to subscribers. The replay
+command streams a recorded tsv or asc file at real-time or accelerated rate, standing in for a running tracker.
+
+Each line of the protocol is tab separated and starts with the stream, usually the participant id:
+    <stream>    MSG    <image>                     starts a new trial on the image
+    <stream>    SMP    <timestamp>    <x>    <y>   a gaze sample
+A TCP connection can carry any number of streams, a UDP datagram holds whole lines.
+
+Usage:
+    python emip_stream.py serve --tcp 7000 --udp 7001 --image-path emip_dataset/stimuli/
+    python emip_stream.py replay emip_dataset/rawdata/1_rawdata.tsv --port 7000 --speed 10
+    python emip_stream.py serve --tcp 7000 --eye-tracker EyeLink1000 --image-path datasets/AlMadi2018/stimuli/
+
+"""
+
+import argparse
+import asyncio
+import math
+import sys
+import time
+
+import emip_toolkit as tk
+
+
+class Stream:
+    """Trial and classifier state of one gaze stream"""
+
+    def __init__(self, stream_id):
+        self.stream_id = stream_id
+        self.trial_id = -1
+        self.image = None
+        self.classifier = None
+        self.index = None
+
+
+class GazeIngest:
+    """Classifies gaze streams into fixations and publishes them with their AOI hits.
+
+        Subscribers get (Fixation, image, AOI names) tuples from bounded queues. A full queue holds
+        TCP connections back until the subscriber catches up, so senders are slowed down by TCP flow
+        control instead of filling memory. UDP has no flow control, results that do not fit in a full
+        queue are dropped and counted in dropped.
+    """
+
+    def __init__(self, aois=None, image_path=None, level="sub-line", minimum_duration=50, sample_duration=None,
+                 maximum_dispersion=25, radius=25, eye_tracker="SMIRed250"):
+        """Initializes the ingest with no streams or subscribers
+
+        Parameters
+        ----------
+        aois : dict, optional
+            AOI tables of the stimuli by image name, e.g. from find_aoi or add_tokens_to_AOIs
+
+        image_path : str, optional
+            path of the stimuli, AOIs of images missing from aois are found with aoi_cache and moved to
+            where the eye tracker shows the stimulus, see stimulus_location
+
+        level : str, optional
+            level of the AOIs found in image_path, see find_aoi
+
+        minimum_duration, sample_duration, maximum_dispersion : int, optional
+            I-DT classifier parameters, see idt_classifier. The sample duration is 1 millisecond for
+            EyeLink1000 and 4 milliseconds for SMIRed250 by default
+
+        radius : int, optional
+            radius around AOI to consider fixations in it within the AOI
+
+        eye_tracker : str, optional
+            "SMIRed250" or "EyeLink1000", the eye tracker sending the samples
+        """
+
+        if sample_duration is None:
+            sample_duration = 1 if eye_tracker == "EyeLink1000" else 4
+
+        self.aois = dict(aois or {})
+        self.image_path = image_path
+        self.level = level
+        self.minimum_duration = minimum_duration
+        self.sample_duration = sample_duration
+        self.maximum_dispersion = maximum_dispersion
+        self.radius = radius
+        self.eye_tracker = eye_tracker
+
+        self.streams = {}
+        self.indexes = {}
+        self.subscribers = []
+
+        self.samples = 0
+        self.fixations = 0
+        self.dropped = 0
+        self.malformed = 0
+
+    def subscribe(self, maxsize=1024):
+        """Adds a subscriber
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            number of results the subscriber can fall behind before it holds the streams back
+
+        Returns
+        -------
+        asyncio.Queue
+            queue of (Fixation, image, AOI names) tuples
+        """
+
+        queue = asyncio.Queue(maxsize)
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        """Removes a subscriber
+
+        Parameters
+        ----------
+        queue : asyncio.Queue
+            queue returned by subscribe
+        """
+
+        self.subscribers.remove(queue)
+
+    def feed(self, lines):
+        """Processes protocol lines
+
+        Parameters
+        ----------
+        lines : list
+            lines as bytes, without line ends
+
+        Returns
+        -------
+        list
+            (Fixation, image, AOI names) of the fixations closed by these lines, malformed lines are
+            skipped and counted in malformed
+        """
+
+        results = []
+        streams = self.streams
+
+        with tk.instrumentation.stage("ingest") as stage:
+            for line in lines:
+                token = line.split(b'\t')
+
+                if len(token) < 3:
+                    continue
+
+                stream = streams.get(token[0])
+                if stream is None:
+                    stream = streams[token[0]] = Stream(token[0])
+
+                if token[1] == b"SMP":
+                    if len(token) < 5:
+                        self.malformed += 1
+                        continue
+
+                    try:
+                        timestamp, x_cord, y_cord = int(token[2]), float(token[3]), float(token[4])
+                    except ValueError:
+                        self.malformed += 1
+                        continue
+
+                    stage.items += 1
+
+                    if stream.classifier is None:
+                        continue
+
+                    # Samples lost in blinks are not gaze positions
+                    if not (math.isfinite(x_cord) and math.isfinite(y_cord)):
+                        continue
+
+                    fixation = stream.classifier.push(timestamp, x_cord, y_cord)
+                    if fixation is not None:
+                        results.append(self.__hit(stream, fixation))
+
+                elif token[1] == b"MSG":
+                    try:
+                        image = token[2].decode()
+                    except UnicodeDecodeError:
+                        self.malformed += 1
+                        continue
+
+                    self.__start_trial(stream, image)
+
+        self.samples += stage.items
+        self.fixations += len(results)
+
+        return results
+
+    async def publish(self, results):
+        """Puts results in the subscriber queues, waiting for room in full queues
+
+        Parameters
+        ----------
+        results : list
+            results of feed
+        """
+
+        for queue in self.subscribers:
+            for result in results:
+                await queue.put(result)
+
+    def publish_nowait(self, results):
+        """Puts results in the subscriber queues, dropping those that do not fit
+
+        Parameters
+        ----------
+        results : list
+            results of feed
+        """
+
+        for queue in self.subscribers:
+            for result in results:
+                if queue.full():
+                    self.dropped += 1
+                else:
+                    queue.put_nowait(result)
+
+    async def handle_tcp(self, reader, writer):
+        """Reads the lines of a TCP connection until it is closed
+
+        Parameters
+        ----------
+        reader : asyncio.StreamReader
+            connection reader
+
+        writer : asyncio.StreamWriter
+            connection writer, nothing is sent back
+        """
+
+        partial = b""
+
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+
+                lines = (partial + data).split(b'\n')
+                partial = lines.pop()
+
+                await self.publish(self.feed(lines))
+
+            if partial:
+                await self.publish(self.feed([partial]))
+        finally:
+            writer.close()
+
+    async def serve_tcp(self, host="127.0.0.1", port=7000):
+        """Accepts TCP connections
+
+        Parameters
+        ----------
+        host : str, optional
+            address to listen on
+
+        port : int, optional
+            port to listen on, 0 for any free port
+
+        Returns
+        -------
+        asyncio.Server
+            the server
+        """
+
+        return await asyncio.start_server(self.handle_tcp, host, port)
+
+    async def serve_udp(self, host="127.0.0.1", port=7001):
+        """Receives UDP datagrams
+
+        Parameters
+        ----------
+        host : str, optional
+            address to listen on
+
+        port : int, optional
+            port to listen on, 0 for any free port
+
+        Returns
+        -------
+        asyncio.DatagramTransport
+            the transport, closing it stops receiving
+        """
+
+        ingest = self
+
+        class Protocol(asyncio.DatagramProtocol):
+            def datagram_received(self, data, address):
+                ingest.publish_nowait(ingest.feed(data.rstrip(b'\n').split(b'\n')))
+
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(Protocol, local_addr=(host, port))
+
+        return transport
+
+    def aoi_index(self, image):
+        """Returns the hit test index of an image, built once per image
+
+        Parameters
+        ----------
+        image : str
+            image name
+
+        Returns
+        -------
+        AOIIndex
+            the index, or None if the image has no AOIs
+        """
+
+        if image not in self.indexes:
+            aois = self.aois.get(image)
+
+            if aois is None and self.image_path is not None:
+                try:
+                    aois = tk.aoi_cache.find_aoi(image, self.image_path, level=self.level)
+                except (FileNotFoundError, OSError):
+                    tk.logger.warning("no stimulus for image: %s", image)
+                else:
+                    x, y = tk.stimulus_location(self.eye_tracker)
+                    aois['x'] += x
+                    aois['y'] += y
+                    self.aois[image] = aois
+
+            self.indexes[image] = None if aois is None else tk.AOIIndex(aois, self.radius)
+
+        return self.indexes[image]
+
+    def __start_trial(self, stream, image):
+        """Private method that starts a new trial of a stream"""
+
+        stream.trial_id += 1
+        stream.image = image
+        stream.classifier = tk.OnlineIDT(self.minimum_duration, self.sample_duration, self.maximum_dispersion,
+                                         stream.trial_id, stream.stream_id.decode(errors='replace'))
+        stream.index = self.aoi_index(image)
+
+    def __hit(self, stream, fixation):
+        """Private method that hit tests a fixation against the AOIs of its trial"""
+
+        if stream.index is None:
+            return fixation, stream.image, []
+
+        _, aois = stream.index.query([fixation.x_cord], [fixation.y_cord])
+
+        return fixation, stream.image, stream.index.aois['name'].iloc[aois].tolist()
+
+
+def replay_lines(experiment, stream_id=None):
+    """Private generator of the protocol lines of a recorded experiment
+
+    Parameters
+    ----------
+    experiment : Experiment
+        recorded experiment with samples, e.g. from read_SMIRed250
+
+    stream_id : str, optional
+        stream of the lines, the participant id by default
+
+    Yields
+    ------
+    tuple
+        timestamp of the line, or None for messages, and the line
+    """
+
+    for trial in experiment.trial:
+        prefix = (stream_id or str(trial.participant_id)).encode() + b'\t'
+
+        yield None, prefix + b"MSG\t" + trial.image.encode() + b'\n'
+
+        samples = trial.samples
+        for timestamp, x_cord, y_cord in zip(samples['timestamp'].tolist(), samples['x_cord'].tolist(),
+                                             samples['y_cord'].tolist()):
+            yield timestamp, prefix + b"SMP\t%d\t%r\t%r\n" % (timestamp, x_cord, y_cord)
+
+
+async def replay(filename, host="127.0.0.1", port=7000, protocol="tcp", speed=1.0, stream_id=None,
+                 vcl_index=None, interval=0.01):
+    """Streams a recorded file to an ingest, pacing the samples by their timestamps
+
+    Parameters
+    ----------
+    filename : str
+        tsv file of SMI Red 250 or asc file of Eye Link 1000
+
+    host, port : optional
+        address of the ingest
+
+    protocol : str, optional
+        "tcp" or "udp"
+
+    speed : float, optional
+        replay rate, 1 is real-time, 0 sends as fast as the ingest reads
+
+    stream_id : str, optional
+        stream of the lines, the participant id by default
+
+    vcl_index : VCLIndex or str, optional
+        index of the trial images of asc files, see read_EyeLink1000
+
+    interval : float, optional
+        seconds between sends, samples due in an interval are sent together
+
+    Returns
+    -------
+    int
+        number of samples sent
+    """
+
+    if filename.endswith(".asc"):
+        experiment = tk.read_EyeLink1000(filename, "asc", vcl_index=vcl_index)
+        seconds_per_tick = 1e-3
+    else:
+        experiment = tk.read_SMIRed250(filename, "tsv")
+        seconds_per_tick = 1e-6
+
+    loop = asyncio.get_running_loop()
+
+    if protocol == "udp":
+        transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=(host, port))
+        writer = None
+    else:
+        _, writer = await asyncio.open_connection(host, port)
+
+    async def send(batch):
+        if writer is not None:
+            writer.write(b"".join(batch))
+            await writer.drain()
+            return
+
+        # Whole lines per datagram, small enough not to be fragmented
+        datagram, size = [], 0
+        for line in batch:
+            if size + len(line) > 1400 and datagram:
+                transport.sendto(b"".join(datagram))
+                datagram, size = [], 0
+            datagram.append(line)
+            size += len(line)
+        if datagram:
+            transport.sendto(b"".join(datagram))
+
+        # Lets the receiver keep up on loopback
+        await asyncio.sleep(0)
+
+    count = 0
+    batch = []
+    first = None
+    start = time.perf_counter()
+
+    try:
+        for timestamp, line in replay_lines(experiment, stream_id):
+            if timestamp is not None:
+                count += 1
+
+                if first is None:
+                    first = timestamp
+
+                if speed > 0:
+                    due = (timestamp - first) * seconds_per_tick / speed - (time.perf_counter() - start)
+
+                    if due > interval:
+                        await send(batch)
+                        batch = []
+                        await asyncio.sleep(due)
+
+            batch.append(line)
+
+            if len(batch) >= 1024:
+                await send(batch)
+                batch = []
+
+        await send(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+            await writer.wait_closed()
+        else:
+            transport.close()
+
+    return count
+
+
+async def serve(args):
+    """Private coroutine behind the serve command, prints each fixation as a tab separated line"""
+
+    ingest = GazeIngest(image_path=args.image_path, level=args.level, minimum_duration=args.minimum_duration,
+                        sample_duration=args.sample_duration, maximum_dispersion=args.maximum_dispersion,
+                        radius=args.radius, eye_tracker=args.eye_tracker)
+    queue = ingest.subscribe(args.queue_size)
+
+    servers = []
+    if args.tcp is not None:
+        servers.append(await ingest.serve_tcp(args.host, args.tcp))
+    if args.udp is not None:
+        servers.append(await ingest.serve_udp(args.host, args.udp))
+
+    try:
+        while True:
+            fixation, image, names = await queue.get()
+            print(fixation.participant_id, fixation.trial_id, image, fixation.timestamp, fixation.duration,
+                  fixation.x_cord, fixation.y_cord, ",".join(names), sep="\t", flush=True)
+    finally:
+        for server in servers:
+            server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Live gaze ingest for the EMIP Toolkit")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="receive gaze samples and print fixations")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--tcp", type=int, help="TCP port to listen on")
+    serve_parser.add_argument("--udp", type=int, help="UDP port to listen on")
+    serve_parser.add_argument("--image-path", help="path of the stimuli, fixations are hit tested against their AOIs")
+    serve_parser.add_argument("--level", default="sub-line", help="level of the AOIs, see find_aoi")
+    serve_parser.add_argument("--minimum-duration", type=int, default=50)
+    serve_parser.add_argument("--eye-tracker", choices=["SMIRed250", "EyeLink1000"], default="SMIRed250",
+                              help="EyeLink1000 when replaying asc files")
+    serve_parser.add_argument("--sample-duration", type=int,
+                              help="4 milliseconds for SMIRed250 and 1 millisecond for EyeLink1000 by default")
+    serve_parser.add_argument("--maximum-dispersion", type=int, default=25)
+    serve_parser.add_argument("--radius", type=int, default=25)
+    serve_parser.add_argument("--queue-size", type=int, default=1024)
+
+    replay_parser = commands.add_parser("replay", help="stream a tsv or asc file to an ingest")
+    replay_parser.add_argument("filename")
+    replay_parser.add_argument("--host", default="127.0.0.1")
+    replay_parser.add_argument("--port", type=int, default=7000)
+    replay_parser.add_argument("--protocol", choices=["tcp", "udp"], default="tcp")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="1 is real-time, 0 is as fast as possible")
+    replay_parser.add_argument("--stream", help="stream id, the participant id by default")
+    replay_parser.add_argument("--vcl-index", help="dataset root of asc files, see read_EyeLink1000")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        if args.tcp is None and args.udp is None:
+            parser.error("serve needs --tcp or --udp")
+
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+    else:
+        count = asyncio.run(replay(args.filename, args.host, args.port, args.protocol, args.speed, args.stream,
+                                   args.vcl_index))
+        print("sent", count, "samples from", args.filename, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
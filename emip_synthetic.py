@@ -0,0 +1,488 @@
+"""
+Synthetic eye tracking data for the EMIP Toolkit (EMTK)
+
+Writes raw data files in the formats the toolkit reads, with no participant data involved:
+SMI RED250 tsv files like those of the EMIP dataset, and EyeLink 1000 asc files with the
+graphics files of the AlMadi2018 dataset layout. Gaze follows a simple reading model over
+lines of code: fixations move left to right with regressions and return sweeps, saccades follow
+the main sequence, and blinks interrupt the recording.
+
+Usage:
+    python emip_synthetic.py smi out/rawdata/ --participants 216 --trials 7 --duration 60
+    python emip_synthetic.py eyelink datasets/AlMadi2018/ --participants 20 --noise 2
+
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Columns of the BeGaze export of the SMI RED250, read_SMIRed250 reads 12, 23, 24 and 27
+SMI_COLUMNS = ["Time", "Type", "Trial", "L Raw X [px]", "L Raw Y [px]", "R Raw X [px]", "R Raw Y [px]",
+               "L Dia X [px]", "L Dia Y [px]", "L Mapped Diameter [mm]", "R Dia X [px]", "R Dia Y [px]",
+               "R Mapped Diameter [mm]", "L CR1 X [px]", "L CR1 Y [px]", "L CR2 X [px]", "L CR2 Y [px]",
+               "R CR1 X [px]", "R CR1 Y [px]", "R CR2 X [px]", "R CR2 Y [px]", "L POR X [px]", "L POR Y [px]",
+               "R POR X [px]", "R POR Y [px]", "Timing", "L Validity", "R Validity", "Pupil Confidence",
+               "L Plane", "R Plane", "L EPOS X", "L EPOS Y", "L EPOS Z", "R EPOS X", "R EPOS Y", "R EPOS Z",
+               "L GVEC X", "L GVEC Y", "L GVEC Z", "R GVEC X", "R GVEC Y", "R GVEC Z", "Trigger", "Frame", "Aux1"]
+
+# Stimuli shown in each trial, in order
+EMIP_STIMULI = ["rectangle_java.jpg", "vehicle_java.jpg", "rectangle_python.jpg", "vehicle_python.jpg",
+                "rectangle_scala.jpg", "vehicle_scala.jpg", "rectangle_java2.jpg", "vehicle_java2.jpg"]
+
+# Pixels per degree of visual angle, used for saccade amplitudes and velocities
+PIXELS_PER_DEGREE = 35.0
+
+FIXATION, SACCADE, BLINK = 0, 1, 2
+
+
+def code_layout(rng, lines=20, top=150, line_height=30, left=100, width=(300, 1100)):
+    """Lines of code on a stimulus, with a random length for each line
+
+    Parameters
+    ----------
+    rng : numpy.random.Generator
+        random generator
+
+    lines : int, optional
+        number of lines
+
+    top, line_height, left : int, optional
+        y of the first line, distance between lines and x of the start of each line in pixels
+
+    width : tuple, optional
+        shortest and longest line in pixels
+
+    Returns
+    -------
+    numpy.ndarray
+        y, start x and end x of each line
+    """
+
+    return np.column_stack((top + line_height * np.arange(lines, dtype=np.float64),
+                            np.full(lines, float(left)),
+                            left + rng.uniform(*width, lines)))
+
+
+def scanpath(rng, duration, layout, blink_rate=15):
+    """Eye movement events of a reader of the code in layout, as consecutive intervals
+
+    Parameters
+    ----------
+    rng : numpy.random.Generator
+        random generator
+
+    duration : int
+        length of the recording in milliseconds
+
+    layout : numpy.ndarray
+        y, start x and end x of each line, from code_layout
+
+    blink_rate : float, optional
+        blinks per minute
+
+    Returns
+    -------
+    numpy.ndarray
+        one row per event: kind, start and duration in milliseconds, start x and y, end x and y
+    """
+
+    events = []
+    time = 0
+    line = 0
+    x, y = layout[0, 1], layout[0, 0]
+
+    while time < duration:
+        # Fixation durations are log-normal with a mean around 250 ms
+        fixation = max(int(rng.lognormal(np.log(220), 0.45)), 60)
+        events.append((FIXATION, time, fixation, x, y, x, y))
+        time += fixation
+
+        if rng.random() < blink_rate / 60000 * fixation:
+            blink = int(rng.uniform(100, 300))
+            events.append((BLINK, time, blink, x, y, x, y))
+            time += blink
+
+        # Next fixation: forward, a regression, a return sweep or a jump to another line
+        draw = rng.random()
+        if draw < 0.05:
+            line = int(rng.integers(len(layout)))
+            next_x = rng.uniform(layout[line, 1], layout[line, 2])
+        elif draw < 0.17:
+            next_x = max(x - abs(rng.normal(100, 40)), layout[line, 1])
+        else:
+            next_x = x + abs(rng.normal(70, 25))
+            if next_x > layout[line, 2]:
+                line = (line + 1) % len(layout)
+                next_x = layout[line, 1] + abs(rng.normal(10, 10))
+        next_y = layout[line, 0] + rng.normal(0, 3)
+
+        # Main sequence of saccades: duration grows linearly with amplitude
+        amplitude = np.hypot(next_x - x, next_y - y) / PIXELS_PER_DEGREE
+        saccade = max(int(21 + 2.2 * amplitude), 4)
+        events.append((SACCADE, time, saccade, x, y, next_x, next_y))
+        time += saccade
+
+        x, y = next_x, next_y
+
+    return np.array(events, dtype=np.float64)
+
+
+def gaze_samples(rng, events, sample_duration, noise=1.5, drift=0.0):
+    """Gaze samples of a scanpath
+
+    Parameters
+    ----------
+    rng : numpy.random.Generator
+        random generator
+
+    events : numpy.ndarray
+        events from scanpath
+
+    sample_duration : float
+        time between samples in milliseconds
+
+    noise : float, optional
+        standard deviation of the gaze position in pixels
+
+    drift : float, optional
+        vertical drift in pixels at the end of the recording, growing linearly from 0
+
+    Returns
+    -------
+    tuple
+        time in milliseconds, x, y and pupil size of each sample, x and y are NaN during blinks
+    """
+
+    end = events[-1, 1] + events[-1, 2]
+    times = np.arange(0, end, sample_duration)
+
+    index = np.searchsorted(events[:, 1], times, side='right') - 1
+    kind, start, length, x0, y0, x1, y1 = events[index].T
+
+    # Minimum jerk profile from the start to the end of saccades, fixations do not move
+    progress = np.clip((times - start) / length, 0, 1)
+    progress = np.where(kind == SACCADE, progress ** 3 * (10 - 15 * progress + 6 * progress ** 2), 0)
+
+    x = x0 + (x1 - x0) * progress + rng.normal(0, noise, len(times))
+    y = y0 + (y1 - y0) * progress + rng.normal(0, noise, len(times)) + drift * times / end
+    pupil = 3.5 + 0.3 * np.sin(times / 5000) + rng.normal(0, 0.05, len(times))
+
+    blink = kind == BLINK
+    x[blink], y[blink] = np.nan, np.nan
+
+    return times, x, y, pupil
+
+
+def write_smi(filename, trials=7, duration=60, noise=1.5, drift=0.0, stimuli=None, seed=None):
+    """Writes an SMI RED250 tsv file, samples are recorded at 250 Hz
+
+    Parameters
+    ----------
+    filename : str
+        name of the tsv file, read_SMIRed250 takes the participant ID from the part before the first underscore
+
+    trials : int, optional
+        number of trials
+
+    duration : float, optional
+        length of each trial in seconds
+
+    noise : float, optional
+        standard deviation of the gaze position in pixels
+
+    drift : float, optional
+        vertical drift in pixels at the end of each trial
+
+    stimuli : list, optional
+        image of each trial, EMIP_STIMULI by default
+
+    seed : int, optional
+        random seed
+
+    Returns
+    -------
+    int
+        number of samples written
+    """
+
+    rng = np.random.default_rng(seed)
+    stimuli = stimuli or EMIP_STIMULI
+
+    # Timestamps are in microseconds
+    timestamp = int(rng.integers(10 ** 9, 10 ** 10))
+    count = 0
+
+    with open(filename, 'w') as tsv_file:
+        tsv_file.write("## [BeGaze]\n")
+        tsv_file.write("## Converted from:\tsynthetic.idf\n")
+        tsv_file.write("## Sample Rate:\t250\n")
+        tsv_file.write("## Separator Type:\tMsg\n")
+        tsv_file.write("\t".join(SMI_COLUMNS) + "\n")
+
+        for trial in range(trials):
+            image = stimuli[trial % len(stimuli)]
+            tsv_file.write("%d\tMSG\t%d\t# Message: %s\n" % (timestamp, trial + 1, image))
+
+            events = scanpath(rng, duration * 1000, code_layout(rng))
+            times, x, y, pupil = gaze_samples(rng, events, 4, noise, drift)
+
+            # Blinks and random track losses are invalid samples
+            valid = ~np.isnan(x) & (rng.random(len(times)) > 0.005)
+            x, y = np.where(valid, x, 0), np.where(valid, y, 0)
+            pupil = np.where(valid, pupil, 0)
+
+            rows = []
+            for time, x_cord, y_cord, diameter, validity in zip((timestamp + times * 1000).astype(np.int64).tolist(),
+                                                                x.tolist(), y.tolist(), pupil.tolist(),
+                                                                valid.tolist()):
+                rows.append("%d\tSMP\t%d\t0.00\t0.00\t0.00\t0.00\t0.00\t0.00\t0.00\t%.2f\t%.2f\t%.2f"
+                            "\t0.00\t0.00\t0.00\t0.00\t0.00\t0.00\t0.00\t0.00\t0.00\t0.00\t%.2f\t%.2f"
+                            "\t0\t-1\t%d\t%d\t-1\t1\t0.00\t0.00\t0.00\t0.00\t0.00\t600.00"
+                            "\t0.00\t0.00\t0.00\t0.00\t0.00\t0.00\t0\t00:00:00:000\t\n"
+                            % (time, trial + 1, diameter * 10, diameter * 10, diameter, x_cord, y_cord,
+                               1 if validity else -1, 1 if validity else 0))
+            tsv_file.write("".join(rows))
+
+            count += len(times)
+            timestamp += int(times[-1] * 1000) + 4000 + int(rng.integers(2, 10)) * 10 ** 6
+
+    return count
+
+
+def write_eyelink(filename, graphics_path, trials=7, duration=60, noise=1.0, drift=0.0, stimuli=None, seed=None):
+    """Writes an EyeLink 1000 asc file with fixation, saccade and blink events and samples at 1000 Hz,
+        and a VC_<trial>.vcl graphics file for each trial
+
+    Parameters
+    ----------
+    filename : str
+        name of the asc file
+
+    graphics_path : str
+        directory of the graphics files, read_EyeLink1000 looks for them in
+        <dataset root>/runtime/dataviewer/<asc file name>/graphics/
+
+    trials : int, optional
+        number of trials
+
+    duration : float, optional
+        length of each trial in seconds
+
+    noise : float, optional
+        standard deviation of the gaze position in pixels
+
+    drift : float, optional
+        vertical drift in pixels at the end of each trial
+
+    stimuli : list, optional
+        image of each trial, EMIP_STIMULI by default
+
+    seed : int, optional
+        random seed
+
+    Returns
+    -------
+    int
+        number of samples written
+    """
+
+    rng = np.random.default_rng(seed)
+    stimuli = stimuli or EMIP_STIMULI
+
+    os.makedirs(graphics_path, exist_ok=True)
+
+    # Timestamps are in milliseconds
+    timestamp = int(rng.integers(10 ** 6, 10 ** 7))
+    count = 0
+
+    with open(filename, 'w') as asc_file:
+        asc_file.write("** CONVERTED FROM %s.edf using edfapi\n" % os.path.basename(filename).split('.')[0])
+        asc_file.write("** TYPE: EDF_FILE BINARY EVENT SAMPLE TAGGED\n")
+        asc_file.write("** RECORDED BY EMIP synthetic data\n\n")
+
+        for trial in range(trials):
+            image = stimuli[trial % len(stimuli)]
+            with open(os.path.join(graphics_path, "VC_%d.vcl" % (trial + 1)), 'w') as vcl_file:
+                vcl_file.write("VER 1.0\n")
+                vcl_file.write("0 DRAW_LIST_BITMAP 960 540 ../../runtime/images/%s 0 0\n" % image)
+
+            asc_file.write("MSG\t%d TRIALID %d\n" % (timestamp, trial))
+            asc_file.write("START\t%d \tRIGHT\tSAMPLES\tEVENTS\n" % timestamp)
+            asc_file.write("SAMPLES\tGAZE\tRIGHT\tRATE\t1000.00\tTRACKING\tCR\tFILTER\t2\n")
+            asc_file.write("EVENTS\tGAZE\tRIGHT\tRATE\t1000.00\tTRACKING\tCR\tFILTER\t2\n")
+
+            events = scanpath(rng, duration * 1000, code_layout(rng))
+            times, x, y, pupil = gaze_samples(rng, events, 1, noise, drift)
+            times = (timestamp + times).astype(np.int64)
+            pupil = pupil * 300
+
+            # Each event is written when it ends, after its samples
+            ends = np.searchsorted(times, timestamp + events[:, 1] + events[:, 2])
+            lines = []
+            first = 0
+            for event, last in zip(events, ends.tolist()):
+                for time, x_cord, y_cord, diameter in zip(times[first:last].tolist(), x[first:last].tolist(),
+                                                          y[first:last].tolist(), pupil[first:last].tolist()):
+                    if x_cord != x_cord:
+                        lines.append("%d\t   .\t   .\t    0.0\t...\n" % time)
+                    else:
+                        lines.append("%d\t %.1f\t %.1f\t %.1f\t...\n" % (time, x_cord, y_cord, diameter))
+
+                kind, start, length = int(event[0]), timestamp + int(event[1]), int(event[2])
+                end = start + length - 1
+                if kind == FIXATION:
+                    segment = slice(first, last)
+                    lines.append("EFIX R   %d\t%d\t%d\t %.1f\t %.1f\t %d\n"
+                                 % (start, end, length, np.nanmean(x[segment]) if last > first else event[3],
+                                    np.nanmean(y[segment]) if last > first else event[4],
+                                    np.nanmean(pupil[segment]) if last > first else 1000))
+                elif kind == SACCADE:
+                    amplitude = np.hypot(event[5] - event[3], event[6] - event[4]) / PIXELS_PER_DEGREE
+                    lines.append("ESACC R  %d\t%d\t%d\t %.1f\t %.1f\t %.1f\t %.1f\t %.2f\t %d\n"
+                                 % (start, end, length, event[3], event[4], event[5], event[6], amplitude,
+                                    600 * (1 - np.exp(-amplitude / 12))))
+                else:
+                    lines.append("EBLINK R %d\t%d\t%d\n" % (start, end, length))
+
+                first = last
+
+            asc_file.write("".join(lines))
+            asc_file.write("END\t%d \tSAMPLES\tEVENTS\tRES\t 38.00\t 35.00\n" % times[-1])
+
+            count += len(times)
+            timestamp = int(times[-1]) + int(rng.integers(2000, 10000))
+
+    return count
+
+
+def write_smi_dataset(path, participants=216, trials=7, duration=60, noise=1.5, drift=0.0, seed=0, workers=None):
+    """Writes an EMIP-like raw data directory of SMI RED250 files, <participant>_rawdata.tsv,
+        that EMIP_dataset reads
+
+    Parameters
+    ----------
+    path : str
+        raw data directory
+
+    participants : int, optional
+        number of participants, numbered from 1
+
+    trials, duration, noise, drift : optional
+        see write_smi
+
+    seed : int, optional
+        random seed, each participant gets its own seed derived from it
+
+    workers : int, optional
+        number of processes, files are written one at a time by default
+
+    Returns
+    -------
+    list
+        names of the files written
+    """
+
+    os.makedirs(path, exist_ok=True)
+
+    files = [os.path.join(path, "%d_rawdata.tsv" % participant) for participant in range(1, participants + 1)]
+    tasks = [(filename, trials, duration, noise, drift, None, (seed, participant))
+             for participant, filename in enumerate(files, 1)]
+
+    write_files(write_smi, tasks, workers)
+
+    return files
+
+
+def write_eyelink_dataset(root, participants=20, trials=7, duration=60, noise=1.0, drift=0.0, seed=0, workers=None):
+    """Writes an AlMadi2018-like dataset of EyeLink 1000 files, <root>/ASCII/<participant>.asc,
+        and their graphics files in <root>/runtime/dataviewer/<participant>/graphics/
+
+    Parameters
+    ----------
+    root : str
+        dataset directory
+
+    participants : int, optional
+        number of participants, numbered from 001
+
+    trials, duration, noise, drift : optional
+        see write_eyelink
+
+    seed : int, optional
+        random seed, each participant gets its own seed derived from it
+
+    workers : int, optional
+        number of processes, files are written one at a time by default
+
+    Returns
+    -------
+    list
+        names of the asc files written
+    """
+
+    os.makedirs(os.path.join(root, "ASCII"), exist_ok=True)
+
+    files, tasks = [], []
+    for participant in range(1, participants + 1):
+        name = "%03d" % participant
+        files.append(os.path.join(root, "ASCII", name + ".asc"))
+        tasks.append((files[-1], os.path.join(root, "runtime", "dataviewer", name, "graphics"), trials, duration,
+                      noise, drift, None, (seed, participant)))
+
+    write_files(write_eyelink, tasks, workers)
+
+    return files
+
+
+def write_files(writer, tasks, workers=None):
+    """Private function that calls a writer for each task, in a process pool if workers is more than one
+
+    Parameters
+    ----------
+    writer : callable
+        write_smi or write_eyelink
+
+    tasks : list
+        positional arguments of each call
+
+    workers : int, optional
+        number of processes
+
+    Returns
+    -------
+    list
+        number of samples written by each call
+    """
+
+    if workers is None or workers <= 1:
+        return [writer(*task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(writer, *zip(*tasks)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic eye tracking data")
+    parser.add_argument("format", choices=["smi", "eyelink"], help="SMI RED250 tsv or EyeLink 1000 asc files")
+    parser.add_argument("path", help="raw data directory for smi, dataset root for eyelink")
+    parser.add_argument("--participants", type=int, default=10)
+    parser.add_argument("--trials", type=int, default=7)
+    parser.add_argument("--duration", type=float, default=60, help="length of each trial in seconds")
+    parser.add_argument("--noise", type=float, default=1.5, help="standard deviation of the gaze in pixels")
+    parser.add_argument("--drift", type=float, default=0.0, help="vertical drift in pixels at the end of trials")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="number of processes writing files")
+    args = parser.parse_args(argv)
+
+    writer = write_smi_dataset if args.format == "smi" else write_eyelink_dataset
+    files = writer(args.path, args.participants, args.trials, args.duration, args.noise, args.drift, args.seed,
+                   args.workers)
+
+    print("wrote", len(files), "files to", args.path)
+
+
+if __name__ == "__main__":
+    main()
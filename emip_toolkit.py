@@ -8,9 +8,20 @@ Ricky Peng (siyuan.peng@colby.edu)
 
 """
 
+import contextlib
+import functools
+import hashlib
+import io
+import json
+import logging
 import math
 import os
-import statistics
+import pickle
+import time
+from array import array
+from collections import OrderedDict
+from collections.abc import ItemsView, Mapping, ValuesView
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
@@ -18,9 +29,167 @@ from matplotlib import pyplot as plt
 from PIL import Image, ImageDraw, ImageEnhance, ImageFont
 import requests, zipfile
 
+logger = logging.getLogger(__name__)
+
+# Version of the parsed data layout, cached experiments of other versions are parsed again
+PARSER_VERSION = 3
+
 # Dictionary for datasets Key = dataset_name, Value = [url, is_zipped, citation]
 data_dictionary = {'EMIP' : ['https://osf.io/j6vt3/download', False, 'https://dl.acm.org/doi/abs/10.1145/3448018.3457425']}
 
+# Structured array layout of fixations returned by idt_classifier_array
+FIXATION_DTYPE = np.dtype([('timestamp', 'i8'), ('duration', 'i8'), ('x_cord', 'f8'), ('y_cord', 'f8')])
+
+# Structured array layout of saccades returned by ivt_classifier, amplitude is in degrees and peak velocity in degrees/s
+SACCADE_DTYPE = np.dtype([('timestamp', 'i8'), ('duration', 'i8'), ('x_cord', 'f8'), ('y_cord', 'f8'),
+                          ('x1_cord', 'f8'), ('y1_cord', 'f8'), ('amplitude', 'f8'), ('peak_velocity', 'i8')])
+
+# Structured array layout of raw gaze samples kept in a Trial (right eye only for SMI data)
+SAMPLE_DTYPE = np.dtype([('timestamp', 'i8'), ('x_cord', 'f8'), ('y_cord', 'f8'), ('pupil', 'f8')])
+
+# Structured array layouts of the eye movement events stored in a Trial, order is the eye movement number.
+# Pupil size and peak velocity are integers as in EyeLink data
+FIXATION_EVENT_DTYPE = np.dtype([('order', 'i8'), ('timestamp', 'i8'), ('duration', 'i8'),
+                                 ('x_cord', 'f8'), ('y_cord', 'f8'), ('pupil', 'i8')])
+
+SACCADE_EVENT_DTYPE = np.dtype([('order', 'i8'), ('timestamp', 'i8'), ('duration', 'i8'),
+                                ('x_cord', 'f8'), ('y_cord', 'f8'), ('x1_cord', 'f8'), ('y1_cord', 'f8'),
+                                ('amplitude', 'f8'), ('peak_velocity', 'i8')])
+
+BLINK_EVENT_DTYPE = np.dtype([('order', 'i8'), ('timestamp', 'i8'), ('duration', 'i8')])
+
+class Stage:
+    """Duration, item count and bytes read of one run of a toolkit stage, see Instrumentation.stage"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.bytes_read = 0
+        self.seconds = 0.0
+
+
+class Instrumentation:
+    """Collects the duration, item count and bytes read of toolkit stages: parsing, I-DT, AOI detection,
+        tokens and srcML tagging, hit testing and rendering. Totals are kept per stage name, and each run
+        is also logged at DEBUG level with the stage, seconds, items and bytes_read as extra record fields.
+        Stages can be nested, e.g. idt inside parse, and runs in worker processes are not collected.
+    """
+
+    columns = ['stage', 'calls', 'seconds', 'mean_seconds', 'max_seconds', 'items', 'items_per_second',
+               'bytes_read', 'bytes_per_second']
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.totals = OrderedDict()
+
+    @contextlib.contextmanager
+    def stage(self, name, items=0, bytes_read=0):
+        """Times the code in a with block as a run of a stage
+
+        Parameters
+        ----------
+        name : str
+            name of the stage
+
+        items, bytes_read : int, optional
+            number of items processed and bytes read, they can also be added to the Stage in the block
+
+        Yields
+        ------
+        Stage
+            the run, its items and bytes_read can be updated in the block
+        """
+
+        stage = Stage(name)
+        stage.items, stage.bytes_read = items, bytes_read
+
+        if not self.enabled:
+            yield stage
+            return
+
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds = time.perf_counter() - start
+            self.record(stage)
+
+    def timed(self, name, count=None):
+        """Decorator that times each call of a function as a run of a stage
+
+        Parameters
+        ----------
+        name : str
+            name of the stage
+
+        count : callable, optional
+            number of items processed, computed from the return value of the function, one item by default
+
+        Returns
+        -------
+        callable
+            the decorator
+        """
+
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name) as stage:
+                    result = function(*args, **kwargs)
+                    stage.items = 1 if count is None else count(result)
+                return result
+
+            return wrapper
+
+        return decorator
+
+    def record(self, stage):
+        """Adds a finished run to the totals of its stage
+
+        Parameters
+        ----------
+        stage : Stage
+            the run
+        """
+
+        totals = self.totals.setdefault(stage.name, [0, 0.0, 0.0, 0, 0])
+        totals[0] += 1
+        totals[1] += stage.seconds
+        totals[2] = max(totals[2], stage.seconds)
+        totals[3] += stage.items
+        totals[4] += stage.bytes_read
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s: %.6f s, %d items, %d bytes", stage.name, stage.seconds, stage.items, stage.bytes_read,
+                         extra={'stage': stage.name, 'seconds': stage.seconds, 'items': stage.items,
+                                'bytes_read': stage.bytes_read})
+
+    def summary(self):
+        """Returns the totals of each stage
+
+        Returns
+        -------
+        pandas.DataFrame
+            calls, total, mean and longest seconds, items, bytes read and throughput of each stage
+        """
+
+        rows = []
+        for name, (calls, seconds, max_seconds, items, bytes_read) in self.totals.items():
+            rows.append([name, calls, seconds, seconds / calls, max_seconds, items,
+                         items / seconds if seconds > 0 else np.nan, bytes_read,
+                         bytes_read / seconds if seconds > 0 else np.nan])
+
+        return pd.DataFrame(rows, columns=self.columns)
+
+    def reset(self):
+        """Clears the totals of all stages"""
+        self.totals.clear()
+
+
+# Collector used by the toolkit functions
+instrumentation = Instrumentation()
+
+
 class Fixation:
     """ Basic container for storing Fixation data """
 
@@ -256,13 +425,355 @@ class Blink:
         return f"{self.trial_id} {self.participant_id} {self.timestamp} {self.duration}"
 
 
+class TableEvent:
+    """Mixin of the events built by an EventTable, attributes set on them are stored back in the table"""
+
+    def bind(self, table, index):
+        """Attaches the event to its record, attributes set before are not stored
+
+        Parameters
+        ----------
+        table : EventTable
+            table of the event
+
+        index : int
+            position of the record in the table
+        """
+
+        object.__setattr__(self, '_TableEvent__table', table)
+        object.__setattr__(self, '_TableEvent__index', index)
+
+    def __setattr__(self, name, value):
+        table = self.__dict__.get('_TableEvent__table')
+
+        if table is not None:
+            table.store(self.__index, name, value)
+
+        object.__setattr__(self, name, value)
+
+
+class TableFixation(TableEvent, Fixation):
+    """Fixation of an EventTable"""
+
+
+class TableSaccade(TableEvent, Saccade):
+    """Saccade of an EventTable"""
+
+
+class TableBlink(TableEvent, Blink):
+    """Blink of an EventTable"""
+
+
+class EventTable(Mapping):
+    """Columnar container for the fixations, saccades or blinks of a trial.
+        Events are stored in one NumPy structured array and behave like the dictionary
+        {order: event} they replace, the Fixation/Saccade/Blink objects are only built when
+        accessed, and attributes set on them (e.g. a token, or sample_offset) are stored
+        back in the table.
+
+        The offset of the trial is kept as a pending translation, it is only added to the
+        coordinates when the records are read.
+    """
+
+    event_types = {'fixation': (TableFixation, FIXATION_EVENT_DTYPE),
+                   'saccade': (TableSaccade, SACCADE_EVENT_DTYPE),
+                   'blink': (TableBlink, BLINK_EVENT_DTYPE)}
+
+    # Coordinate fields moved by the offset of each kind of event
+    offset_fields = {'fixation': (('x_cord',), ('y_cord',)),
+                     'saccade': (('x_cord', 'x1_cord'), ('y_cord', 'y1_cord')),
+                     'blink': ((), ())}
+
+    def __init__(self, kind, records, trial_id, participant_id, tokens=None):
+        """Initializes the table of one event kind
+
+        Parameters
+        ----------
+        kind : str
+            kind of the events, "fixation", "saccade" or "blink"
+
+        records : numpy.ndarray
+            structured array of FIXATION_EVENT_DTYPE, SACCADE_EVENT_DTYPE or BLINK_EVENT_DTYPE sorted by order
+
+        trial_id : int
+            trial id that the events belong to
+
+        participant_id : str
+            participant id that the events belong to
+
+        tokens : list, optional
+            source code token of each fixation, empty tokens are assumed if not given
+        """
+
+        self.kind = kind
+        self.data = np.asarray(records, dtype=self.event_types[kind][1])
+        self.trial_id = trial_id
+        self.participant_id = participant_id
+        self.tokens = tokens
+
+        self.x_offset = 0
+        self.y_offset = 0
+        self.__shifted = None
+
+    @property
+    def records(self):
+        """Structured array of the events with the pending offset applied, the offset is only
+            added once per offset value, the stored data is returned as is without an offset
+        """
+
+        if not (self.x_offset or self.y_offset):
+            return self.data
+
+        if self.__shifted is None:
+            shifted = self.data.copy()
+            x_fields, y_fields = self.offset_fields[self.kind]
+
+            for field in x_fields:
+                shifted[field] += self.x_offset
+            for field in y_fields:
+                shifted[field] += self.y_offset
+
+            self.__shifted = shifted
+
+        return self.__shifted
+
+    def store(self, index, name, value):
+        """Stores an attribute set on an event in its record, coordinates are stored without the pending offset
+
+        Parameters
+        ----------
+        index : int
+            position of the record in the table
+
+        name : str
+            attribute name
+
+        value
+            attribute value
+        """
+
+        if name in ('trial_id', 'participant_id'):
+            raise AttributeError(name + " is shared by all events of a trial, it can not be set on one event")
+
+        if name == 'token' and self.kind == 'fixation':
+            if self.tokens is None:
+                self.tokens = [""] * len(self.data)
+            self.tokens[index] = value
+
+        elif name in self.data.dtype.names and name != 'order':
+            x_fields, y_fields = self.offset_fields[self.kind]
+
+            if name in x_fields:
+                value -= self.x_offset
+            elif name in y_fields:
+                value -= self.y_offset
+
+            self.data[name][index] = value
+            self.__shifted = None
+
+    def set_offset(self, x_offset, y_offset):
+        """Sets the pending offset of the table, nothing is computed until the records are read
+
+        Parameters
+        ----------
+        x_offset : float
+            total offset in the x-axis
+
+        y_offset : float
+            total offset in the y-axis
+        """
+
+        self.x_offset = x_offset
+        self.y_offset = y_offset
+        self.__shifted = None
+
+    @classmethod
+    def from_dict(cls, kind, events, trial_id, participant_id):
+        """Builds a table from a dictionary of Fixation, Saccade or Blink objects
+
+        Parameters
+        ----------
+        kind : str
+            kind of the events, "fixation", "saccade" or "blink"
+
+        events : dict
+            dictionary that stores events as values, order of eye movement in the trial as key
+
+        trial_id : int
+            trial id that the events belong to
+
+        participant_id : str
+            participant id that the events belong to
+
+        Returns
+        -------
+        EventTable
+            a table holding the events
+        """
+
+        event_type, dtype = cls.event_types[kind]
+        orders = sorted(events.keys())
+        fields = dtype.names[1:]
+
+        records = np.array([(order, *[getattr(events[order], field) for field in fields]) for order in orders],
+                           dtype=dtype)
+
+        tokens = None
+        if kind == 'fixation' and any(events[order].token for order in orders):
+            tokens = [events[order].token for order in orders]
+
+        return cls(kind, records, trial_id, participant_id, tokens)
+
+    @classmethod
+    def from_fixations(cls, fixations, trial_id, participant_id, order=None):
+        """Builds a fixation table from the output of idt_classifier_array or ivt_classifier
+
+        Parameters
+        ----------
+        fixations : numpy.ndarray
+            structured array of FIXATION_DTYPE
+
+        trial_id : int
+            trial id that the fixations belong to
+
+        participant_id : str
+            participant id that the fixations belong to
+
+        order : numpy.ndarray, optional
+            order of each fixation among the eye movements of the trial, fixations are numbered in time order
+            by default
+
+        Returns
+        -------
+        EventTable
+            a fixation table with pupil size 0
+        """
+
+        records = np.zeros(len(fixations), dtype=FIXATION_EVENT_DTYPE)
+        records['order'] = np.arange(len(fixations)) if order is None else order
+
+        for field in FIXATION_DTYPE.names:
+            records[field] = fixations[field]
+
+        return cls('fixation', records, trial_id, participant_id)
+
+    @classmethod
+    def from_saccades(cls, saccades, trial_id, participant_id, order=None):
+        """Builds a saccade table from the output of ivt_classifier
+
+        Parameters
+        ----------
+        saccades : numpy.ndarray
+            structured array of SACCADE_DTYPE
+
+        trial_id : int
+            trial id that the saccades belong to
+
+        participant_id : str
+            participant id that the saccades belong to
+
+        order : numpy.ndarray, optional
+            order of each saccade among the eye movements of the trial, saccades are numbered in time order
+            by default
+
+        Returns
+        -------
+        EventTable
+            a saccade table
+        """
+
+        records = np.zeros(len(saccades), dtype=SACCADE_EVENT_DTYPE)
+        records['order'] = np.arange(len(saccades)) if order is None else order
+
+        for field in SACCADE_DTYPE.names:
+            records[field] = saccades[field]
+
+        return cls('saccade', records, trial_id, participant_id)
+
+    def __materialize(self, index, row):
+        """Private method that builds the event object for one record
+
+        Parameters
+        ----------
+        index : int
+            position of the record in the table
+
+        row : tuple
+            the record values, order first
+
+        Returns
+        -------
+        Fixation, Saccade or Blink
+            the event object
+        """
+
+        event_type = self.event_types[self.kind][0]
+
+        if self.kind == 'fixation':
+            _, timestamp, duration, x_cord, y_cord, pupil = row
+            token = self.tokens[index] if self.tokens is not None else ""
+            event = event_type(self.trial_id, self.participant_id, timestamp, duration, x_cord, y_cord, token, pupil)
+        else:
+            event = event_type(self.trial_id, self.participant_id, *row[1:])
+
+        event.bind(self, index)
+
+        return event
+
+    def __getitem__(self, order):
+        index = int(np.searchsorted(self.data['order'], order))
+
+        if index == len(self.data) or self.data['order'][index] != order:
+            raise KeyError(order)
+
+        return self.__materialize(index, self.records[index].tolist())
+
+    def __iter__(self):
+        return iter(self.data['order'].tolist())
+
+    def __len__(self):
+        return len(self.data)
+
+    def iter_events(self):
+        """Iterates over (order, event) pairs in order while building each event object once
+
+        Yields
+        ------
+        tuple
+            order and Fixation, Saccade or Blink object
+        """
+
+        for index, row in enumerate(self.records.tolist()):
+            yield row[0], self.__materialize(index, row)
+
+    def items(self):
+        return EventItemsView(self)
+
+    def values(self):
+        return EventValuesView(self)
+
+
+class EventItemsView(ItemsView):
+    """Items view of an EventTable that materializes each event once"""
+
+    def __iter__(self):
+        return self._mapping.iter_events()
+
+
+class EventValuesView(ValuesView):
+    """Values view of an EventTable that materializes each event once"""
+
+    def __iter__(self):
+        return (event for _, event in self._mapping.iter_events())
+
+
 class Trial:
     """Each trial consists of many samples that need to be converted to fixations.
         A trial is part of an experiment. Or each experiment consists of multiple trials.
     """
 
-    def __init__(self, trial_id: int, participant_id: str, image: str, fixations: dict, saccades: dict, blinks: dict,
-                 samples: list, eye_tracker: str):
+    def __init__(self, trial_id: int, participant_id: str, image: str, fixations, saccades, blinks,
+                 samples, eye_tracker: str):
         """Initializes attributes for storing trial data, fixations, saccades, blinks, and
         stores image name
 
@@ -277,17 +788,17 @@ class Trial:
         image : str
             image path for this trial
 
-        fixations : dict
+        fixations : dict or EventTable
             dictionary that stores fixations as values, order of eye movement in the trial as key
 
-        saccades : dict
+        saccades : dict or EventTable
             dictionary that stores saccades as values, order of eye movement in the trial as key
 
-        blinks : dict
+        blinks : dict or EventTable
             dictionary that stores blinks as values, order of eye movement in the trial as key
 
-        samples : list
-            list of raw data samples
+        samples : numpy.ndarray or list
+            raw data samples, a structured array of SAMPLE_DTYPE
 
         eye_tracker : str
             type of eye tracker
@@ -295,12 +806,25 @@ class Trial:
         self.trial_id = trial_id
         self.participant_id = participant_id
         self.image = image
+        self.raw_samples = samples
+
+        # Offsets are pending translations applied when data is read, see sample_offset
+        self.offset_history = [[0, 0]]
+        self.x_offset = 0
+        self.y_offset = 0
+        self.__shifted_samples = None
+
+        # Events are kept in columnar tables, dictionaries of objects are converted once
+        if not isinstance(fixations, EventTable):
+            fixations = EventTable.from_dict('fixation', fixations, trial_id, participant_id)
+        if not isinstance(saccades, EventTable):
+            saccades = EventTable.from_dict('saccade', saccades, trial_id, participant_id)
+        if not isinstance(blinks, EventTable):
+            blinks = EventTable.from_dict('blink', blinks, trial_id, participant_id)
+
         self.fixations = fixations
         self.saccades = saccades
         self.blinks = blinks
-        self.samples = samples
-
-        self.offset_history = [[0, 0]]
 
         self.eye_tracker = eye_tracker
 
@@ -339,8 +863,8 @@ class Trial:
 
         Returns
         -------
-        dict
-            fixations in the trial
+        EventTable
+            fixations in the trial, a dictionary-like table with order of eye movement as key
         """
         return self.fixations
 
@@ -359,8 +883,8 @@ class Trial:
 
         Returns
         -------
-        dict
-            saccades in the trial
+        EventTable
+            saccades in the trial, a dictionary-like table with order of eye movement as key
         """
         return self.saccades
 
@@ -379,8 +903,8 @@ class Trial:
 
         Returns
         -------
-        dict
-            blinks in the trial
+        EventTable
+            blinks in the trial, a dictionary-like table with order of eye movement as key
         """
         return self.blinks
 
@@ -405,12 +929,12 @@ class Trial:
         return self.get_fixation_number() + self.get_saccade_number() + self.get_blink_number()
 
     def get_samples(self):
-        """Returns the raw sample in a list
+        """Returns the raw samples of the trial
 
         Returns
         -------
-        list
-            a list of raw eye movement samples
+        numpy.ndarray or list
+            a structured array of SAMPLE_DTYPE for SMI data, a list of raw eye movement events otherwise
         """
         return self.samples
 
@@ -424,6 +948,28 @@ class Trial:
         """
         return len(self.samples)
 
+    @property
+    def samples(self):
+        """Raw samples with the pending offset applied, sample arrays are only shifted once per offset value"""
+
+        samples = self.raw_samples
+
+        if not isinstance(samples, np.ndarray) or not (self.x_offset or self.y_offset):
+            return samples
+
+        if self.__shifted_samples is None:
+            shifted = samples.copy()
+            shifted['x_cord'] += self.x_offset
+            shifted['y_cord'] += self.y_offset
+            self.__shifted_samples = shifted
+
+        return self.__shifted_samples
+
+    @samples.setter
+    def samples(self, samples):
+        self.raw_samples = samples
+        self.__shifted_samples = None
+
     def get_offset(self):
         """Returns total offset applied by adding all offsets in offset history
 
@@ -432,22 +978,20 @@ class Trial:
         tuple
             x_offset, y_offset
         """
-        return tuple(np.array(self.offset_history).sum(axis=0))
+        return self.x_offset, self.y_offset
 
     def reset_offset(self):
         """Resets and changes previously done using offset it implements UNDO feature by
             removing the all applied offset from the offset history.
         """
 
-        x_total, y_total = tuple(np.array(self.offset_history).sum(axis=0) * -1)
-
-        self.sample_offset(x_total, y_total)
-
         self.offset_history = [[0, 0]]
+        self.__set_offset(0, 0)
 
     def sample_offset(self, x_offset, y_offset):
         """Moves samples +X and +Y pixels across the viewing window to correct fixation shift or
-            other shifting problems manually
+            other shifting problems manually. The offset is recorded and only applied to the
+            fixations, saccades and samples when they are read, so trying offsets costs nothing.
 
         Parameters
         ----------
@@ -458,23 +1002,26 @@ class Trial:
             offset to be applied on all fixations in the y-axis
         """
         self.offset_history.append([x_offset, y_offset])
+        self.__set_offset(self.x_offset + x_offset, self.y_offset + y_offset)
 
-        for order in self.fixations.keys():
-            self.fixations[order].sample_offset(x_offset, y_offset)
+    def __set_offset(self, x_offset, y_offset):
+        """Private method that sets the total pending offset of the trial and its events
 
-        for order in self.saccades.keys():
-            self.saccades[order].sample_offset(x_offset, y_offset)
-
-        # go over all samples (SMPs) in trial data
-        for sample in self.samples:
+        Parameters
+        ----------
+        x_offset : float
+            total offset in the x-axis
 
-            if self.eye_tracker == "SMIRed250":
-                # Filter MSG samples if any exist, or R eye is inValid
+        y_offset : float
+            total offset in the y-axis
+        """
 
-                x_cord, y_cord = float(sample[23]), float(sample[24])
+        self.x_offset = x_offset
+        self.y_offset = y_offset
+        self.__shifted_samples = None
 
-                sample[23] = str(x_cord + x_offset)
-                sample[24] = str(y_cord + y_offset)
+        self.fixations.set_offset(x_offset, y_offset)
+        self.saccades.set_offset(x_offset, y_offset)
 
     def __draw_raw_data(self, draw):
         """Private method that draws raw sample data
@@ -485,22 +1032,21 @@ class Trial:
             a Draw object imposed on the image
         """
 
-        if self.eye_tracker == "SMIRed250":
-            for sample in self.samples:
-                # Invalid records
-                if len(sample) > 5:
-                    x_cord = float(sample[23])
-                    y_cord = float(sample[24])  # - 150
+        if not isinstance(self.samples, np.ndarray):
+            return None
 
-                dot_size = 2
+        dot_size = 2
 
-                draw.ellipse((x_cord - (dot_size / 2),
-                              y_cord - (dot_size / 2),
-                              x_cord + dot_size, y_cord + dot_size),
-                             fill=(255, 0, 0, 100))
+        # Missing EyeLink samples are NaN
+        samples = self.samples[~np.isnan(self.samples['x_cord']) & ~np.isnan(self.samples['y_cord'])]
+
+        for x_cord, y_cord in zip(samples['x_cord'].tolist(), samples['y_cord'].tolist()):
+
+            draw.ellipse((x_cord - (dot_size / 2),
+                          y_cord - (dot_size / 2),
+                          x_cord + dot_size, y_cord + dot_size),
+                         fill=(255, 0, 0, 100))
 
-        elif self.eye_tracker == "EyeLink1000":
-            return
         return None
 
     def __draw_fixation(self, draw, draw_number=False):
@@ -514,15 +1060,14 @@ class Trial:
         draw_number : bool
             whether user wants to draw the eye movement number
         """
-        for count, fixation in self.fixations.items():
-            duration = fixation.duration
-            if 5 * (duration / 100) < 5:
-                r = 3
-            else:
-                r = 5 * (duration / 100)
+        fixations = self.fixations.records
+
+        # Circle radius grows with duration, with a minimum of 3 pixels
+        radius = 5 * (fixations['duration'] / 100)
+        radius[radius < 5] = 3
 
-            x = fixation.x_cord
-            y = fixation.y_cord
+        for count, x, y, r in zip(fixations['order'].tolist(), fixations['x_cord'].tolist(),
+                                  fixations['y_cord'].tolist(), radius.tolist()):
 
             bound = (x - r, y - r, x + r, y + r)
             outline_color = (255, 255, 0, 0)
@@ -575,27 +1120,27 @@ class Trial:
         draw_number : bool
             whether user wants to draw the eye movement number
         """
-        for count, saccade in self.saccades.items():
-            x0 = saccade.x_cord
-            y0 = saccade.y_cord
-            x1 = saccade.x1_cord
-            y1 = saccade.y1_cord
+        saccades = self.saccades.records
+        font = load_font(16)
+
+        for count, x0, y0, x1, y1 in zip(saccades['order'].tolist(),
+                                         saccades['x_cord'].tolist(), saccades['y_cord'].tolist(),
+                                         saccades['x1_cord'].tolist(), saccades['y1_cord'].tolist()):
 
             bound = (x0, y0, x1, y1)
             line_color = (122, 122, 0, 255)
             penwidth = 2
             draw.line(bound, fill=line_color, width=penwidth)
 
-            font = ImageFont.truetype('Tohoma.ttf', 16)
-
             if draw_number:
                 text_bound = ((x0 + x1) / 2, (y0 + y1) / 2)
                 text_color = 'darkred'
                 draw.text(text_bound, str(count + 2), font=font, fill=text_color)
 
-    def draw_trial(self, image_path, draw_raw_data=False, draw_fixation=True, draw_saccade=False, draw_number=False,
-                   draw_aoi=None, save_image=None):
-        """Draws the trial image and raw-data/fixations over the image
+    @instrumentation.timed("render")
+    def render_trial(self, image_path, draw_raw_data=False, draw_fixation=True, draw_saccade=False,
+                     draw_number=False, draw_aoi=None):
+        """Composes the trial image and raw-data/fixations over the image with PIL only, without matplotlib.
             circle size indicates fixation duration
 
         image_path : str
@@ -616,32 +1161,19 @@ class Trial:
         draw_aoi : pandas.DataFrame, optional
             Area of Interests
 
-        save_image : str, optional
-            path to save the image, image is saved to this path if it parameter exists
+        Returns
+        -------
+        PIL.Image
+            the trial image with the overlay
         """
 
-        im = Image.open(image_path + self.image)
-
-        if self.eye_tracker == "EyeLink1000":
-
-            background_size = (1024, 768)
-            background = Image.new('RGB', background_size, color='black')
-
-            *_, width, _ = im.getbbox()
-            # offset = int((1024 - width) / 2) - 10
-            trial_location = (10, 375)
-
-            background.paste(im, trial_location, im.convert('RGBA'))
-
-            im = background.copy()
-
-
-        bg_color = find_background_color(im.copy().convert('1'))
+        stimulus, bg_color = load_stimulus(image_path + self.image, self.eye_tracker)
+        im = stimulus.copy()
 
         draw = ImageDraw.Draw(im, 'RGBA')
 
-        if draw_aoi and isinstance(draw_aoi, bool):
-            aoi = find_aoi(image=self.image, img=im)
+        if isinstance(draw_aoi, bool) and draw_aoi:
+            aoi = aoi_cache.find_aoi(image=self.image, img=im)
             self.__draw_aoi(draw, aoi, bg_color)
 
         if isinstance(draw_aoi, pd.DataFrame):
@@ -656,25 +1188,71 @@ class Trial:
         if draw_saccade:
             self.__draw_saccade(draw, draw_number)
 
-        plt.figure(figsize=(17, 15))
-        plt.imshow(np.asarray(im), interpolation='nearest')
+        return im
 
-        if save_image is not None:
-            # Save the image with applied offset
+    def draw_trial(self, image_path, draw_raw_data=False, draw_fixation=True, draw_saccade=False, draw_number=False,
+                   draw_aoi=None, save_image=None):
+        """Draws the trial image and raw-data/fixations over the image
+            circle size indicates fixation duration
 
-            image_name = save_image + \
-                         str(self.participant_id) + \
-                         "-t" + \
-                         str(self.trial_id) + \
-                         "-offsetx" + \
-                         str(self.get_offset()[0]) + \
-                         "y" + \
-                         str(self.get_offset()[1]) + \
-                         ".png"
+        image_path : str
+            path for trial image file.
+
+        draw_raw_data : bool, optional
+            whether user wants raw data drawn.
+
+        draw_fixation : bool, optional
+            whether user wants filtered fixations drawn
+
+        draw_saccade : bool, optional
+            whether user wants saccades drawn
+
+        draw_number : bool, optional
+            whether user wants to draw eye movement number
+
+        draw_aoi : pandas.DataFrame, optional
+            Area of Interests
+
+        save_image : str, optional
+            path to save the image, image is saved to this path if it parameter exists
+        """
+
+        im = self.render_trial(image_path, draw_raw_data, draw_fixation, draw_saccade, draw_number, draw_aoi)
+
+        plt.figure(figsize=(17, 15))
+        plt.imshow(np.asarray(im), interpolation='nearest')
+
+        if save_image is not None:
+            # Save the image with applied offset
+            image_name = self.get_image_name(save_image)
 
             plt.savefig(image_name)
 
-            print(image_name, "saved!")
+            logger.info("%s saved!", image_name)
+
+    def get_image_name(self, save_image):
+        """Returns the name of the saved image of the trial, with its participant, trial and offset
+
+        Parameters
+        ----------
+        save_image : str
+            path where the image is saved
+
+        Returns
+        -------
+        str
+            name of the png file
+        """
+
+        return save_image + \
+            str(self.participant_id) + \
+            "-t" + \
+            str(self.trial_id) + \
+            "-offsetx" + \
+            str(self.get_offset()[0]) + \
+            "y" + \
+            str(self.get_offset()[1]) + \
+            ".png"
 
 
 class Experiment:
@@ -754,814 +1332,3455 @@ def idt_classifier(raw_fixations, minimum_duration=50, sample_duration=4, maximu
     # Create moving window based on minimum_duration
     window_size = int(math.ceil(minimum_duration / sample_duration))
 
-    window_x = []
-    window_y = []
-
-    filter_fixation = []
-
-    # Go over all SMPs in trial data
-    for timestamp, x_cord, y_cord in raw_fixations:
-
-        # Filter (skip) coordinates outside of the screen 1920×1080 px
-        if x_cord < 0 or y_cord < 0 or x_cord > 1920 or y_cord > 1080:
-            continue
-
-        # Add sample if it appears to be valid
-        window_x.append(x_cord)
-        window_y.append(y_cord)
-
-        # Calculate dispersion = [max(x) - min(x)] + [max(y) - min(y)]
-        dispersion = (max(window_x) - min(window_x)) + (max(window_y) - min(window_y))
-
-        # If dispersion is above maximum_dispersion
-        if dispersion > maximum_dispersion:
+    with instrumentation.stage("idt", items=len(raw_fixations)):
+        return [list(fixation) for fixation in idt_windows(raw_fixations, window_size, maximum_dispersion,
+                                                           sample_duration=sample_duration)]
 
-            # Then the window does not represent a fixation
-            # Pop last item in window
-            window_x.pop()
-            window_y.pop()
 
-            # Add fixation to fixations if window is not empty (size >= window_size)
-            if len(window_x) == len(window_y) and len(window_x) > window_size:
-                # The fixation is registered at the centroid of the window points
-                filter_fixation.append(
-                    [timestamp, len(window_x) * 4, statistics.mean(window_x), statistics.mean(window_y)])
-
-            window_x = []
-            window_y = []
-
-    return filter_fixation
-
-
-def read_SMIRed250(filename, filetype, minimum_duration=50, sample_duration=4, maximum_dispersion=25):
-    """Read tsv file from SMI Red 250 eye tracker
+def idt_classifier_array(timestamps, x_cords, y_cords, minimum_duration=50, sample_duration=4,
+                         maximum_dispersion=25):
+    """Batch I-DT classifier over NumPy arrays, produces the same fixations as idt_classifier
 
     Parameters
     ----------
-    filename : str
-        name of the tsv file
+    timestamps : numpy.ndarray
+        sample time stamps
 
-    filetype : str
-        type of the file, e.g. "tsv"
+    x_cords : numpy.ndarray
+        sample x coordinates
+
+    y_cords : numpy.ndarray
+        sample y coordinates
 
     minimum_duration : int, optional
         minimum duration for a fixation in milliseconds, less than minimum is considered noise.
-        set to 50 milliseconds by default.
+        set to 50 milliseconds by default
 
     sample_duration : int, optional
-        Sample duration in milliseconds, this is 4 milliseconds based on this eye tracker.
+        Sample duration in milliseconds, this is 4 milliseconds based on this eye tracker
 
     maximum_dispersion : int, optional
         maximum distance from a group of samples to be considered a single fixation.
-        Set to 25 pixels by default.
+        Set to 25 pixels by default
 
     Returns
     -------
-    Experiment
-        an Experiment object from SMIRed250 data
+    numpy.ndarray
+        a structured array of FIXATION_DTYPE with timestamp, duration, x_cord, and y_cord fields
     """
 
-    # Read raw data file from EMIP dataset
-    tsv_file = open(filename)
-    print("parsing file:", filename)
+    timestamps = np.asarray(timestamps)
+    x_cords = np.asarray(x_cords, dtype=float)
+    y_cords = np.asarray(y_cords, dtype=float)
 
-    trials = []
+    # Filter (skip) coordinates outside of the screen 1920×1080 px in one pass
+    on_screen = (x_cords >= 0) & (y_cords >= 0) & (x_cords <= 1920) & (y_cords <= 1080)
 
-    text = tsv_file.read()
+    window_size = int(math.ceil(minimum_duration / sample_duration))
 
-    text_lines = text.split('\n')
+    samples = zip(timestamps[on_screen].tolist(), x_cords[on_screen].tolist(), y_cords[on_screen].tolist())
 
-    active = False  # Indicates whether samples are being recorded in trials
-    # The goal is to skip metadata in the file
+    with instrumentation.stage("idt", items=len(timestamps)):
+        return np.array(list(idt_windows(samples, window_size, maximum_dispersion, sample_duration=sample_duration)),
+                        dtype=FIXATION_DTYPE)
 
-    trial_id = 0
-    participant_id = filename.split('/')[-1].split('_')[0]
-    image = ""
 
-    samples = []
-    raw_fixations = []
+def idt_windows(samples, window_size, maximum_dispersion, state=None, sample_duration=4):
+    """Private generator behind the I-DT classifiers, runs in linear time over the samples.
 
-    for line in text_lines:
+        The window only grows until a sample breaks the dispersion limit, then it starts over,
+        so running minimum/maximum values replace rescanning the window. Centroids are kept as
+        exact running sums (integers scaled by a power of two) so they match statistics.mean.
+        The open window can be carried over to the next call in state, see OnlineIDT.
 
-        token = line.split("\t")
+    Parameters
+    ----------
+    samples : iterable
+        (timestamp, x_cord, y_cord) tuples
 
-        if len(token) < 3:
-            continue
+    window_size : int
+        minimum number of samples in a fixation window
 
-        if active:
-            # Filter MSG samples if any exist, or R eye is inValid
-            if token[1] == "SMP" and token[27] != "-1":
-                # Get x and y for each sample (right eye only)
-                # [23] R POR X [px]	 '0.00',
-                # [24] R POR Y [px]	 '0.00',
-                samples.append(token)
-                raw_fixations.append([int(token[0]), float(token[23]), float(token[24])])
+    maximum_dispersion : int
+        maximum distance from a group of samples to be considered a single fixation
 
-        if token[1] == "MSG" and token[3].find(".jpg") != -1:
+    state : list, optional
+        open window left by the previous call, updated when the generator is exhausted
 
-            if active:
-                filter_fixations = idt_classifier(raw_fixations=raw_fixations,
-                                                  minimum_duration=minimum_duration,
-                                                  sample_duration=sample_duration,
-                                                  maximum_dispersion=maximum_dispersion)
-                # TODO saccades
+    sample_duration : int, optional
+        sample duration in milliseconds, fixation durations are the number of samples times this
 
-                fixations = {}
-                count = 0
+    Yields
+    ------
+    tuple
+        timestamp, duration, x_cord, and y_cord of each fixation
+    """
 
-                for timestamp, duration, x_cord, y_cord in filter_fixations:
-                    fixations[count] = Fixation(trial_id=trial_id,
-                                                participant_id=participant_id,
-                                                timestamp=timestamp,
-                                                duration=duration,
-                                                x_cord=x_cord,
-                                                y_cord=y_cord,
-                                                token="",
-                                                pupil=0)
-                    count += 1
+    if state:
+        count, min_x, max_x, min_y, max_y, sum_x, sum_y, scale = state
+    else:
+        count = 0
+        min_x = max_x = min_y = max_y = 0.0
+        sum_x = sum_y = 0
+        scale = 1
 
-                trials.append(Trial(trial_id=trial_id,
-                                    participant_id=participant_id,
-                                    image=image,
-                                    fixations=fixations,
-                                    saccades={},
-                                    blinks={},
-                                    samples=samples,
-                                    eye_tracker="SMIRed250"))
+    # Go over all SMPs in trial data
+    for timestamp, x_cord, y_cord in samples:
 
-                trial_id += 1
+        # Filter (skip) coordinates outside of the screen 1920×1080 px
+        if x_cord < 0 or y_cord < 0 or x_cord > 1920 or y_cord > 1080:
+            continue
 
-            image = token[3].split(' ')[-1]  # Message: vehicle_java2.jpg
+        if count:
+            # Calculate dispersion = [max(x) - min(x)] + [max(y) - min(y)] as if the sample was added
+            new_min_x = x_cord if x_cord < min_x else min_x
+            new_max_x = x_cord if x_cord > max_x else max_x
+            new_min_y = y_cord if y_cord < min_y else min_y
+            new_max_y = y_cord if y_cord > max_y else max_y
 
-            samples = []
-            raw_fixations = []
+            # If dispersion is above maximum_dispersion the window does not represent a fixation
+            if (new_max_x - new_min_x) + (new_max_y - new_min_y) > maximum_dispersion:
 
-            active = True
+                # Add fixation to fixations if window is not empty (size >= window_size)
+                if count > window_size:
+                    # The fixation is registered at the centroid of the window points
+                    yield timestamp, count * sample_duration, sum_x / (scale * count), sum_y / (scale * count)
 
-    # Adds the last trial
-    filter_fixations = idt_classifier(raw_fixations=raw_fixations,
-                                      minimum_duration=minimum_duration,
-                                      sample_duration=sample_duration,
-                                      maximum_dispersion=maximum_dispersion)
+                # The breaking sample is dropped along with the window
+                count = 0
+                sum_x = sum_y = 0
+                scale = 1
+                continue
 
-    fixations = {}
-    count = 0
+            min_x, max_x, min_y, max_y = new_min_x, new_max_x, new_min_y, new_max_y
+        else:
+            min_x = max_x = x_cord
+            min_y = max_y = y_cord
 
-    for timestamp, duration, x_cord, y_cord in filter_fixations:
-        fixations[count] = Fixation(trial_id=trial_id,
-                                    participant_id=participant_id,
-                                    timestamp=timestamp,
-                                    duration=duration,
-                                    x_cord=x_cord,
-                                    y_cord=y_cord,
-                                    token="",
-                                    pupil=0)
-        count += 1
+        # Add sample to the exact sums, floats are integers over a power of two
+        numerator_x, denominator_x = float(x_cord).as_integer_ratio()
+        numerator_y, denominator_y = float(y_cord).as_integer_ratio()
 
-    trials.append(Trial(trial_id=trial_id,
-                        participant_id=participant_id,
-                        image=image,
-                        fixations=fixations,
-                        saccades={},
-                        blinks={},
-                        samples=samples,
-                        eye_tracker="SMIRed250"))
+        if denominator_x > scale:
+            sum_x *= denominator_x // scale
+            sum_y *= denominator_x // scale
+            scale = denominator_x
 
-    return Experiment(trial=trials, eye_tracker="SMIRed250", filetype=filetype)
+        if denominator_y > scale:
+            sum_x *= denominator_y // scale
+            sum_y *= denominator_y // scale
+            scale = denominator_y
 
+        sum_x += numerator_x * (scale // denominator_x)
+        sum_y += numerator_y * (scale // denominator_y)
+        count += 1
 
-def read_EyeLink1000(filename, filetype):
-    """Read asc file from Eye Link 1000 eye tracker
+    if state is not None:
+        state[:] = count, min_x, max_x, min_y, max_y, sum_x, sum_y, scale
+
+
+def ivt_classifier(timestamps, x_cords, y_cords, velocity_threshold=30, minimum_duration=50, sample_duration=4,
+                   pixels_per_degree=35, velocity_window=20, timestamp_unit=1e-6):
+    """I-VT classifier over NumPy arrays: samples faster than the velocity threshold are saccadic,
+        consecutive slow samples form fixations and consecutive fast samples form saccades.
+        Events never span a gap of more than one sample in the timestamps, e.g. a blink or invalid samples.
 
     Parameters
     ----------
-    filename : str
-        name of the asc file
-        
-    filetype : str
-        filetype of the file, e.g. "tsv"
-        
+    timestamps : numpy.ndarray
+        sample time stamps
+
+    x_cords : numpy.ndarray
+        sample x coordinates
+
+    y_cords : numpy.ndarray
+        sample y coordinates
+
+    velocity_threshold : float, optional
+        sample to sample velocity in degrees per second above which a sample is saccadic.
+        Set to 30 degrees per second by default
+
+    minimum_duration : int, optional
+        minimum duration for a fixation in milliseconds, shorter groups of slow samples are dropped.
+        set to 50 milliseconds by default
+
+    sample_duration : int, optional
+        Sample duration in milliseconds, this is 4 milliseconds based on this eye tracker
+
+    pixels_per_degree : float, optional
+        pixels per degree of visual angle on the stimulus screen, set to 35 by default
+
+    velocity_window : int, optional
+        the velocity of a sample is measured between the samples this many milliseconds apart around it,
+        a window of several samples keeps gaze noise from being taken for saccades. Set to 20 milliseconds by default
+
+    timestamp_unit : float, optional
+        seconds per time stamp unit, SMI Red 250 time stamps are in microseconds
+
     Returns
     -------
-    Experiment
-        an Experiment object of EyeLink1000 data
+    tuple
+        structured arrays of FIXATION_DTYPE and SACCADE_DTYPE, events start at their first sample and
+        a saccade goes from its first sample to its last sample
     """
 
-    asc_file = open(filename)
-    print("parsing file:", filename)
-    print(filename)
+    timestamps = np.asarray(timestamps)
+    x_cords = np.asarray(x_cords, dtype=float)
+    y_cords = np.asarray(y_cords, dtype=float)
+
+    # Filter (skip) coordinates outside of the screen 1920×1080 px, like the I-DT classifier
+    on_screen = (x_cords >= 0) & (y_cords >= 0) & (x_cords <= 1920) & (y_cords <= 1080)
+    timestamps, x_cords, y_cords = timestamps[on_screen], x_cords[on_screen], y_cords[on_screen]
+
+    with instrumentation.stage("ivt", items=len(on_screen)):
+        if not len(timestamps):
+            return np.empty(0, dtype=FIXATION_DTYPE), np.empty(0, dtype=SACCADE_DTYPE)
+
+        # Samples dropped by the reader or the screen filter leave gaps, the recording is cut into segments there
+        gap = np.diff(timestamps) * timestamp_unit * 1000 > 1.5 * sample_duration
+        segment_starts = np.flatnonzero(np.r_[True, gap])
+        segment_ends = np.r_[segment_starts[1:], len(timestamps)] - 1
+        segment = np.cumsum(np.r_[False, gap])
+
+        # Velocity in degrees per second between the ends of the window around each sample, cut at the segment ends
+        half_window = max(int(round(velocity_window / sample_duration / 2)), 1)
+        position = np.arange(len(timestamps))
+        before = np.maximum(position - half_window, segment_starts[segment])
+        after = np.minimum(position + half_window, segment_ends[segment])
+
+        velocity = np.zeros(len(timestamps))
+        seconds = (timestamps[after] - timestamps[before]) * timestamp_unit
+        moved = seconds > 0
+        velocity[moved] = (np.hypot(x_cords[after] - x_cords[before], y_cords[after] - y_cords[before])[moved]
+                           / pixels_per_degree / seconds[moved])
+
+        saccadic = velocity > velocity_threshold
+
+        # Run-length grouping of slow and fast samples, runs also end at gaps
+        starts = np.flatnonzero(np.r_[True, (saccadic[1:] != saccadic[:-1]) | gap])
+        counts = np.diff(np.r_[starts, len(saccadic)])
+        fast = saccadic[starts]
+
+        # Fixations are the centroids of the long enough slow runs
+        fixation = ~fast & (counts * sample_duration >= minimum_duration)
+        fixation_starts, fixation_counts = starts[fixation], counts[fixation]
+
+        fixations = np.empty(len(fixation_starts), dtype=FIXATION_DTYPE)
+        fixations['timestamp'] = timestamps[fixation_starts]
+        fixations['duration'] = fixation_counts * sample_duration
+        fixations['x_cord'] = np.add.reduceat(x_cords, starts)[fixation] / fixation_counts
+        fixations['y_cord'] = np.add.reduceat(y_cords, starts)[fixation] / fixation_counts
+
+        saccade_starts, saccade_counts = starts[fast], counts[fast]
+        first, last = saccade_starts, saccade_starts + saccade_counts - 1
+
+        saccades = np.empty(len(saccade_starts), dtype=SACCADE_DTYPE)
+        saccades['timestamp'] = timestamps[first]
+        saccades['duration'] = saccade_counts * sample_duration
+        saccades['x_cord'], saccades['y_cord'] = x_cords[first], y_cords[first]
+        saccades['x1_cord'], saccades['y1_cord'] = x_cords[last], y_cords[last]
+        saccades['amplitude'] = np.hypot(x_cords[last] - x_cords[first],
+                                         y_cords[last] - y_cords[first]) / pixels_per_degree
+        saccades['peak_velocity'] = np.rint(np.maximum.reduceat(velocity, starts)[fast])
+
+        return fixations, saccades
+
+
+class OnlineIDT:
+    """Incremental I-DT classifier for live gaze streams, samples are pushed one at a time and each
+        fixation is returned as soon as the sample that closes its window arrives. Only the running
+        values of the open window are kept, so cost and memory per sample are constant, and the
+        fixations are the same as those of idt_classifier over the same samples.
+    """
 
-    trials = []
+    def __init__(self, minimum_duration=50, sample_duration=4, maximum_dispersion=25, trial_id=None,
+                 participant_id=None):
+        """Initializes the classifier
 
-    text = asc_file.read()
-    text_lines = text.split('\n')
+        Parameters
+        ----------
+        minimum_duration : int, optional
+            minimum duration for a fixation in milliseconds, less than minimum is considered noise.
+            set to 50 milliseconds by default
 
-    trial_id = -1
-    participant_id = filename.split('.')[0]
+        sample_duration : int, optional
+            Sample duration in milliseconds, this is 4 milliseconds based on this eye tracker
 
-    samples = []
+        maximum_dispersion : int, optional
+            maximum distance from a group of samples to be considered a single fixation.
+            Set to 25 pixels by default
 
-    fixations = {}
-    saccades = {}
-    blinks = {}
+        trial_id : int, optional
+            trial id of the fixations
 
-    count = 0
+        participant_id : str, optional
+            participant id of the fixations
+        """
 
-    for line in text_lines:
+        self.window_size = int(math.ceil(minimum_duration / sample_duration))
+        self.sample_duration = sample_duration
+        self.maximum_dispersion = maximum_dispersion
+        self.trial_id = trial_id
+        self.participant_id = participant_id
+        self.state = []
 
-        token = line.split()
+    def push(self, timestamp, x_cord, y_cord):
+        """Adds a sample
 
-        if not token:
-            continue
+        Parameters
+        ----------
+        timestamp : int
+            sample time stamp
 
-        if "TRIALID" in token:
-            # List of eye events
-            if trial_id == -1:
-                trial_id = int(token[-1])
-                continue
+        x_cord, y_cord : float
+            gaze coordinates, samples outside of the screen are skipped
 
-            # Read image location
-            index = str(int(trial_id) + 1)
-            experiment = participant_id.split('/')[-1]
-            location = 'datasets/AlMadi2018/runtime/dataviewer/' + experiment + '/graphics/VC_' + index + '.vcl'
-            with open(location, 'r') as file:
-                image = file.readlines()[1].split()[-3].split('/')[-1]
-
-            # Append fixations and saccades list here
-            trials.append(Trial(trial_id=trial_id,
-                                participant_id=participant_id,
-                                image=image,
-                                fixations=fixations,
-                                saccades=saccades,
-                                blinks=blinks,
-                                samples=samples,
-                                eye_tracker="EyeLink1000"))
-
-            fixations = {}
-            saccades = {}
-            blinks = {}
-            samples = []
-            count = 0
-            trial_id = int(token[-1])
-
-        if token[0] == "EFIX":
-            timestamp = int(token[2])
-            duration = int(token[4])
-            x_cord = float(token[5])
-            y_cord = float(token[6])
-            pupil = int(token[7])
-
-            fixations[count] = Fixation(trial_id=trial_id,
-                                        participant_id=participant_id,
-                                        timestamp=timestamp,
-                                        duration=duration,
-                                        x_cord=x_cord,
-                                        y_cord=y_cord,
-                                        token="",
-                                        pupil=pupil)
-
-            samples.append('EFIX' + '    '.join(token))
-            count += 1
-
-        if token[0] == "ESACC":
-            timestamp = int(token[2])
-            duration = int(token[4])
-            x_cord = float(token[5]) if token[5] != '.' else 0.0
-            y_cord = float(token[6]) if token[6] != '.' else 0.0
-            x1_cord = float(token[7]) if token[7] != '.' else 0.0
-            y1_cord = float(token[8]) if token[8] != '.' else 0.0
-            amplitude = float(token[9])
-            peak_velocity = int(token[10])
-            saccades[count] = Saccade(trial_id=trial_id,
-                                      participant_id=participant_id,
-                                      timestamp=timestamp,
-                                      duration=duration,
-                                      x_cord=x_cord,
-                                      y_cord=y_cord,
-                                      x1_cord=x1_cord,
-                                      y1_cord=y1_cord,
-                                      amplitude=amplitude,
-                                      peak_velocity=peak_velocity)
-
-            samples.append('ESACC' + '    '.join(token))
-            count += 1
-
-        if token[0] == "EBLINK":
-            timestamp = int(token[2])
-            duration = int(token[4])
-            blinks[count] = Blink(trial_id=trial_id,
-                                  participant_id=participant_id,
-                                  timestamp=timestamp,
-                                  duration=duration)
-
-            samples.append('EBLINK' + '    '.join(token))
-            count += 1
-
-    # Read image location
-    index = str(int(trial_id) + 1)
-    experiment = participant_id.split('/')[-1]
-    location = 'datasets/AlMadi2018/runtime/dataviewer/' + experiment + '/graphics/VC_' + index + '.vcl'
-    with open(location, 'r') as file:
-        image = file.readlines()[1].split()[-3].split('/')[-1]
-
-    # Add the last trial
-    trials.append(Trial(trial_id=trial_id,
-                        participant_id=participant_id,
-                        image=image,
-                        fixations=fixations,
-                        saccades=saccades,
-                        blinks=blinks,
-                        samples=samples,
-                        eye_tracker="EyeLink1000"))
-
-    asc_file.close()
-
-    return Experiment(trial=trials, eye_tracker="EyeLink1000", filetype=filetype)
+        Returns
+        -------
+        Fixation
+            the fixation closed by this sample, or None
+        """
 
+        # The generator is run to the end so it saves the open window
+        fixations = list(idt_windows(((timestamp, x_cord, y_cord),), self.window_size, self.maximum_dispersion,
+                                     self.state, self.sample_duration))
 
-def find_background_color(img):
-    """Private function that identifies the background color of the image
+        return self.__fixation(fixations[0]) if fixations else None
 
-    Parameters
-    ----------
-    img : PIL.Image
-        a PIL (pillow fork) Image object
+    def extend(self, samples):
+        """Adds samples
 
-    Returns
-    -------
-    str
-        the color of the background of the image
-    """
+        Parameters
+        ----------
+        samples : iterable
+            (timestamp, x_cord, y_cord) tuples
 
-    img = img.convert('1')
-    width, height = img.size
+        Returns
+        -------
+        list
+            the fixations closed by these samples
+        """
 
-    color_result = []
-    box_size = min(width, height) // 20
+        return [self.__fixation(fixation)
+                for fixation in idt_windows(samples, self.window_size, self.maximum_dispersion, self.state,
+                                            self.sample_duration)]
 
-    # Move a tiny rectangle box to obtain most common color
-    for x, y in zip(range(0, width, box_size), range(0, height, box_size)):
-        box = (x, y, x + box_size, y + box_size)
-        minimum, maximum = img.crop(box).getextrema()
-        color_result.append(minimum)
-        color_result.append(maximum)
+    def flush(self):
+        """Ends the stream and starts over, e.g. at the end of a trial. Like idt_classifier, the open
+            window is dropped since no sample closed it, every fixation was already returned by push.
+        """
 
-    # Analyze and determine the background color
-    if color_result.count(255) > color_result.count(0):
-        bg_color = 'white'
-    else:
-        bg_color = 'black'
+        self.state = []
 
-    return bg_color
+    def __fixation(self, fixation):
+        """Private method that builds a Fixation from a window of idt_windows"""
+        timestamp, duration, x_cord, y_cord = fixation
+        return Fixation(self.trial_id, self.participant_id, timestamp, duration, x_cord, y_cord, "", 0)
 
 
-def find_aoi(image=None, image_path=None, img=None, level="sub-line", margin_height=4, margin_width=7):
-    """Find Area of Interest in the given image and store the aoi attributes in a Pandas Dataframe
+def read_SMIRed250(filename, filetype, minimum_duration=50, sample_duration=4, maximum_dispersion=25, cache=None,
+                   classifier="idt", velocity_threshold=30, pixels_per_degree=35):
+    """Read tsv file from SMI Red 250 eye tracker
 
     Parameters
     ----------
-    image : str
-        filename for the image, e.g. "vehicle_java.jpg"
+    filename : str
+        name of the tsv file
 
-    image_path : str
-        path for all images, e.g. "emip_dataset/stimuli/"
+    filetype : str
+        type of the file, e.g. "tsv"
 
-    img : PIL.Image, optional
-        PIL.Image object if user chooses to input an PIL image object
+    minimum_duration : int, optional
+        minimum duration for a fixation in milliseconds, less than minimum is considered noise.
+        set to 50 milliseconds by default.
 
-    level : str, optional
-        level of detection in AOIs, "line" for each line as an AOI or "sub-line" for each token as an AOI
+    sample_duration : int, optional
+        Sample duration in milliseconds, this is 4 milliseconds based on this eye tracker.
 
-    margin_height : int, optional
-        marginal height when finding AOIs, use smaller number for tight text layout
+    maximum_dispersion : int, optional
+        maximum distance from a group of samples to be considered a single fixation.
+        Set to 25 pixels by default.
 
-    margin_width : int, optional
-        marginal width when finding AOIs, use smaller number for tight text layout
+    cache : ExperimentCache or str, optional
+        parse cache or its directory, the file is parsed again only if it or the parameters changed
+
+    classifier : str, optional
+        "idt" finds fixations with idt_classifier_array, "ivt" finds fixations and saccades with ivt_classifier
+
+    velocity_threshold : float, optional
+        saccade velocity threshold of the I-VT classifier in degrees per second
+
+    pixels_per_degree : float, optional
+        pixels per degree of visual angle of the I-VT classifier
 
     Returns
     -------
-    pandas.DataFrame
-        a pandas DataFrame of area of interest detected by the method
+    Experiment
+        an Experiment object from SMIRed250 data
     """
 
-    if img is None:
-        if image is None or image_path is None:
-            return
-        img = Image.open(image_path + image).convert('1')
-    else:
-        img = img.convert('1')
+    if cache is not None:
+        if not isinstance(cache, ExperimentCache):
+            cache = ExperimentCache(cache)
 
-    width, height = img.size
+        key = cache.key(filename, "read_SMIRed250", filetype=filetype, minimum_duration=minimum_duration,
+                        sample_duration=sample_duration, maximum_dispersion=maximum_dispersion, classifier=classifier,
+                        velocity_threshold=velocity_threshold, pixels_per_degree=pixels_per_degree)
+        experiment = cache.load(filename, key)
 
-    # Detect the background color
-    bg_color = find_background_color(img)
+        if experiment is not None:
+            return experiment
 
-    left, right = 0, width
+    with instrumentation.stage("parse", bytes_read=os.path.getsize(filename)) as stage:
+        trials = list(iter_SMIRed250(filename,
+                                     minimum_duration=minimum_duration,
+                                     sample_duration=sample_duration,
+                                     maximum_dispersion=maximum_dispersion,
+                                     classifier=classifier,
+                                     velocity_threshold=velocity_threshold,
+                                     pixels_per_degree=pixels_per_degree))
+        stage.items = sum(trial.get_sample_number() for trial in trials)
 
-    vertical_result, upper_bounds, lower_bounds = [], [], []
+    experiment = Experiment(trial=trials, eye_tracker="SMIRed250", filetype=filetype)
 
-    # Move the detecting rectangle from the top to the bottom of the image
-    for upper in range(height - margin_height):
+    if cache is not None:
+        cache.store(filename, key, experiment)
 
-        lower = upper + margin_height
+    return experiment
 
-        box = (left, upper, right, lower)
-        minimum, maximum = img.crop(box).getextrema()
 
-        if upper > 1:
-            if bg_color == 'black':
-                if vertical_result[-1][3] == 0 and maximum == 255:
-                    # Rectangle detects white color for the first time in a while -> Start of one line
-                    upper_bounds.append(upper)
-                if vertical_result[-1][3] == 255 and maximum == 0:
-                    # Rectangle detects black color for the first time in a while -> End of one line
-                    lower_bounds.append(lower)
-            elif bg_color == 'white':
-                if vertical_result[-1][2] == 255 and minimum == 0:
-                    # Rectangle detects black color for the first time in a while -> Start of one line
-                    upper_bounds.append(upper)
-                if vertical_result[-1][2] == 0 and minimum == 255:
-                    # Rectangle detects white color for the first time in a while -> End of one line
-                    lower_bounds.append(lower)
-
-        # Storing all detection result
-        vertical_result.append([upper, lower, minimum, maximum])
+def iter_SMIRed250(filename, minimum_duration=50, sample_duration=4, maximum_dispersion=25, classifier="idt",
+                   velocity_threshold=30, pixels_per_degree=35):
+    """Stream trials from a tsv file of SMI Red 250 eye tracker, the file is read line by line
+        and each Trial is yielded as soon as the next .jpg message closes it
 
-    final_result = []
+    Parameters
+    ----------
+    filename : str
+        name of the tsv file
 
-    line_count = 1
+    minimum_duration : int, optional
+        minimum duration for a fixation in milliseconds, less than minimum is considered noise.
+        set to 50 milliseconds by default.
 
-    # Iterate through each line of code from detection
-    for upper_bound, lower_bound in list(zip(upper_bounds, lower_bounds)):
-
-        # Reset all temporary result for the next line
-        horizontal_result, left_bounds, right_bounds = [], [], []
-
-        # Move the detecting rectangle from the left to the right of the image
-        for left in range(width - margin_width):
-
-            right = left + margin_width
-
-            box = (left, upper_bound, right, lower_bound)
-            minimum, maximum = img.crop(box).getextrema()
-
-            if left > 1:
-                if bg_color == 'black':
-                    if horizontal_result[-1][3] == 0 and maximum == 255:
-                        # Rectangle detects black color for the first time in a while -> Start of one word
-                        left_bounds.append(left)
-                    if horizontal_result[-1][3] == 255 and maximum == 0:
-                        # Rectangle detects white color for the first time in a while -> End of one word
-                        right_bounds.append(right)
-                elif bg_color == 'white':
-                    if horizontal_result[-1][2] == 255 and minimum == 0:
-                        # Rectangle detects black color for the first time in a while -> Start of one word
-                        left_bounds.append(left)
-                    if horizontal_result[-1][2] == 0 and minimum == 255:
-                        # Rectangle detects white color for the first time in a while -> End of one word
-                        right_bounds.append(right)
-
-            # Storing all detection result
-            horizontal_result.append([left, right, minimum, maximum])
+    sample_duration : int, optional
+        Sample duration in milliseconds, this is 4 milliseconds based on this eye tracker.
 
-        if level == 'sub-line':
+    maximum_dispersion : int, optional
+        maximum distance from a group of samples to be considered a single fixation.
+        Set to 25 pixels by default.
 
-            part_count = 1
+    classifier : str, optional
+        "idt" or "ivt", see read_SMIRed250
 
-            for left, right in list(zip(left_bounds, right_bounds)):
-                final_result.append(
-                    ['sub-line', f'line {line_count} part {part_count}', left, upper_bound, right, lower_bound])
-                part_count += 1
+    velocity_threshold, pixels_per_degree : float, optional
+        I-VT classifier parameters, see ivt_classifier
 
-        elif level == 'line':
-            final_result.append(
-                ['line', f'line {line_count}', left_bounds[0], upper_bound, right_bounds[-1], lower_bound])
+    Yields
+    ------
+    Trial
+        a Trial object from SMIRed250 data, samples only keep timestamp, x, y and pupil
+    """
 
-        line_count += 1
+    logger.info("parsing file: %s", filename)
 
-    # Format pandas dataframe
-    columns = ['kind', 'name', 'x', 'y', 'width', 'height', 'image']
-    aoi = pd.DataFrame(columns=columns)
+    active = False  # Indicates whether samples are being recorded in trials
+    # The goal is to skip metadata in the file
+
+    trial_id = 0
+    participant_id = filename.split('/')[-1].split('_')[0]
+    image = ""
 
-    for entry in final_result:
-        kind, name, x, y, x0, y0 = entry
-        width = x0 - x
-        height = y0 - y
-        image = image
+    # Numeric columns of the current trial, the rest of each line is dropped
+    timestamps, x_cords, y_cords, pupils = array('q'), array('d'), array('d'), array('d')
 
-        # For better visualization
-        x += margin_width / 2
-        width -= margin_width
+    with open(filename) as tsv_file:
+        for line in tsv_file:
 
-        value = [kind, name, x, y, width, height, image]
-        dic = dict(zip(columns, value))
+            token = line.rstrip('\n').split("\t")
 
-        aoi = aoi.append(dic, ignore_index=True)
+            if len(token) < 3:
+                continue
 
-    return aoi
+            if active:
+                # Filter MSG samples if any exist, or R eye is inValid
+                if token[1] == "SMP" and token[27] != "-1":
+                    # Get x and y for each sample (right eye only)
+                    # [12] R Mapped Diameter [mm]
+                    # [23] R POR X [px]	 '0.00',
+                    # [24] R POR Y [px]	 '0.00',
+                    timestamps.append(int(token[0]))
+                    x_cords.append(float(token[23]))
+                    y_cords.append(float(token[24]))
+                    pupils.append(float(token[12]))
 
+            if token[1] == "MSG" and token[3].find(".jpg") != -1:
 
-def draw_aoi(aoi, image, image_path):
-    """Draws AOI rectangles on to an image.
+                if active:
+                    yield SMIRed250_trial(trial_id, participant_id, image, timestamps, x_cords, y_cords, pupils,
+                                          minimum_duration, sample_duration, maximum_dispersion, classifier,
+                                          velocity_threshold, pixels_per_degree)
+
+                    trial_id += 1
+
+                image = token[3].split(' ')[-1]  # Message: vehicle_java2.jpg
+
+                timestamps, x_cords, y_cords, pupils = array('q'), array('d'), array('d'), array('d')
+
+                active = True
+
+    # Adds the last trial
+    yield SMIRed250_trial(trial_id, participant_id, image, timestamps, x_cords, y_cords, pupils,
+                          minimum_duration, sample_duration, maximum_dispersion, classifier, velocity_threshold,
+                          pixels_per_degree)
+
+
+def SMIRed250_trial(trial_id, participant_id, image, timestamps, x_cords, y_cords, pupils,
+                    minimum_duration, sample_duration, maximum_dispersion, classifier="idt", velocity_threshold=30,
+                    pixels_per_degree=35):
+    """Private function that builds a Trial from the numeric sample columns of SMI Red 250 data
 
     Parameters
     ----------
-    aoi : pandas.DataFrame
-        a pandas DataFrame containing rectangle attributes representing areas of interest (AOIs)
+    trial_id : int
+        id of the trial
+
+    participant_id : str
+        id of the participant
 
     image : str
-        filename for the image where AOI rectangles will be imposed, e.g. "vehicle_java.jpg"
+        image name of the trial
+
+    timestamps, x_cords, y_cords, pupils : array.array
+        sample columns of the trial
+
+    minimum_duration, sample_duration, maximum_dispersion : int
+        I-DT classifier parameters, see idt_classifier
+
+    classifier : str, optional
+        "idt" or "ivt", see read_SMIRed250
+
+    velocity_threshold, pixels_per_degree : float, optional
+        I-VT classifier parameters, see ivt_classifier
+
+    Returns
+    -------
+    Trial
+        a Trial object from SMIRed250 data
+    """
+
+    samples = sample_array(timestamps, x_cords, y_cords, pupils)
+
+    if classifier == "ivt":
+        filter_fixations, filter_saccades = ivt_classifier(samples['timestamp'], samples['x_cord'], samples['y_cord'],
+                                                           velocity_threshold=velocity_threshold,
+                                                           minimum_duration=minimum_duration,
+                                                           sample_duration=sample_duration,
+                                                           pixels_per_degree=pixels_per_degree)
+
+        # Fixations and saccades are numbered together in time order, a fixation comes before a saccade that
+        # starts on its last sample
+        timestamps = np.concatenate([filter_fixations['timestamp'], filter_saccades['timestamp']])
+        order = np.argsort(np.argsort(timestamps, kind='stable'), kind='stable')
+        fixations = EventTable.from_fixations(filter_fixations, trial_id, participant_id,
+                                              order[:len(filter_fixations)])
+        saccades = EventTable.from_saccades(filter_saccades, trial_id, participant_id, order[len(filter_fixations):])
+
+    elif classifier == "idt":
+        filter_fixations = idt_classifier_array(samples['timestamp'], samples['x_cord'], samples['y_cord'],
+                                                minimum_duration=minimum_duration,
+                                                sample_duration=sample_duration,
+                                                maximum_dispersion=maximum_dispersion)
+
+        fixations = EventTable.from_fixations(filter_fixations, trial_id, participant_id)
+        saccades = {}
+
+    else:
+        raise ValueError("unknown fixation classifier: " + str(classifier))
+
+    return Trial(trial_id=trial_id,
+                 participant_id=participant_id,
+                 image=image,
+                 fixations=fixations,
+                 saccades=saccades,
+                 blinks={},
+                 samples=samples,
+                 eye_tracker="SMIRed250")
+
+
+class SMIRed250Follower:
+    """Follows a tsv file of SMI Red 250 eye tracker while it is being recorded. The file is kept open
+        and each poll only parses the lines appended since the previous one: samples are added to the
+        current Trial, a new Trial starts at each .jpg message and fixations are found with OnlineIDT
+        as the samples arrive, so they are the same as those of read_SMIRed250 on the finished file.
+    """
+
+    def __init__(self, filename, minimum_duration=50, sample_duration=4, maximum_dispersion=25, callback=None):
+        """Opens the file, it is read by poll and follow
+
+        Parameters
+        ----------
+        filename : str
+            name of the tsv file
+
+        minimum_duration, sample_duration, maximum_dispersion : int, optional
+            I-DT classifier parameters, see idt_classifier
+
+        callback : callable, optional
+            called with each new Fixation and its Trial once the Trial is updated
+        """
+
+        self.filename = filename
+        self.minimum_duration = minimum_duration
+        self.sample_duration = sample_duration
+        self.maximum_dispersion = maximum_dispersion
+        self.callback = callback
+
+        self.participant_id = filename.split('/')[-1].split('_')[0]
+
+        self.tsv_file = open(filename, 'rb')
+        self.__start()
+
+    @property
+    def experiment(self):
+        """The trials recorded so far, the last one is still growing"""
+        return Experiment(trial=list(self.trials), eye_tracker="SMIRed250", filetype="tsv")
+
+    def poll(self):
+        """Parses the lines appended since the previous poll, a line that is still being written
+            is kept until its end arrives
+
+        Returns
+        -------
+        list
+            the new fixations
+        """
+
+        if os.path.getsize(self.filename) < self.position:
+            logger.warning("%s was truncated, following it from the start", self.filename)
+            self.tsv_file.seek(0)
+            self.__start()
+
+        chunk = self.tsv_file.read()
+        self.position += len(chunk)
+
+        lines = (self.partial + chunk).split(b'\n')
+        self.partial = lines.pop()
+
+        fixations = []
+
+        with instrumentation.stage("follow", bytes_read=len(chunk)) as stage:
+            changed = False
+
+            for line in lines:
+
+                token = line.decode().rstrip('\r').split("\t")
+
+                if len(token) < 3:
+                    continue
+
+                if self.trials:
+                    # Filter MSG samples if any exist, or R eye is inValid
+                    if token[1] == "SMP" and token[27] != "-1":
+                        timestamp, x_cord, y_cord = int(token[0]), float(token[23]), float(token[24])
+                        self.timestamps.append(timestamp)
+                        self.x_cords.append(x_cord)
+                        self.y_cords.append(y_cord)
+                        self.pupils.append(float(token[12]))
+                        stage.items += 1
+                        changed = True
+
+                        fixation = self.classifier.push(timestamp, x_cord, y_cord)
+                        if fixation is not None:
+                            self.fixations.append((self.fixation_count + len(self.fixations), fixation.timestamp,
+                                                   fixation.duration, fixation.x_cord, fixation.y_cord, 0))
+                            fixations.append(fixation)
+
+                if token[1] == "MSG" and token[3].find(".jpg") != -1:
+                    if changed:
+                        self.__update_trial()
+                        changed = False
+
+                    self.__start_trial(token[3].split(' ')[-1])
+
+            if changed:
+                self.__update_trial()
+
+        if self.callback is not None:
+            for fixation in fixations:
+                self.callback(fixation, self.trials[fixation.trial_id])
+
+        return fixations
+
+    def follow(self, poll_interval=0.25, timeout=None):
+        """Yields the new fixations as the file grows
+
+        Parameters
+        ----------
+        poll_interval : float, optional
+            seconds to wait when nothing was appended
+
+        timeout : float, optional
+            stops after this many seconds without new lines, follows the file until closed by default
+
+        Yields
+        ------
+        Fixation
+            each new fixation
+        """
+
+        idle = 0.0
+
+        while not self.tsv_file.closed and (timeout is None or idle < timeout):
+            position = self.position
+
+            yield from self.poll()
+
+            if self.position == position:
+                time.sleep(poll_interval)
+                idle += poll_interval
+            else:
+                idle = 0.0
+
+    def close(self):
+        """Closes the file"""
+        self.tsv_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __start(self):
+        """Private method that forgets the parsed lines and trials"""
+
+        self.position = 0
+        self.partial = b""
+        self.trials = []
+
+    def __start_trial(self, image):
+        """Private method that starts a new Trial at a .jpg message
+
+        Parameters
+        ----------
+        image : str
+            image name of the trial
+        """
+
+        trial_id = len(self.trials)
+
+        # Samples and fixations parsed since the Trial was last updated
+        self.timestamps, self.x_cords, self.y_cords, self.pupils = array('q'), array('d'), array('d'), array('d')
+        self.fixations = []
+
+        # Samples and fixations of the Trial, it holds views of the filled part of these buffers
+        self.sample_buffer, self.sample_count = np.empty(1024, dtype=SAMPLE_DTYPE), 0
+        self.fixation_buffer, self.fixation_count = np.empty(64, dtype=FIXATION_EVENT_DTYPE), 0
+
+        self.classifier = OnlineIDT(self.minimum_duration, self.sample_duration, self.maximum_dispersion,
+                                    trial_id, self.participant_id)
+
+        self.trials.append(Trial(trial_id=trial_id,
+                                 participant_id=self.participant_id,
+                                 image=image,
+                                 fixations={},
+                                 saccades={},
+                                 blinks={},
+                                 samples=self.sample_buffer[:0],
+                                 eye_tracker="SMIRed250"))
+
+    def __update_trial(self):
+        """Private method that appends the new samples and fixations to the current Trial, keeping its offset.
+            Only the new rows are copied, unless a buffer has to grow.
+        """
+
+        trial = self.trials[-1]
+
+        self.sample_buffer, self.sample_count = self.__append(
+            self.sample_buffer, self.sample_count, sample_array(self.timestamps, self.x_cords, self.y_cords,
+                                                                self.pupils))
+        self.fixation_buffer, self.fixation_count = self.__append(
+            self.fixation_buffer, self.fixation_count, np.array(self.fixations, dtype=FIXATION_EVENT_DTYPE))
+
+        self.timestamps, self.x_cords, self.y_cords, self.pupils = array('q'), array('d'), array('d'), array('d')
+        self.fixations = []
+
+        trial.samples = self.sample_buffer[:self.sample_count]
+        trial.fixations = EventTable('fixation', self.fixation_buffer[:self.fixation_count], trial.trial_id,
+                                     self.participant_id)
+        trial.fixations.set_offset(*trial.get_offset())
+
+    @staticmethod
+    def __append(buffer, count, rows):
+        """Private method that copies rows after the first count rows of a buffer, doubling its capacity when full
+
+        Returns
+        -------
+        tuple
+            the buffer, a new one if it grew, and the number of rows in it
+        """
+
+        if count + len(rows) > len(buffer):
+            grown = np.empty(max(2 * len(buffer), count + len(rows)), dtype=buffer.dtype)
+            grown[:count] = buffer[:count]
+            buffer = grown
+
+        buffer[count:count + len(rows)] = rows
+
+        return buffer, count + len(rows)
+
+
+def read_EyeLink1000(filename, filetype, cache=None, samples=True, vcl_index=None):
+    """Read asc file from Eye Link 1000 eye tracker
+
+    Parameters
+    ----------
+    filename : str
+        name of the asc file
+        
+    filetype : str
+        filetype of the file, e.g. "tsv"
+
+    cache : ExperimentCache or str, optional
+        parse cache or its directory, the file is parsed again only if it changed
+
+    samples : bool, optional
+        whether raw samples are kept, trials have no samples otherwise
+
+    vcl_index : VCLIndex or str, optional
+        index of the trial images or its dataset root, "datasets/AlMadi2018/" by default
+
+    Returns
+    -------
+    Experiment
+        an Experiment object of EyeLink1000 data
+    """
+
+    if not isinstance(vcl_index, VCLIndex):
+        vcl_index = VCLIndex() if vcl_index is None else VCLIndex(vcl_index)
+
+    if cache is not None:
+        if not isinstance(cache, ExperimentCache):
+            cache = ExperimentCache(cache)
+
+        # The VCL files decide the trial images, so their times and sizes are part of the key
+        key = cache.key(filename, "read_EyeLink1000", filetype=filetype, samples=samples, vcl_root=vcl_index.root,
+                        vcl_files=vcl_index.files(os.path.basename(filename).split('.')[0]))
+        experiment = cache.load(filename, key)
+
+        if experiment is not None:
+            return experiment
+
+    keep_samples = samples
+
+    with instrumentation.stage("parse", bytes_read=os.path.getsize(filename)) as stage:
+        asc_file = open(filename)
+        logger.info("parsing file: %s", filename)
+
+        trials = []
+
+        trial_id = -1
+        participant_id = filename.split('.')[0]
+        experiment = os.path.basename(filename).split('.')[0]
+
+        # Numeric sample columns of the current trial, '.' (missing) is stored as NaN
+        timestamps, x_cords, y_cords, pupils = array('q'), array('d'), array('d'), array('d')
+        nan = float('nan')
+
+        # Events of the current trial as record tuples, stored as EventTables when the trial closes
+        fixations = []
+        saccades = []
+        blinks = []
+
+        count = 0
+        lines = 0
+
+        for line in asc_file:
+            lines += 1
+
+            # Sample lines start with their timestamp: time, x, y, pupil and flags
+            if line[:1].isdigit():
+                if keep_samples:
+                    token = line.split(None, 4)
+                    timestamps.append(int(token[0]))
+                    x_cords.append(float(token[1]) if token[1] != '.' else nan)
+                    y_cords.append(float(token[2]) if token[2] != '.' else nan)
+                    pupils.append(float(token[3]) if token[3] != '.' else nan)
+                continue
+
+            token = line.split()
+
+            if not token:
+                continue
+
+            if "TRIALID" in token:
+                # List of eye events
+                if trial_id == -1:
+                    trial_id = int(token[-1])
+                    continue
+
+                image = vcl_index.image(experiment, trial_id)
+
+                # Append fixations and saccades list here
+                trials.append(Trial(trial_id=trial_id,
+                                    participant_id=participant_id,
+                                    image=image,
+                                    fixations=EventTable('fixation', fixations, trial_id, participant_id),
+                                    saccades=EventTable('saccade', saccades, trial_id, participant_id),
+                                    blinks=EventTable('blink', blinks, trial_id, participant_id),
+                                    samples=sample_array(timestamps, x_cords, y_cords, pupils),
+                                    eye_tracker="EyeLink1000"))
+
+                fixations = []
+                saccades = []
+                blinks = []
+                timestamps, x_cords, y_cords, pupils = array('q'), array('d'), array('d'), array('d')
+                count = 0
+                trial_id = int(token[-1])
+
+            if token[0] == "EFIX":
+                timestamp = int(token[2])
+                duration = int(token[4])
+                x_cord = float(token[5])
+                y_cord = float(token[6])
+                pupil = int(token[7])
+
+                fixations.append((count, timestamp, duration, x_cord, y_cord, pupil))
+                count += 1
+
+            if token[0] == "ESACC":
+                timestamp = int(token[2])
+                duration = int(token[4])
+                x_cord = float(token[5]) if token[5] != '.' else 0.0
+                y_cord = float(token[6]) if token[6] != '.' else 0.0
+                x1_cord = float(token[7]) if token[7] != '.' else 0.0
+                y1_cord = float(token[8]) if token[8] != '.' else 0.0
+                amplitude = float(token[9])
+                peak_velocity = int(token[10])
+                saccades.append((count, timestamp, duration, x_cord, y_cord, x1_cord, y1_cord, amplitude,
+                                 peak_velocity))
+                count += 1
+
+            if token[0] == "EBLINK":
+                timestamp = int(token[2])
+                duration = int(token[4])
+                blinks.append((count, timestamp, duration))
+                count += 1
+
+        image = vcl_index.image(experiment, trial_id)
+
+        # Add the last trial
+        trials.append(Trial(trial_id=trial_id,
+                            participant_id=participant_id,
+                            image=image,
+                            fixations=EventTable('fixation', fixations, trial_id, participant_id),
+                            saccades=EventTable('saccade', saccades, trial_id, participant_id),
+                            blinks=EventTable('blink', blinks, trial_id, participant_id),
+                            samples=sample_array(timestamps, x_cords, y_cords, pupils),
+                            eye_tracker="EyeLink1000"))
+
+        stage.items = lines
+
+        asc_file.close()
+
+    experiment = Experiment(trial=trials, eye_tracker="EyeLink1000", filetype=filetype)
+
+    if cache is not None:
+        cache.store(filename, key, experiment)
+
+    return experiment
+
+
+def sample_array(timestamps, x_cords, y_cords, pupils):
+    """Private function that builds a structured array of SAMPLE_DTYPE from numeric sample columns
+
+    Parameters
+    ----------
+    timestamps, x_cords, y_cords, pupils : array.array
+        sample columns, 'q' for timestamps and 'd' for the others
+
+    Returns
+    -------
+    numpy.ndarray
+        the samples
+    """
+
+    samples = np.empty(len(timestamps), dtype=SAMPLE_DTYPE)
+    samples['timestamp'] = np.frombuffer(timestamps, dtype=np.int64)
+    samples['x_cord'] = np.frombuffer(x_cords, dtype=np.float64)
+    samples['y_cord'] = np.frombuffer(y_cords, dtype=np.float64)
+    samples['pupil'] = np.frombuffer(pupils, dtype=np.float64)
+
+    return samples
+
+
+class VCLIndex:
+    """Stimulus image of each trial of EyeLink experiments, read from the VC_<trial>.vcl files in
+        <root>/runtime/dataviewer/<experiment>/graphics/. Each graphics directory is scanned once, and
+        the images found can be kept in a JSON manifest so later runs only check the file times.
+    """
+
+    def __init__(self, root="datasets/AlMadi2018/", manifest=None):
+        """Initializes the index
+
+        Parameters
+        ----------
+        root : str, optional
+            dataset directory that contains runtime/dataviewer/
+
+        manifest : str, optional
+            path of the JSON manifest, it is read if it exists and written by save()
+        """
+
+        self.root = root
+        self.manifest = manifest
+        self.experiments = {}
+
+        # Experiments whose manifest entry was checked against their directory
+        self.checked = set()
+
+        if manifest is not None and os.path.isfile(manifest):
+            try:
+                with open(manifest) as manifest_file:
+                    self.experiments = json.load(manifest_file)
+            except (OSError, ValueError):
+                logger.warning("Ignoring unreadable VCL manifest: %s", manifest)
+
+    def graphics_path(self, experiment):
+        """Returns the graphics directory of an experiment
+
+        Parameters
+        ----------
+        experiment : str
+            experiment name, the asc file name without extension
+
+        Returns
+        -------
+        str
+            path of the directory
+        """
+
+        return os.path.join(self.root, 'runtime', 'dataviewer', experiment, 'graphics')
+
+    def files(self, experiment):
+        """Returns the modification time and size of the VCL files of an experiment
+
+        Parameters
+        ----------
+        experiment : str
+            experiment name, the asc file name without extension
+
+        Returns
+        -------
+        dict
+            [modification time in nanoseconds, size] of each VCL file name, None if there is no graphics directory
+        """
+
+        try:
+            with os.scandir(self.graphics_path(experiment)) as entries:
+                return {vcl.name: [vcl.stat().st_mtime_ns, vcl.stat().st_size] for vcl in entries
+                        if vcl.name.startswith('VC_') and vcl.name.endswith('.vcl')}
+        except OSError:
+            return None
+
+    def scan(self, experiment):
+        """Reads the image of every trial of an experiment, unless the manifest is up to date
+
+        Parameters
+        ----------
+        experiment : str
+            experiment name, the asc file name without extension
+
+        Returns
+        -------
+        dict
+            image name of each trial number, as a string from 1
+        """
+
+        path = self.graphics_path(experiment)
+        self.checked.add(experiment)
+
+        files = self.files(experiment)
+        if files is None:
+            self.experiments.pop(experiment, None)
+            return {}
+
+        # Files edited in place do not change the directory time, so each file is checked
+        entry = self.experiments.get(experiment)
+        if entry is not None and entry.get('files') == files:
+            return entry['images']
+
+        images = {}
+        for name in files:
+            with open(os.path.join(path, name), 'r') as file:
+                file.readline()
+                images[name[3:-4]] = file.readline().split()[-3].split('/')[-1]
+
+        self.experiments[experiment] = {'files': files, 'images': images}
+
+        return images
+
+    def image(self, experiment, trial_id):
+        """Returns the stimulus image of a trial
+
+        Parameters
+        ----------
+        experiment : str
+            experiment name, the asc file name without extension
+
+        trial_id : int
+            id of the trial, its graphics file is VC_<trial_id + 1>.vcl
+
+        Returns
+        -------
+        str
+            image name
+        """
+
+        if experiment in self.checked:
+            images = self.experiments.get(experiment, {}).get('images', {})
+        else:
+            images = self.scan(experiment)
+
+        index = str(int(trial_id) + 1)
+        if index not in images:
+            raise FileNotFoundError(os.path.join(self.graphics_path(experiment), 'VC_' + index + '.vcl'))
+
+        return images[index]
+
+    def save(self):
+        """Writes the manifest, if the index has one"""
+
+        if self.manifest is None:
+            return
+
+        temporary = self.manifest + '.tmp'
+        with open(temporary, 'w') as manifest_file:
+            json.dump(self.experiments, manifest_file)
+        os.replace(temporary, self.manifest)
+
+
+def save_experiment(experiment, file):
+    """Save a parsed Experiment to a columnar .npz file, events and samples of all trials are
+        concatenated into one array per kind with per-trial counts to split them again
+
+    Parameters
+    ----------
+    experiment : Experiment
+        the experiment to be saved
+
+    file : str or file
+        path or file object of the .npz file
+    """
+
+    np.savez(file, **experiment_arrays(experiment))
+
+
+def load_experiment(file):
+    """Load an Experiment saved by save_experiment
+
+    Parameters
+    ----------
+    file : str or file
+        path or file object of the .npz file
+
+    Returns
+    -------
+    Experiment
+        the saved experiment, trial events and samples are views into the loaded arrays
+    """
+
+    with np.load(file, allow_pickle=False) as arrays:
+        arrays = dict(arrays)
+
+    return experiment_from_arrays(arrays)
+
+
+def experiment_arrays(experiment):
+    """Private function that lays out an Experiment as a dictionary of NumPy arrays
+
+    Parameters
+    ----------
+    experiment : Experiment
+        the experiment to be laid out
+
+    Returns
+    -------
+    dict
+        arrays of trial metadata, concatenated events and samples, per-trial counts and offset histories.
+        Events and samples are stored without the pending offset of their trial
+    """
+
+    trials = experiment.trial
+
+    arrays = {'version': np.array(PARSER_VERSION),
+              'eye_tracker': np.array(experiment.eye_tracker),
+              'filetype': np.array(experiment.filetype),
+              'trial_id': np.array([trial.trial_id for trial in trials], dtype=np.int64),
+              'participant_id': np.array([trial.participant_id for trial in trials], dtype=str),
+              'image': np.array([trial.image for trial in trials], dtype=str)}
+
+    for kind, dtype in (('fixation', FIXATION_EVENT_DTYPE), ('saccade', SACCADE_EVENT_DTYPE),
+                        ('blink', BLINK_EVENT_DTYPE)):
+        tables = [getattr(trial, kind + 's') for trial in trials]
+        arrays[kind + '_count'] = np.array([len(table) for table in tables], dtype=np.int64)
+        arrays[kind + 's'] = np.concatenate([np.empty(0, dtype=dtype)] + [table.data for table in tables])
+
+    arrays['sample_count'] = np.array([len(trial.raw_samples) for trial in trials], dtype=np.int64)
+
+    if all(isinstance(trial.raw_samples, np.ndarray) for trial in trials):
+        arrays['samples'] = np.concatenate([np.empty(0, dtype=SAMPLE_DTYPE)] +
+                                           [trial.raw_samples for trial in trials])
+    else:
+        # Raw event lines of EyeLink data are kept as text
+        arrays['sample_text'] = np.array([sample for trial in trials for sample in trial.raw_samples], dtype=str)
+
+    # Offsets are replayed on load, so the pending offset and its undo history are both kept
+    arrays['offset_count'] = np.array([len(trial.offset_history) for trial in trials], dtype=np.int64)
+    arrays['offsets'] = np.array([offset for trial in trials for offset in trial.offset_history],
+                                 dtype=float).reshape(-1, 2)
+
+    return arrays
+
+
+def experiment_from_arrays(arrays):
+    """Private function that builds an Experiment from the arrays of experiment_arrays
+
+    Parameters
+    ----------
+    arrays : dict
+        arrays of trial metadata, concatenated events and samples, and per-trial counts
+
+    Returns
+    -------
+    Experiment
+        the experiment, trial events and samples are views into the given arrays
+    """
+
+    if int(arrays['version']) != PARSER_VERSION:
+        raise ValueError("arrays were saved by another parser version: " + str(arrays['version']))
+
+    eye_tracker = str(arrays['eye_tracker'])
+
+    def split(name):
+        return np.split(arrays[name + 's'], np.cumsum(arrays[name + '_count'])[:-1])
+
+    fixations, saccades, blinks = split('fixation'), split('saccade'), split('blink')
+
+    if 'samples' in arrays:
+        samples = split('sample')
+    else:
+        samples = [text.tolist() for text in np.split(arrays['sample_text'],
+                                                      np.cumsum(arrays['sample_count'])[:-1])]
+
+    trials = []
+
+    for index, (trial_id, participant_id, image) in enumerate(zip(arrays['trial_id'].tolist(),
+                                                                   arrays['participant_id'].tolist(),
+                                                                   arrays['image'].tolist())):
+        trials.append(Trial(trial_id=trial_id,
+                            participant_id=participant_id,
+                            image=image,
+                            fixations=EventTable('fixation', fixations[index], trial_id, participant_id),
+                            saccades=EventTable('saccade', saccades[index], trial_id, participant_id),
+                            blinks=EventTable('blink', blinks[index], trial_id, participant_id),
+                            samples=samples[index],
+                            eye_tracker=eye_tracker))
+
+    # Files saved before offsets were stored have none
+    if 'offsets' in arrays:
+        for trial, history in zip(trials, split('offset')):
+            for x_offset, y_offset in history[1:].tolist():
+                trial.sample_offset(x_offset, y_offset)
+
+    return Experiment(trial=trials, eye_tracker=eye_tracker, filetype=str(arrays['filetype']))
+
+
+class SampleStore:
+    """Directory of parsed experiments saved once as binary .npy files, one subdirectory per participant.
+        Samples and events of all trials are concatenated per participant with per-trial counts, opening
+        a participant memory-maps the files so each Trial holds zero-copy views and nothing is parsed.
+    """
+
+    def __init__(self, directory):
+        """Initializes the store
+
+        Parameters
+        ----------
+        directory : str
+            root directory of the store
+        """
+
+        self.directory = directory
+
+    def save(self, participant_id, experiment):
+        """Saves the experiment of one participant, replacing any previous one
+
+        Parameters
+        ----------
+        participant_id : str
+            participant id, used as the subdirectory name
+
+        experiment : Experiment
+            the parsed experiment
+        """
+
+        participant_directory = os.path.join(self.directory, participant_id)
+        os.makedirs(participant_directory, exist_ok=True)
+
+        # open() loads every .npy file, arrays of the previous experiment that are not written again must go
+        for name in os.listdir(participant_directory):
+            if name.endswith('.npy'):
+                os.remove(os.path.join(participant_directory, name))
+
+        for name, values in experiment_arrays(experiment).items():
+            np.save(os.path.join(participant_directory, name + '.npy'), values, allow_pickle=False)
+
+    def save_dataset(self, subjects):
+        """Saves every experiment of a dataset
+
+        Parameters
+        ----------
+        subjects : dict
+            a dictionary of experiments where the key is the subject ID, e.g. from EMIP_dataset
+        """
+
+        for participant_id, experiment in subjects.items():
+            self.save(participant_id, experiment)
+
+    def participants(self):
+        """Returns the ids of the participants in the store
+
+        Returns
+        -------
+        list
+            sorted participant ids
+        """
+
+        if not os.path.isdir(self.directory):
+            return []
+
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.isfile(os.path.join(self.directory, name, 'version.npy')))
+
+    def open(self, participant_id):
+        """Opens the experiment of one participant without parsing the raw data file
+
+        Parameters
+        ----------
+        participant_id : str
+            participant id
+
+        Returns
+        -------
+        Experiment
+            the experiment, samples and events of each trial are views of copy-on-write memory maps
+        """
+
+        participant_directory = os.path.join(self.directory, participant_id)
+
+        arrays = {}
+        for name in os.listdir(participant_directory):
+            if name.endswith('.npy'):
+                arrays[name[:-4]] = np.load(os.path.join(participant_directory, name), mmap_mode='c',
+                                            allow_pickle=False)
+
+        return experiment_from_arrays(arrays)
+
+    def open_dataset(self):
+        """Opens every experiment in the store
+
+        Returns
+        -------
+        dict
+            a dictionary of experiments where the key is the subject ID
+        """
+
+        return {participant_id: self.open(participant_id) for participant_id in self.participants()}
+
+    def open_trial(self, participant_id, trial_id):
+        """Opens a single trial of one participant
+
+        Parameters
+        ----------
+        participant_id : str
+            participant id
+
+        trial_id : int
+            trial id
+
+        Returns
+        -------
+        Trial
+            the trial, samples and events are views of copy-on-write memory maps
+        """
+
+        for trial in self.open(participant_id).trial:
+            if trial.trial_id == trial_id:
+                return trial
+
+        raise KeyError(trial_id)
+
+
+class ExperimentCache:
+    """On-disk cache of parsed experiments stored as .npz files by save_experiment.
+        Entries are keyed by the raw data file content, the parser version, the reader and its
+        parameters, the least recently used entries are evicted when the cache grows over max_size.
+    """
+
+    def __init__(self, directory=None, max_size=2 * 1024 ** 3):
+        """Initializes the cache directory
+
+        Parameters
+        ----------
+        directory : str, optional
+            directory of the cache files, "~/.cache/emip_toolkit" by default
+
+        max_size : int, optional
+            maximum total size of the cache files in bytes, 2 GB by default
+        """
+
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.cache', 'emip_toolkit')
+
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, filename, reader, **parameters):
+        """Returns the cache key of a raw data file parsed by a reader with the given parameters
+
+        Parameters
+        ----------
+        filename : str
+            path of the raw data file
+
+        reader : str
+            name of the reader, e.g. "read_SMIRed250"
+
+        parameters : dict
+            reader parameters that change the parsed result
+
+        Returns
+        -------
+        str
+            hexadecimal digest of the file content, parser version, reader and parameters
+        """
+
+        digest = hashlib.sha256()
+
+        with open(filename, 'rb') as raw_file:
+            for chunk in iter(lambda: raw_file.read(1 << 20), b''):
+                digest.update(chunk)
+
+        digest.update(repr((PARSER_VERSION, reader, sorted(parameters.items()))).encode())
+
+        return digest.hexdigest()
+
+    def __entry(self, filename, key):
+        """Private method that returns the path of the cache file for a raw data file and key"""
+        return os.path.join(self.directory, os.path.basename(filename) + '.' + key + '.npz')
+
+    def load(self, filename, key):
+        """Returns the cached experiment of a raw data file, or None when it is not cached
+
+        Parameters
+        ----------
+        filename : str
+            path of the raw data file
+
+        key : str
+            cache key returned by key()
+
+        Returns
+        -------
+        Experiment
+            the cached experiment or None
+        """
+
+        entry = self.__entry(filename, key)
+
+        with instrumentation.stage("cache_load") as stage:
+            try:
+                experiment = load_experiment(entry)
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+                return None
+
+            stage.items = experiment.get_number_of_trials()
+            stage.bytes_read = os.path.getsize(entry)
+
+        # Mark the entry as recently used for eviction
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+
+        return experiment
+
+    def store(self, filename, key, experiment):
+        """Stores a parsed experiment then evicts old entries if the cache is too large
+
+        Parameters
+        ----------
+        filename : str
+            path of the raw data file
+
+        key : str
+            cache key returned by key()
+
+        experiment : Experiment
+            the parsed experiment
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        entry = self.__entry(filename, key)
+        temporary = entry + '.' + str(os.getpid()) + '.tmp'
+
+        # Write then rename so that parallel loaders never read a partial file
+        with open(temporary, 'wb') as cache_file:
+            save_experiment(experiment, cache_file)
+        os.replace(temporary, entry)
+
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in max_size"""
+
+        entries = []
+
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                try:
+                    status = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((status.st_mtime, status.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+            total -= size
+
+    def invalidate(self, filename=None):
+        """Removes the cached experiments of a raw data file, or every entry if no file is given
+
+        Parameters
+        ----------
+        filename : str, optional
+            path of the raw data file
+        """
+
+        if not os.path.isdir(self.directory):
+            return
+
+        prefix = os.path.basename(filename) + '.' if filename is not None else ''
+
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith('.npz'):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+def find_background_color(img):
+    """Private function that identifies the background color of the image
+
+    Parameters
+    ----------
+    img : PIL.Image
+        a PIL (pillow fork) Image object
+
+    Returns
+    -------
+    str
+        the color of the background of the image
+    """
+
+    img = img.convert('1')
+    width, height = img.size
+
+    color_result = []
+    box_size = min(width, height) // 20
+
+    # Move a tiny rectangle box to obtain most common color
+    for x, y in zip(range(0, width, box_size), range(0, height, box_size)):
+        box = (x, y, x + box_size, y + box_size)
+        minimum, maximum = img.crop(box).getextrema()
+        color_result.append(minimum)
+        color_result.append(maximum)
+
+    # Analyze and determine the background color
+    if color_result.count(255) > color_result.count(0):
+        bg_color = 'white'
+    else:
+        bg_color = 'black'
+
+    return bg_color
+
+
+@instrumentation.timed("find_aoi", count=lambda aoi: 0 if aoi is None else len(aoi))
+def find_aoi(image=None, image_path=None, img=None, level="sub-line", margin_height=4, margin_width=7):
+    """Find Area of Interest in the given image and store the aoi attributes in a Pandas Dataframe
+
+    Parameters
+    ----------
+    image : str
+        filename for the image, e.g. "vehicle_java.jpg"
+
+    image_path : str
+        path for all images, e.g. "emip_dataset/stimuli/"
+
+    img : PIL.Image, optional
+        PIL.Image object if user chooses to input an PIL image object
+
+    level : str, optional
+        level of detection in AOIs, "line" for each line as an AOI or "sub-line" for each token as an AOI
+
+    margin_height : int, optional
+        marginal height when finding AOIs, use smaller number for tight text layout
+
+    margin_width : int, optional
+        marginal width when finding AOIs, use smaller number for tight text layout
+
+    Returns
+    -------
+    pandas.DataFrame
+        a pandas DataFrame of area of interest detected by the method
+    """
+
+    if img is None:
+        if image is None or image_path is None:
+            return
+        img = Image.open(image_path + image).convert('1')
+    else:
+        img = img.convert('1')
+
+    # Detect the background color
+    bg_color = find_background_color(img)
+
+    # Binarized image as an array, True where the pixel has the text color
+    pixels = np.asarray(img)
+    foreground = pixels if bg_color == 'black' else ~pixels
+
+    # Lines of code are runs of rows holding text, found on the row projection profile
+    upper_bounds, lower_bounds = projection_bounds(foreground.any(axis=1), margin_height)
+
+    columns = ['kind', 'name', 'x', 'y', 'width', 'height', 'image']
+    final_result = []
+
+    # Iterate through each line of code from detection
+    for line_count, (upper_bound, lower_bound) in enumerate(zip(upper_bounds.tolist(), lower_bounds.tolist()), 1):
+
+        # Tokens are runs of columns holding text within the line
+        left_bounds, right_bounds = projection_bounds(foreground[upper_bound:lower_bound].any(axis=0),
+                                                      margin_width)
+
+        if level == 'sub-line':
+            for part_count, (left, right) in enumerate(zip(left_bounds.tolist(), right_bounds.tolist()), 1):
+                final_result.append(['sub-line', f'line {line_count} part {part_count}', left, upper_bound,
+                                     right, lower_bound])
+
+        elif level == 'line':
+            final_result.append(['line', f'line {line_count}', int(left_bounds[0]), upper_bound,
+                                 int(right_bounds[-1]), lower_bound])
+
+    # Format pandas dataframe in one shot, x and width are narrowed by the margin for better visualization
+    aoi = pd.DataFrame([[kind, name, x + margin_width / 2, y, x0 - x - margin_width, y0 - y, image]
+                        for kind, name, x, y, x0, y0 in final_result], columns=columns)
+
+    return aoi
+
+
+def projection_bounds(profile, margin):
+    """Private function that finds where text starts and ends along a projection profile.
+        It gives the same bounds as sliding a box of margin pixels over the image one pixel
+        at a time and comparing the color extrema of consecutive boxes.
+
+    Parameters
+    ----------
+    profile : numpy.ndarray
+        boolean array, True for each row (or column) of the image that holds text
+
+    margin : int
+        size of the sliding box in pixels
+
+    Returns
+    -------
+    tuple
+        numpy arrays of start bounds and end bounds
+    """
+
+    size = len(profile)
+
+    if size <= margin:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    # The box starting at position k holds text if any of the profile entries k..k+margin-1 does
+    counts = np.concatenate(([0], np.cumsum(profile)))
+    boxes = (counts[margin:size] - counts[:size - margin]) > 0
+
+    # Compare each box with the previous one from the third box on
+    changes = np.nonzero(boxes[2:] != boxes[1:-1])[0] + 2
+
+    starts = changes[boxes[changes]]
+    ends = changes[~boxes[changes]] + margin
+
+    return starts, ends
+
+
+class AOICache:
+    """Memoizes find_aoi by stimulus content. Results are keyed by a hash of the image bytes and the
+        detection parameters, held in memory with least recently used eviction and optionally
+        saved in a directory so other sessions can reuse them.
+    """
+
+    def __init__(self, maxsize=64, directory=None):
+        """Initializes an empty cache
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            maximum number of AOI tables held in memory
+
+        directory : str, optional
+            directory where AOI tables are persisted, tables are only kept in memory if None
+        """
+
+        self.maxsize = maxsize
+        self.directory = directory
+        self.entries = OrderedDict()
+
+    def find_aoi(self, image=None, image_path=None, img=None, level="sub-line", margin_height=4, margin_width=7):
+        """Same as find_aoi, detection only runs the first time an image is seen with these parameters
+
+        Parameters
+        ----------
+        image : str
+            filename for the image, e.g. "vehicle_java.jpg"
+
+        image_path : str
+            path for all images, e.g. "emip_dataset/stimuli/"
+
+        img : PIL.Image, optional
+            PIL.Image object if user chooses to input an PIL image object
+
+        level : str, optional
+            level of detection in AOIs, "line" for each line as an AOI or "sub-line" for each token as an AOI
+
+        margin_height : int, optional
+            marginal height when finding AOIs, use smaller number for tight text layout
+
+        margin_width : int, optional
+            marginal width when finding AOIs, use smaller number for tight text layout
+
+        Returns
+        -------
+        pandas.DataFrame
+            a copy of the cached area of interest DataFrame
+        """
+
+        if img is None:
+            if image is None or image_path is None:
+                return
+
+            with open(image_path + image, 'rb') as image_file:
+                content = image_file.read()
+
+            digest = hashlib.sha256(content)
+        else:
+            content = None
+            digest = hashlib.sha256(f"{img.mode} {img.size} ".encode())
+            digest.update(img.tobytes())
+
+        digest.update(repr((level, margin_height, margin_width)).encode())
+        key = digest.hexdigest()
+
+        aoi = self.entries.get(key)
+
+        if aoi is not None:
+            self.entries.move_to_end(key)
+        else:
+            aoi = self.__load(key)
+
+            if aoi is None:
+                if img is None:
+                    img = Image.open(io.BytesIO(content))
+
+                aoi = find_aoi(image=image, img=img, level=level, margin_height=margin_height,
+                               margin_width=margin_width)
+                self.__save(key, aoi)
+
+            self.entries[key] = aoi
+
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+        # The same content may be shared by images with different names
+        aoi = aoi.copy()
+        aoi['image'] = image
+
+        return aoi
+
+    def __load(self, key):
+        """Private method that reads a persisted AOI table, returns None if it is not on disk"""
+
+        if self.directory is None:
+            return None
+
+        try:
+            return pd.read_pickle(os.path.join(self.directory, key + '.pkl'))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def __save(self, key, aoi):
+        """Private method that persists an AOI table if the cache has a directory"""
+
+        if self.directory is None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        entry = os.path.join(self.directory, key + '.pkl')
+        temporary = entry + '.' + str(os.getpid()) + '.tmp'
+
+        aoi.to_pickle(temporary)
+        os.replace(temporary, entry)
+
+    def clear(self):
+        """Removes all AOI tables held in memory, persisted tables are kept"""
+        self.entries.clear()
+
+
+# Cache used by Trial.draw_trial when AOIs are detected on the fly
+aoi_cache = AOICache()
+
+
+@instrumentation.timed("render")
+def draw_aoi(aoi, image, image_path):
+    """Draws AOI rectangles on to an image.
+
+    Parameters
+    ----------
+    aoi : pandas.DataFrame
+        a pandas DataFrame containing rectangle attributes representing areas of interest (AOIs)
+
+    image : str
+        filename for the image where AOI rectangles will be imposed, e.g. "vehicle_java.jpg"
+
+    image_path : str
+        path for all images, e.g. "emip_dataset/stimuli/"
+
+    Returns
+    -------
+    PIL.Image
+        a PIL image where AOIs have been drawn as rectangles
+    """
+
+    img = Image.open(image_path + image).convert('1')
+
+    bg_color = find_background_color(img)
+
+    outline = {'white': '#000000', 'black': '#ffffff'}
+
+    # copy original image
+    rect_image = img.copy()
+    draw = ImageDraw.Draw(rect_image)
+
+    # loop over rectangles and draw them
+    for row in aoi.iterrows():
+        x_coordinate = row[1]['x']
+        y_coordinate = row[1]['y']
+        height = row[1]['height']
+        width = row[1]['width']
+        draw.rectangle([(x_coordinate, y_coordinate),
+                        (x_coordinate + width - 1, y_coordinate + height - 1)],
+                       outline=outline[bg_color])
+
+    return rect_image
+
+
+def load_stimulus(file_path, eye_tracker):
+    """Returns a stimulus image as shown by an eye tracker, the file is only read again when it changes.
+        The image is shared, copy it before drawing on it.
+
+    Parameters
+    ----------
+    file_path : str
+        path of the image file
+
+    eye_tracker : str
+        "SMIRed250" or "EyeLink1000", EyeLink1000 stimuli are placed on a 1024x768 black screen
+
+    Returns
+    -------
+    tuple
+        the PIL image and its background color
+    """
+
+    status = os.stat(file_path)
+
+    return read_stimulus(file_path, eye_tracker, status.st_mtime_ns, status.st_size)
+
+
+def stimulus_location(eye_tracker):
+    """Returns where the top left corner of a stimulus is shown on the screen of an eye tracker
+
+    Parameters
+    ----------
+    eye_tracker : str
+        "SMIRed250" or "EyeLink1000"
+
+    Returns
+    -------
+    tuple
+        x and y of the stimulus in screen coordinates
+    """
+
+    if eye_tracker == "EyeLink1000":
+        return 10, 375
+
+    return 0, 0
+
+
+@functools.lru_cache(maxsize=32)
+def read_stimulus(file_path, eye_tracker, modified, size):
+    """Private function that reads a stimulus image, cached by path, eye tracker, modification time and size"""
+
+    im = Image.open(file_path)
+    im.load()
+
+    if eye_tracker == "EyeLink1000":
+
+        background_size = (1024, 768)
+        background = Image.new('RGB', background_size, color='black')
+
+        background.paste(im, stimulus_location(eye_tracker), im.convert('RGBA'))
+
+        im = background
+
+    return im, find_background_color(im.copy().convert('1'))
+
+
+@functools.lru_cache(maxsize=8)
+def load_font(size):
+    """Returns the Tohoma.ttf font used to draw eye movement numbers, or the default PIL font when
+        it is not installed. Fonts are only loaded once for each size.
+
+    Parameters
+    ----------
+    size : int
+        font size in points
+
+    Returns
+    -------
+    PIL.ImageFont
+        the font
+    """
+
+    try:
+        return ImageFont.truetype('Tohoma.ttf', size)
+    except OSError:
+        pass
+
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow before 10.1 only has a bitmap default font
+        return ImageFont.load_default()
+
+
+def render_trials(subjects, image_path, save_image, workers=None, chunk_size=64, **options):
+    """Renders every trial of an Experiment or a dataset with render_trial and saves them as png files
+        named like the images of draw_trial. Trials are grouped by image so each worker reads each
+        stimulus once, and groups are split into chunks rendered in a process pool.
+
+    Parameters
+    ----------
+    subjects : Experiment or dict
+        an experiment, or a dictionary of experiments where the key is the subject ID
+
+    image_path : str
+        path for all images
+
+    save_image : str
+        path where the images are saved
+
+    workers : int, optional
+        number of processes, trials are rendered one at a time by default
+
+    chunk_size : int, optional
+        number of trials rendered by each task of the process pool
+
+    **options
+        draw_raw_data, draw_fixation, draw_saccade, draw_number and draw_aoi, see render_trial
+
+    Returns
+    -------
+    list
+        names of the png files, in trial order
+    """
+
+    if isinstance(subjects, Experiment):
+        trials = subjects.trial
+    else:
+        trials = [trial for experiment in subjects.values() for trial in experiment.trial]
+
+    groups = {}
+    for trial in trials:
+        groups.setdefault(trial.image, []).append(trial)
+
+    tasks = [(image_trials[start:start + chunk_size], image_path, save_image, options)
+             for image_trials in groups.values()
+             for start in range(0, len(image_trials), chunk_size)]
+
+    if workers is None or workers <= 1:
+        results = [render_chunk(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(render_chunk, *zip(*tasks)))
+
+    names = {}
+    for (chunk, *_), chunk_names in zip(tasks, results):
+        for trial, name in zip(chunk, chunk_names):
+            names[id(trial)] = name
+
+    return [names[id(trial)] for trial in trials]
+
+
+def render_chunk(trials, image_path, save_image, options):
+    """Private function that renders and saves trials of one image
+
+    Parameters
+    ----------
+    trials : list
+        trials of the same image
+
+    image_path, save_image : str
+        see render_trials
+
+    options : dict
+        passed to render_trial
+
+    Returns
+    -------
+    list
+        names of the png files
+    """
+
+    names = []
+    for trial in trials:
+        im = trial.render_trial(image_path, **options)
+        image_name = trial.get_image_name(save_image)
+
+        # EyeLink participant IDs keep the directories of the asc file
+        if os.path.dirname(image_name):
+            os.makedirs(os.path.dirname(image_name), exist_ok=True)
+
+        im.save(image_name)
+        im.close()
+
+        logger.info("%s saved!", image_name)
+        names.append(image_name)
+
+    return names
+
+
+@instrumentation.timed("heatmap")
+def fixation_heatmap(subjects, image, participants=None, trials=None, size=None, sigma=30, bin_size=1):
+    """Duration weighted fixation density of a stimulus, accumulated over trials in one histogram
+        and smoothed with a Gaussian blur
+
+    Parameters
+    ----------
+    subjects : Experiment or dict
+        an experiment, or a dictionary of experiments where the key is the subject ID
+
+    image : str
+        stimulus image name, e.g. "rectangle_java.jpg", only trials of this image are used
+
+    participants : list, optional
+        participant IDs of the dictionary to include, all by default
+
+    trials : list, optional
+        trial IDs to include, all by default
+
+    size : tuple, optional
+        width and height of the screen in pixels, 1024x768 for EyeLink1000 trials and 1920x1080 otherwise
+
+    sigma : float, optional
+        standard deviation of the Gaussian blur in pixels, no blur if 0
+
+    bin_size : int, optional
+        width and height of each cell of the heatmap in pixels
+
+    Returns
+    -------
+    numpy.ndarray
+        fixation milliseconds per cell, one row per cell row from the top of the screen
+    """
+
+    if isinstance(subjects, Experiment):
+        experiments = [subjects]
+    else:
+        experiments = [experiment for participant_id, experiment in subjects.items()
+                       if participants is None or participant_id in participants]
+
+    selected = [trial for experiment in experiments for trial in experiment.trial
+                if trial.image == image and (trials is None or trial.trial_id in trials)]
+
+    if size is None:
+        size = (1024, 768) if selected and selected[0].eye_tracker == "EyeLink1000" else (1920, 1080)
+
+    width, height = size
+    shape = (int(math.ceil(height / bin_size)), int(math.ceil(width / bin_size)))
+
+    if selected:
+        fixations = np.concatenate([trial.get_fixations().records for trial in selected])
+    else:
+        fixations = np.empty(0, dtype=FIXATION_EVENT_DTYPE)
+
+    heatmap, _, _ = np.histogram2d(fixations['y_cord'], fixations['x_cord'], bins=shape,
+                                   range=((0, shape[0] * bin_size), (0, shape[1] * bin_size)),
+                                   weights=fixations['duration'])
+
+    return gaussian_blur(heatmap, sigma / bin_size)
+
+
+def gaussian_blur(array, sigma):
+    """Private function that blurs a 2D array with a separable Gaussian kernel truncated at 3 sigma,
+        one FFT convolution per axis, values outside the array are zero
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        2D array
+
+    sigma : float
+        standard deviation of the kernel in cells
+
+    Returns
+    -------
+    numpy.ndarray
+        the blurred array
+    """
+
+    if sigma <= 0:
+        return array
+
+    radius = int(math.ceil(3 * sigma))
+    kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2)
+    kernel /= kernel.sum()
+
+    for axis in (0, 1):
+        length = array.shape[axis] + 2 * radius
+        spectrum = np.fft.rfft(array, n=length, axis=axis) * np.expand_dims(np.fft.rfft(kernel, n=length),
+                                                                            1 - axis)
+        array = np.take(np.fft.irfft(spectrum, n=length, axis=axis),
+                        np.arange(radius, radius + array.shape[axis]), axis=axis)
+
+    return array
+
+
+@instrumentation.timed("render")
+def draw_heatmap(heatmap, image, image_path, eye_tracker="SMIRed250", colormap="jet", alpha=0.6):
+    """Draws a heatmap from fixation_heatmap over its stimulus, cells without fixations stay transparent
+
+    Parameters
+    ----------
+    heatmap : numpy.ndarray
+        heatmap from fixation_heatmap, it is stretched to the size of the stimulus
+
+    image : str
+        stimulus image name, e.g. "rectangle_java.jpg"
 
     image_path : str
-        path for all images, e.g. "emip_dataset/stimuli/"
+        path for all images
+
+    eye_tracker : str, optional
+        eye tracker of the trials, see load_stimulus
+
+    colormap : str, optional
+        matplotlib colormap name
+
+    alpha : float, optional
+        opacity of the densest cells
+
+    Returns
+    -------
+    PIL.Image
+        the stimulus with the heatmap
+    """
+
+    stimulus, _ = load_stimulus(image_path + image, eye_tracker)
+
+    peak = heatmap.max()
+    density = heatmap / peak if peak > 0 else np.zeros_like(heatmap)
+
+    colors = plt.get_cmap(colormap)(density)
+    colors[..., 3] = alpha * density
+
+    overlay = Image.fromarray((colors * 255).astype(np.uint8), 'RGBA')
+    if overlay.size != stimulus.size:
+        overlay = overlay.resize(stimulus.size, Image.BILINEAR)
+
+    return Image.alpha_composite(stimulus.convert('RGBA'), overlay).convert('RGB')
+
+
+@instrumentation.timed("tokens", count=len)
+def add_tokens_to_AOIs(file_path, aois_raw):
+    """Adds tokens from code files to aois dataframe and returns it.
+
+    Parameters
+    ----------
+    file_path : str
+        path to directory where code files are stored. In EMIP this is "emip_stimulus_programs"
+
+    aois_raw : pandas.Dataframe
+        the dataframe where AOIs are stored.
+
+    Returns
+    -------
+    pandas.DataFrame
+        a dataframe of AOIs with token information
+    """
+
+    image_name = aois_raw["image"][1]
+
+    # rectangle files
+    if image_name == "rectangle_java.jpg":
+        file_name = "Rectangle.java"
+
+    if image_name == "rectangle_java2.jpg":
+        file_name = "Rectangle.java"
+
+    if image_name == "rectangle_python.jpg":
+        file_name = "Rectangle.py"
+
+    if image_name == "rectangle_scala.jpg":
+        file_name = "Rectangle.scala"
+
+    # vehicle files
+    if image_name == "vehicle_java.jpg":
+        file_name = "Vehicle.java"
+
+    if image_name == "vehicle_java2.jpg":
+        file_name = "Vehicle.java"
+
+    if image_name == "vehicle_python.jpg":
+        file_name = "vehicle.py"
+
+    if image_name == "vehicle_scala.jpg":
+        file_name = "Vehicle.scala"
+
+    code_file = open(file_path + file_name)
+
+    code_text = code_file.read()
+
+    code_line = code_text.replace('\t', '').replace('        ', '').replace('    ', '').split('\n')
+
+    filtered_line = []
+
+    for line in code_line:
+        if len(line) != 0:
+            filtered_line.append(line.split(' '))
+
+    # after the code file has been tokenized and indexed
+    # we can attach tokens to correct AOI
+
+    aois_raw = aois_raw[aois_raw.kind == "sub-line"].copy()
+
+    tokens = []
+
+    for location in aois_raw["name"].iteritems():
+        line_part = location[1].split(' ')
+        line_num = int(line_part[1])
+        part_num = int(line_part[3])
+
+        # print(line_part, filtered_line[line_num - 1])
+        tokens.append(filtered_line[line_num - 1][part_num - 1])
+
+    aois_raw["token"] = tokens
+
+    if aois_raw[aois_raw['token'] == '']['name'].count() != 0:
+        logger.warning("Error in adding tokens, some tokens are missing!")
+
+    return aois_raw
+
+
+@instrumentation.timed("srcml", count=len)
+def add_srcml_to_AOIs(aois_raw, srcML_path):
+    """Adds srcML tags to AOIs dataframe and returns it.
+        Check https://www.srcml.org/ for more information about srcML
+
+        The files: rectangle.tsv and vehicle.tsv should be in the same directory as the code.
+
+    Parameters
+    ----------
+    aois_raw : pandas.Dataframe
+        the dataframe where AOIs are stored
+
+    srcML_path : string
+        the path of the srcML tags file
+
+    Returns
+    -------
+    pandas.DataFrame
+        AOI dataframe with srcML
+    """
+
+    image_name = aois_raw["image"].iloc[0]
+
+    # Only Java stimuli have srcML tags
+    if image_name not in srcML_files:
+        aois_raw = aois_raw.copy()
+        aois_raw["srcML_tag"] = 'na'
+        return aois_raw
+
+    tags = srcML_table(srcML_path + srcML_files[image_name])
+
+    aois_raw = aois_raw[aois_raw.kind == "sub-line"].copy()
+
+    # after the srcML file has been recognized
+    # we can attach tokens to correct AOI by name
+    aois_raw["srcML_tag"] = [tags.get(name, "na") for name in aois_raw["name"].tolist()]
+
+    return aois_raw
+
+
+def add_srcml_to_all_AOIs(aois, srcML_path):
+    """Adds srcML tags to the AOIs of all stimuli at once, see add_srcml_to_AOIs
+
+    Parameters
+    ----------
+    aois : dict or pandas.DataFrame
+        AOIs of each image, either a dictionary keyed by image name or one DataFrame
+        of all images with an image column
+
+    srcML_path : string
+        the path of the srcML tags files
+
+    Returns
+    -------
+    dict or pandas.DataFrame
+        AOIs with srcML tags, in the same form as aois
+    """
+
+    if isinstance(aois, pd.DataFrame):
+        return pd.concat([add_srcml_to_AOIs(table, srcML_path) for _, table in aois.groupby('image', sort=False)])
+
+    return {image: add_srcml_to_AOIs(table, srcML_path) for image, table in aois.items()}
+
+
+# srcML tags file of each stimulus image
+srcML_files = {"rectangle_java.jpg": "rectangle.tsv",
+               "rectangle_java2.jpg": "rectangle.tsv",
+               "vehicle_java.jpg": "vehicle.tsv",
+               "vehicle_java2.jpg": "vehicle.tsv"}
+
+
+def srcML_table(file_path):
+    """Returns the srcML tags of a file as a dictionary from AOI name to syntactic context,
+        the file is only parsed again when it changes
+
+    Parameters
+    ----------
+    file_path : str
+        path of the srcML tags file, e.g. "datasets/EMIP2021/rectangle.tsv"
+
+    Returns
+    -------
+    dict
+        syntactic context of each AOI name
+    """
+
+    status = os.stat(file_path)
+
+    return read_srcML_table(file_path, status.st_mtime_ns, status.st_size)
+
+
+@functools.lru_cache(maxsize=32)
+def read_srcML_table(file_path, modified, size):
+    """Private function that parses a srcML tags file, cached by path, modification time and size"""
+
+    # stimulus_file	token	AOI	syntactic_context
+    srcML = pd.read_csv(file_path, sep='\t').drop_duplicates('AOI')
+
+    return dict(zip(srcML['AOI'].tolist(), srcML['syntactic_context'].tolist()))
+
+
+def overlap(fix, AOI, radius=25):
+    """Checks if fixation is within radius distance or over an AOI. Returns True/False.
+
+    Parameters
+    ----------
+    fix : Fixation
+        A single fixation in a trial being considered for overlapping with the AOI
+
+    AOI : pandas.DataFrame
+        contains AOI #kind	name	x	y	width	height	local_id	image	token
+
+    radius : int, optional
+        radius around AOI to consider fixations in it within the AOI.
+        default is 25 pixel since the fixation filter groups samples within 25 pixels.
+
+    Returns
+    -------
+    bool
+        whether it overlaps
+    """
+
+    box_x = AOI.x - (radius / 2)
+    box_y = AOI.y - (radius / 2)
+    box_w = AOI.width + (radius / 2)
+    box_h = AOI.height + (radius / 2)
+
+    return box_x <= fix.x_cord <= box_x + box_w and box_y <= fix.y_cord <= box_y + box_h
+
+
+class AOIIndex:
+    """Uniform grid over AOI rectangles for hit testing many points in one vectorized pass.
+        Each AOI is enlarged by the hit test radius the same way as in overlap(), and listed in
+        every grid cell it touches, so a point only has to be checked against the AOIs of its cell.
+    """
+
+    def __init__(self, aois, radius=25, cell_size=None):
+        """Builds the grid for a set of AOIs
+
+        Parameters
+        ----------
+        aois : pandas.DataFrame
+            AOIs with x, y, width and height columns, e.g. from find_aoi
+
+        radius : int, optional
+            radius around AOI to consider fixations in it within the AOI
+
+        cell_size : float, optional
+            size of the grid cells in pixels, the median height of the enlarged AOIs by default
+        """
+
+        self.aois = aois
+        self.radius = radius
+
+        x = aois['x'].to_numpy(dtype=float)
+        y = aois['y'].to_numpy(dtype=float)
+        width = aois['width'].to_numpy(dtype=float)
+        height = aois['height'].to_numpy(dtype=float)
+
+        # Same box as overlap()
+        self.left = x - (radius / 2)
+        self.top = y - (radius / 2)
+        self.right = self.left + (width + (radius / 2))
+        self.bottom = self.top + (height + (radius / 2))
+
+        if cell_size is None:
+            cell_size = float(np.median(self.bottom - self.top)) if len(aois) else 1.0
+        self.cell_size = max(cell_size, 1.0)
+
+        self.origin_x = float(self.left.min()) if len(aois) else 0.0
+        self.origin_y = float(self.top.min()) if len(aois) else 0.0
+
+        first_column, first_row = self.__cells(self.left, self.top)
+        last_column, last_row = self.__cells(self.right, self.bottom)
+
+        self.columns = int(last_column.max()) + 1 if len(aois) else 0
+        self.rows = int(last_row.max()) + 1 if len(aois) else 0
+
+        # List every (cell, aoi) pair, then group AOIs by cell like a sparse matrix
+        cells, members = [], []
+        for aoi, (column_0, column_1, row_0, row_1) in enumerate(zip(first_column.tolist(), last_column.tolist(),
+                                                                      first_row.tolist(), last_row.tolist())):
+            for row in range(row_0, row_1 + 1):
+                cells.extend(range(row * self.columns + column_0, row * self.columns + column_1 + 1))
+                members.extend([aoi] * (column_1 - column_0 + 1))
+
+        cells = np.array(cells, dtype=np.int64)
+        members = np.array(members, dtype=np.int64)
+        order = np.lexsort((members, cells))
+
+        self.cell_aois = members[order]
+        self.cell_start = np.searchsorted(cells[order], np.arange(self.columns * self.rows + 1))
+
+    def __cells(self, x, y):
+        """Private method that returns grid column and row of coordinates"""
+        return (np.floor((x - self.origin_x) / self.cell_size).astype(np.int64),
+                np.floor((y - self.origin_y) / self.cell_size).astype(np.int64))
+
+    def query(self, x_cords, y_cords):
+        """Finds every (point, AOI) hit
+
+        Parameters
+        ----------
+        x_cords : numpy.ndarray
+            x coordinates of fixations or samples
+
+        y_cords : numpy.ndarray
+            y coordinates of fixations or samples
+
+        Returns
+        -------
+        tuple
+            arrays of point positions and AOI row positions of each hit, ordered by point then AOI
+        """
+
+        x_cords = np.asarray(x_cords, dtype=float)
+        y_cords = np.asarray(y_cords, dtype=float)
+
+        inside = np.isfinite(x_cords) & np.isfinite(y_cords)
+        column, row = np.zeros(len(x_cords), dtype=np.int64), np.zeros(len(x_cords), dtype=np.int64)
+        column[inside], row[inside] = self.__cells(x_cords[inside], y_cords[inside])
+        inside &= (column >= 0) & (column < self.columns) & (row >= 0) & (row < self.rows)
+
+        cell = np.where(inside, row * self.columns + column, 0)
+        start = np.where(inside, self.cell_start[cell], 0)
+        count = np.where(inside, self.cell_start[np.minimum(cell + 1, len(self.cell_start) - 1)] - start, 0)
+
+        # Expand each point into its candidate AOIs
+        points = np.repeat(np.arange(len(x_cords)), count)
+        offsets = np.arange(len(points)) - np.repeat(np.cumsum(count) - count, count)
+        aois = self.cell_aois[np.repeat(start, count) + offsets]
+
+        x_cords, y_cords = x_cords[points], y_cords[points]
+        hit = ((self.left[aois] <= x_cords) & (x_cords <= self.right[aois]) &
+               (self.top[aois] <= y_cords) & (y_cords <= self.bottom[aois]))
+
+        return points[hit], aois[hit]
+
+
+def hit_test(trial, aois_tokens, radius=25, index=None):
+    """Checks if fixations are within AOI with a fixation radius of 25 px
+        (since each fix is a sum of samples within 25px)
+
+    Parameters
+    ----------
+    trial : Trial
+        contains fixations and other metadata (trial#, participant, code_file, code_language)
+            - fixation includes timestamp, duration, x_cord, y_cord
+
+    aois_tokens : pandas.Dataframe
+        contains each AOI location and dimension and token text
+
+    radius : int, optional
+        radius of circle using in hit test
+
+    index : AOIIndex, optional
+        index built from aois_tokens, it can be shared by the trials of the same image.
+        the radius of the index is used if it is given
+
+    Returns
+    -------
+    pandas.DataFrame
+        DataFrame with a record representing each fixation, each record contains:
+        trial, participant, code_file, code_language, timestamp, duration, x_cord, y_cord, token, length
+    """
+
+    if index is None:
+        index = AOIIndex(aois_tokens, radius)
+
+    fixations = trial.get_fixations().records
+    logger.info("all fixations: %d", len(fixations))
+
+    with instrumentation.stage("hit_test", items=len(fixations)):
+        points, aois = index.query(fixations['x_cord'], fixations['y_cord'])
+
+        return hit_frame(fixations[points], np.full(len(points), trial.trial_id),
+                         np.full(len(points), trial.participant_id, dtype=object), aois_tokens.iloc[aois])
+
+
+def hit_frame(fixations, trial_ids, participant_ids, rows):
+    """Private function that formats hit test results, one record per (fixation, AOI) hit
+
+    Parameters
+    ----------
+    fixations : numpy.ndarray
+        fixation records of the hits
+
+    trial_ids : list or numpy.ndarray
+        trial id of each hit
+
+    participant_ids : list or numpy.ndarray
+        participant id of each hit
+
+    rows : pandas.DataFrame
+        AOI rows of the hits
+
+    Returns
+    -------
+    pandas.DataFrame
+        the hit test DataFrame returned by hit_test
+    """
+
+    tokens = rows['token'].tolist()
+
+    return pd.DataFrame({"trial": trial_ids,
+                         "participant": participant_ids,
+                         "code_file": rows['image'].to_numpy(),
+                         "code_language": rows['image'].to_numpy(),
+                         "timestamp": fixations['timestamp'],
+                         "duration": fixations['duration'],
+                         "x_cord": fixations['x_cord'],
+                         "y_cord": fixations['y_cord'],
+                         "aoi_x": rows['x'].to_numpy(),
+                         "aoi_y": rows['y'].to_numpy(),
+                         "aoi_width": rows['width'].to_numpy(),
+                         "aoi_height": rows['height'].to_numpy(),
+                         "token": tokens,
+                         "length": np.array([len(token) for token in tokens], dtype=np.int64),
+                         "srcML": rows['srcML_tag'].to_numpy()})
+
+
+def hit_test_dataset(subjects, aois, radius=25, workers=None):
+    """Hit tests the fixations of every trial in a dataset and returns one table.
+        Trials are grouped by stimulus image so that each AOI index is built once, and each
+        image is resolved in a single vectorized pass over the fixations of all its trials.
+
+    Parameters
+    ----------
+    subjects : dict
+        a dictionary of experiments where the key is the subject ID, e.g. from EMIP_dataset
+
+    aois : dict or pandas.DataFrame
+        AOIs with tokens and srcML tags of each image, either a dictionary keyed by image name
+        or one DataFrame of all images with an image column
+
+    radius : int, optional
+        radius of circle using in hit test
+
+    workers : int, optional
+        number of processes used to hit test the images, images are processed one at a time by default
+
+    Returns
+    -------
+    pandas.DataFrame
+        DataFrame with the columns of hit_test for all participants, grouped by image
+    """
+
+    if isinstance(aois, pd.DataFrame):
+        aois = {image: table for image, table in aois.groupby('image', sort=False)}
+
+    # Collect the fixations of each image in participant and trial order
+    groups = {}
+    for participant_id, experiment in subjects.items():
+        for trial in experiment.trial:
+            if trial.image in aois:
+                groups.setdefault(trial.image, []).append(trial)
+
+    tasks = []
+    for image, trials in groups.items():
+        records = [trial.get_fixations().records for trial in trials]
+        counts = [len(fixations) for fixations in records]
+
+        tasks.append((aois[image],
+                      np.repeat([trial.trial_id for trial in trials], counts),
+                      np.repeat(np.array([trial.participant_id for trial in trials], dtype=object), counts),
+                      np.concatenate(records),
+                      radius))
+
+    with instrumentation.stage("hit_test", items=sum(len(task[3]) for task in tasks)):
+        if workers is None or workers <= 1:
+            results = [hit_test_image(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(hit_test_image, *zip(*tasks)))
+
+    if not results:
+        return hit_frame(np.empty(0, dtype=FIXATION_EVENT_DTYPE), np.empty(0, dtype=np.int64),
+                         np.empty(0, dtype=object),
+                         pd.DataFrame(columns=['image', 'x', 'y', 'width', 'height', 'token', 'srcML_tag']))
+
+    return pd.concat(results, ignore_index=True)
+
+
+def hit_test_image(aois_tokens, trial_ids, participant_ids, fixations, radius):
+    """Private function that hit tests the fixations of all trials of one image
+
+    Parameters
+    ----------
+    aois_tokens : pandas.DataFrame
+        AOIs of the image with tokens and srcML tags
+
+    trial_ids : numpy.ndarray
+        trial id of each fixation
+
+    participant_ids : numpy.ndarray
+        participant id of each fixation
+
+    fixations : numpy.ndarray
+        fixation records of all trials of the image
+
+    radius : int
+        radius of circle using in hit test
+
+    Returns
+    -------
+    pandas.DataFrame
+        the hit test DataFrame of the image
+    """
+
+    points, aois = AOIIndex(aois_tokens, radius).query(fixations['x_cord'], fixations['y_cord'])
+
+    return hit_frame(fixations[points], trial_ids[points], participant_ids[points], aois_tokens.iloc[aois])
+
+
+def aoi_distance_map(aois, max_distance=100, center=False):
+    """Distance in pixels from each pixel of the screen to the nearest AOI rectangle, distances are
+        only computed up to max_distance around each AOI and are max_distance everywhere else
+
+    Parameters
+    ----------
+    aois : pandas.DataFrame
+        AOIs with x, y, width and height columns, e.g. from find_aoi
+
+    max_distance : int, optional
+        largest distance stored in the map
+
+    center : bool, optional
+        whether distances are measured to the middle row of each AOI instead of its whole rectangle
+
+    Returns
+    -------
+    numpy.ndarray
+        float32 array of shape (height, width) covering the AOIs and a max_distance margin
+    """
+
+    x = aois['x'].to_numpy(dtype=float)
+    y = aois['y'].to_numpy(dtype=float)
+    right = x + aois['width'].to_numpy(dtype=float)
+    bottom = y + aois['height'].to_numpy(dtype=float)
+
+    width = int(math.ceil(right.max())) + max_distance + 1 if len(aois) else 1
+    height = int(math.ceil(bottom.max())) + max_distance + 1 if len(aois) else 1
+
+    distance_map = np.full((height, width), max_distance, dtype=np.float32)
+
+    # Each AOI only changes the pixels within max_distance of it
+    for x0, y0, x1, y1 in zip(x.tolist(), y.tolist(), right.tolist(), bottom.tolist()):
+        column_0, column_1 = max(int(x0) - max_distance, 0), min(int(x1) + max_distance + 1, width)
+        row_0, row_1 = max(int(y0) - max_distance, 0), min(int(y1) + max_distance + 1, height)
+
+        columns = np.arange(column_0, column_1, dtype=np.float32)
+        rows = np.arange(row_0, row_1, dtype=np.float32)
+
+        dx = np.maximum(np.maximum(x0 - columns, columns - x1), 0)
+        if center:
+            dy = np.abs(rows - (y0 + y1) / 2)
+        else:
+            dy = np.maximum(np.maximum(y0 - rows, rows - y1), 0)
+
+        window = distance_map[row_0:row_1, column_0:column_1]
+        np.minimum(window, np.hypot(dy[:, None], dx[None, :]), out=window)
+
+    return distance_map
+
+
+def offset_scores(x_cords, y_cords, x_offsets, y_offsets, index, center_map):
+    """Private function that scores candidate offsets of a set of fixations in one vectorized pass
+
+    Parameters
+    ----------
+    x_cords, y_cords : numpy.ndarray
+        fixation coordinates
+
+    x_offsets, y_offsets : numpy.ndarray
+        candidate offsets, one candidate per position
+
+    index : AOIIndex
+        index of the AOIs, a fixation is a hit when the index finds it in an AOI, as in hit_test
+
+    center_map : numpy.ndarray
+        map from aoi_distance_map to the middle rows of the AOIs
+
+    Returns
+    -------
+    tuple
+        number of fixations on AOIs and total distance to the middle of AOIs for each candidate
+    """
+
+    height, width = center_map.shape
+
+    # One row per candidate, one column per fixation
+    shifted_x = x_cords[None, :] + x_offsets[:, None]
+    shifted_y = y_cords[None, :] + y_offsets[:, None]
+
+    # A fixation counts once however many AOIs it hits
+    points, _ = index.query(shifted_x.ravel(), shifted_y.ravel())
+    hits = np.zeros(shifted_x.size, dtype=bool)
+    hits[points] = True
+    hits = hits.reshape(shifted_x.shape)
+
+    columns = np.rint(shifted_x).astype(np.int64)
+    rows = np.rint(shifted_y).astype(np.int64)
+    inside = (columns >= 0) & (columns < width) & (rows >= 0) & (rows < height)
+
+    distances = np.full(columns.shape, center_map.max() if center_map.size else 0, dtype=np.float32)
+    distances[inside] = center_map[rows[inside], columns[inside]]
+
+    return hits.sum(axis=1), distances.sum(axis=1)
+
+
+def find_offset(trial, aois, radius=25, search_range=100, coarse_step=10, index=None, center_map=None):
+    """Searches the x/y offset that puts most fixations of a trial on AOIs.
+        A grid of offsets is scored from coarse_step pixels apart down to one pixel around the best one,
+        ties go to the offset that puts fixations closest to the middle of AOIs, then to the smallest offset.
+
+    Parameters
+    ----------
+    trial : Trial
+        the trial to be corrected, its current offset is the starting point
+
+    aois : pandas.DataFrame
+        AOIs of the trial image in screen coordinates, e.g. from find_aoi
+
+    radius : int, optional
+        radius around AOI to consider fixations in it within the AOI, hits are counted like in hit_test
+
+    search_range : int, optional
+        largest offset tried in each axis, in pixels
+
+    coarse_step : int, optional
+        distance between the offsets of the first grid, in pixels
+
+    index : AOIIndex, optional
+        index of the AOIs with the radius, built from aois if not given
+
+    center_map : numpy.ndarray, optional
+        map from aoi_distance_map to the middle rows of the AOIs, built from aois if not given
+
+    Returns
+    -------
+    tuple
+        x_offset, y_offset, number of hits with the offset and number of hits without it
+    """
+
+    if index is None:
+        index = AOIIndex(aois, radius)
+    if center_map is None:
+        center_map = aoi_distance_map(aois, center=True)
+
+    fixations = trial.get_fixations().records
+    x_cords, y_cords = fixations['x_cord'], fixations['y_cord']
+
+    return search_offset(x_cords, y_cords, index, center_map, search_range, coarse_step)
+
+
+def search_offset(x_cords, y_cords, index, center_map, search_range, coarse_step):
+    """Private function behind find_offset, coarse-to-fine grid search over fixation coordinates"""
+
+    zero = np.zeros(1)
+    hits_before = int(offset_scores(x_cords, y_cords, zero, zero, index, center_map)[0][0])
+
+    center_x, center_y = 0, 0
+    reach, step = search_range, max(int(coarse_step), 1)
+
+    while True:
+        grid_x = np.arange(max(center_x - reach, -search_range), min(center_x + reach, search_range) + 1, step)
+        grid_y = np.arange(max(center_y - reach, -search_range), min(center_y + reach, search_range) + 1, step)
+        x_offsets, y_offsets = [grid.ravel() for grid in np.meshgrid(grid_x, grid_y)]
+
+        hits, distances = offset_scores(x_cords, y_cords, x_offsets, y_offsets, index, center_map)
+        best = np.lexsort((np.abs(x_offsets) + np.abs(y_offsets), distances, -hits))[0]
+
+        center_x, center_y = int(x_offsets[best]), int(y_offsets[best])
+
+        if step == 1:
+            if hits[best] <= hits_before:
+                # Nothing gains fixations on AOIs, leave the trial where it is
+                return 0, 0, hits_before, hits_before
+            return center_x, center_y, int(hits[best]), hits_before
+
+        # Refine around the best offset
+        reach, step = step, max(step // 4, 1)
+
+
+def correct_offsets(subjects, image_path=None, aois=None, level="sub-line", radius=25, search_range=100,
+                    coarse_step=10, workers=None, apply=False):
+    """Finds the offset of every trial of an Experiment or a dataset with find_offset.
+        Trials are grouped by image and eye tracker so the AOI distance maps are built once, and images
+        can be processed in a process pool.
+
+    Parameters
+    ----------
+    subjects : Experiment or dict
+        an experiment, or a dictionary of experiments where the key is the subject ID
+
+    image_path : str, optional
+        path for all images, when aois is not given AOIs are found with find_aoi and moved to where
+        the eye tracker of each trial shows the stimulus, see stimulus_location
+
+    aois : dict, optional
+        AOIs of each image name in the coordinates of the fixations, EyeLink1000 stimuli are placed
+        at (10, 375) of the screen
+
+    level : str, optional
+        level of detection in AOIs when they are found with find_aoi
+
+    radius : int, optional
+        radius around AOI to consider fixations in it within the AOI, hits are counted like in hit_test
+
+    search_range : int, optional
+        largest offset tried in each axis, in pixels
+
+    coarse_step : int, optional
+        distance between the offsets of the first grid, in pixels
+
+    workers : int, optional
+        number of processes, images are processed one at a time by default
+
+    apply : bool, optional
+        whether the offsets found are applied to the trials with sample_offset
+
+    Returns
+    -------
+    pandas.DataFrame
+        participant, trial, image, fixations, hits_before, hits, x_offset and y_offset of each trial
+    """
+
+    if image_path is None and aois is None:
+        raise ValueError("image_path or aois should be given")
+
+    if isinstance(subjects, Experiment):
+        trials = subjects.trial
+    else:
+        trials = [trial for experiment in subjects.values() for trial in experiment.trial]
+
+    aois = stimulus_aois(trials, image_path, aois, level)
+
+    groups = {}
+    for trial in trials:
+        if (trial.image, trial.eye_tracker) in aois:
+            groups.setdefault((trial.image, trial.eye_tracker), []).append(trial)
+
+    tasks = [(aois[key],
+              [trial.get_fixations().records[['x_cord', 'y_cord']] for trial in image_trials],
+              radius, search_range, coarse_step)
+             for key, image_trials in groups.items()]
+
+    if workers is None or workers <= 1:
+        results = [correct_image_offsets(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(correct_image_offsets, *zip(*tasks)))
+
+    rows = []
+    for ((image, _), image_trials), offsets in zip(groups.items(), results):
+        for trial, (x_offset, y_offset, hits, hits_before) in zip(image_trials, offsets):
+            if apply:
+                trial.sample_offset(x_offset, y_offset)
+
+            rows.append([trial.participant_id, trial.trial_id, image, trial.get_fixation_number(), hits_before,
+                         hits, x_offset, y_offset])
+
+    return pd.DataFrame(rows, columns=['participant', 'trial', 'image', 'fixations', 'hits_before', 'hits',
+                                       'x_offset', 'y_offset'])
+
+
+def stimulus_aois(trials, image_path=None, aois=None, level="sub-line"):
+    """Private function that gives the AOIs of each image and eye tracker of the trials.
+        Found AOIs are moved to where the eye tracker shows the stimulus, so they are in the
+        coordinates of the fixations.
+
+    Parameters
+    ----------
+    trials : list
+        Trial objects
+
+    image_path : str, optional
+        path for all images, used when aois is not given
+
+    aois : dict, optional
+        AOIs of each image name, shared by all eye trackers
+
+    level : str, optional
+        level of detection in AOIs when they are found with find_aoi
+
+    Returns
+    -------
+    dict
+        AOIs of each (image, eye_tracker) pair that has AOIs
+    """
+
+    keys = {(trial.image, trial.eye_tracker) for trial in trials}
+
+    if aois is not None:
+        return {(image, eye_tracker): aois[image] for image, eye_tracker in keys if image in aois}
+
+    found = {}
+    for image, eye_tracker in keys:
+        if image and os.path.isfile(image_path + image):
+            aoi = aoi_cache.find_aoi(image, image_path, level=level)
+            x, y = stimulus_location(eye_tracker)
+            aoi['x'] += x
+            aoi['y'] += y
+            found[image, eye_tracker] = aoi
+
+    return found
+
+
+def correct_image_offsets(aois, fixations, radius, search_range, coarse_step):
+    """Private function that searches the offsets of all trials of one image
+
+    Parameters
+    ----------
+    aois : pandas.DataFrame
+        AOIs of the image
+
+    fixations : list
+        structured arrays with x_cord and y_cord of each trial
+
+    radius, search_range, coarse_step : int
+        see find_offset
+
+    Returns
+    -------
+    list
+        x_offset, y_offset, hits and hits_before of each trial
+    """
+
+    index, center_map = AOIIndex(aois, radius), aoi_distance_map(aois, center=True)
+
+    return [search_offset(records['x_cord'], records['y_cord'], index, center_map, search_range, coarse_step)
+            for records in fixations]
+
+
+def line_positions(aois):
+    """Vertical center of each line AOI, sorted from top to bottom
+
+    Parameters
+    ----------
+    aois : pandas.DataFrame
+        line AOIs, e.g. from find_aoi(level="line")
+
+    Returns
+    -------
+    numpy.ndarray
+        y coordinate of the middle of each line
+    """
+
+    return np.sort(aois['y'].to_numpy(dtype=np.float64) + aois['height'].to_numpy(dtype=np.float64) / 2)
+
+
+def nearest_line(y_cords, lines):
+    """Private function that finds the index of the line closest to each y coordinate
+
+    Parameters
+    ----------
+    y_cords : numpy.ndarray
+        y coordinates, any shape
+
+    lines : numpy.ndarray
+        sorted y coordinates of the lines
 
     Returns
     -------
-    PIL.Image
-        a PIL image where AOIs have been drawn as rectangles
+    numpy.ndarray
+        line index of each y coordinate
     """
 
-    img = Image.open(image_path + image).convert('1')
+    # Midpoints between lines split the screen into the band of each line
+    return np.searchsorted((lines[1:] + lines[:-1]) / 2, y_cords)
 
-    bg_color = find_background_color(img)
 
-    outline = {'white': '#000000', 'black': '#ffffff'}
+def drift_attach(x_cords, y_cords, lines):
+    """Attach, assigns each fixation to the closest line
 
-    # copy original image
-    rect_image = img.copy()
-    draw = ImageDraw.Draw(rect_image)
+    Parameters
+    ----------
+    x_cords, y_cords : numpy.ndarray
+        fixation coordinates
 
-    # loop over rectangles and draw them
-    for row in aoi.iterrows():
-        x_coordinate = row[1]['x']
-        y_coordinate = row[1]['y']
-        height = row[1]['height']
-        width = row[1]['width']
-        draw.rectangle([(x_coordinate, y_coordinate),
-                        (x_coordinate + width - 1, y_coordinate + height - 1)],
-                       outline=outline[bg_color])
+    lines : numpy.ndarray
+        sorted y coordinates of the lines, e.g. from line_positions
 
-    return rect_image
+    Returns
+    -------
+    numpy.ndarray
+        line index of each fixation
+    """
 
+    return nearest_line(np.asarray(y_cords, dtype=np.float64), lines)
 
-def add_tokens_to_AOIs(file_path, aois_raw):
-    """Adds tokens from code files to aois dataframe and returns it.
+
+def drift_chain(x_cords, y_cords, lines, x_threshold=192, y_threshold=32):
+    """Chain, splits the fixations into runs of consecutive fixations close to each other and
+        assigns each run to the line closest to its mean y coordinate
 
     Parameters
     ----------
-    file_path : str
-        path to directory where code files are stored. In EMIP this is "emip_stimulus_programs"
+    x_cords, y_cords : numpy.ndarray
+        fixation coordinates
 
-    aois_raw : pandas.Dataframe
-        the dataframe where AOIs are stored.
+    lines : numpy.ndarray
+        sorted y coordinates of the lines, e.g. from line_positions
+
+    x_threshold, y_threshold : int, optional
+        a run ends when the next fixation is further than this many pixels away in either axis
 
     Returns
     -------
-    pandas.DataFrame
-        a dataframe of AOIs with token information
+    numpy.ndarray
+        line index of each fixation
     """
 
-    image_name = aois_raw["image"][1]
+    x_cords = np.asarray(x_cords, dtype=np.float64)
+    y_cords = np.asarray(y_cords, dtype=np.float64)
 
-    # rectangle files
-    if image_name == "rectangle_java.jpg":
-        file_name = "Rectangle.java"
+    if len(y_cords) == 0:
+        return np.zeros(0, dtype=np.int64)
 
-    if image_name == "rectangle_java2.jpg":
-        file_name = "Rectangle.java"
+    jumps = (np.abs(np.diff(x_cords)) > x_threshold) | (np.abs(np.diff(y_cords)) > y_threshold)
+    starts = np.concatenate(([0], np.flatnonzero(jumps) + 1))
+    lengths = np.diff(np.append(starts, len(y_cords)))
 
-    if image_name == "rectangle_python.jpg":
-        file_name = "Rectangle.py"
+    means = np.add.reduceat(y_cords, starts) / lengths
 
-    if image_name == "rectangle_scala.jpg":
-        file_name = "Rectangle.scala"
+    return np.repeat(nearest_line(means, lines), lengths)
 
-    # vehicle files
-    if image_name == "vehicle_java.jpg":
-        file_name = "Vehicle.java"
 
-    if image_name == "vehicle_java2.jpg":
-        file_name = "Vehicle.java"
+def drift_regress(x_cords, y_cords, lines, slope_bounds=(-0.1, 0.1), offset_bounds=(-50, 50),
+                  spread_bounds=(1, 20), steps=21):
+    """Regress, fits parallel lines y = slope * x + line + offset to the fixations and assigns each
+        fixation to the line that fits it best. The fit maximizes the likelihood of the fixations under
+        a normal spread around their closest line, searched on a grid of slopes and offsets that is
+        refined around the best candidate.
 
-    if image_name == "vehicle_python.jpg":
-        file_name = "vehicle.py"
+    Parameters
+    ----------
+    x_cords, y_cords : numpy.ndarray
+        fixation coordinates
 
-    if image_name == "vehicle_scala.jpg":
-        file_name = "Vehicle.scala"
+    lines : numpy.ndarray
+        sorted y coordinates of the lines, e.g. from line_positions
 
-    code_file = open(file_path + file_name)
+    slope_bounds, offset_bounds, spread_bounds : tuple, optional
+        lowest and highest slope, vertical offset in pixels and standard deviation in pixels
 
-    code_text = code_file.read()
+    steps : int, optional
+        number of slopes and offsets in each grid
 
-    code_line = code_text.replace('\t', '').replace('        ', '').replace('    ', '').split('\n')
+    Returns
+    -------
+    numpy.ndarray
+        line index of each fixation
+    """
 
-    filtered_line = []
+    x_cords = np.asarray(x_cords, dtype=np.float64)
+    y_cords = np.asarray(y_cords, dtype=np.float64)
 
-    for line in code_line:
-        if len(line) != 0:
-            filtered_line.append(line.split(' '))
+    if len(y_cords) == 0:
+        return np.zeros(0, dtype=np.int64)
 
-    # after the code file has been tokenized and indexed
-    # we can attach tokens to correct AOI
+    slope_low, slope_high = slope_bounds
+    offset_low, offset_high = offset_bounds
 
-    aois_raw = aois_raw[aois_raw.kind == "sub-line"].copy()
+    for _ in range(4):
+        slopes, offsets = [grid.ravel() for grid in np.meshgrid(np.linspace(slope_low, slope_high, steps),
+                                                                np.linspace(offset_low, offset_high, steps))]
 
-    tokens = []
+        # Residual of each fixation for each candidate, the closest line is the most likely one
+        residuals = y_cords[None, :] - slopes[:, None] * x_cords[None, :] - offsets[:, None]
+        distances = residuals - lines[nearest_line(residuals, lines)]
+        squares = (distances ** 2).sum(axis=1)
 
-    for location in aois_raw["name"].iteritems():
-        line_part = location[1].split(' ')
-        line_num = int(line_part[1])
-        part_num = int(line_part[3])
+        # The best spread of each candidate has a closed form, bounded like the other parameters
+        spreads = np.clip(np.sqrt(squares / len(y_cords)), *spread_bounds)
+        likelihoods = -len(y_cords) * np.log(spreads) - squares / (2 * spreads ** 2)
 
-        # print(line_part, filtered_line[line_num - 1])
-        tokens.append(filtered_line[line_num - 1][part_num - 1])
+        best = np.argmax(likelihoods)
+        slope, offset = slopes[best], offsets[best]
 
-    aois_raw["token"] = tokens
+        slope_step = (slope_high - slope_low) / (steps - 1)
+        offset_step = (offset_high - offset_low) / (steps - 1)
+        slope_low, slope_high = max(slope - slope_step, slope_bounds[0]), min(slope + slope_step, slope_bounds[1])
+        offset_low, offset_high = max(offset - offset_step, offset_bounds[0]), min(offset + offset_step,
+                                                                                    offset_bounds[1])
 
-    if aois_raw[aois_raw['token'] == '']['name'].count() != 0:
-        print("Error in adding tokens, some tokens are missing!")
+    return nearest_line(y_cords - slope * x_cords - offset, lines)
 
-    return aois_raw
 
+def drift_warp(x_cords, y_cords, lines, words):
+    """Warp, aligns the fixation sequence to the expected reading sequence of the words with dynamic
+        time warping and assigns each fixation to the line most of its aligned words are on
 
-def add_srcml_to_AOIs(aois_raw, srcML_path):
-    """Adds srcML tags to AOIs dataframe and returns it.
-        Check https://www.srcml.org/ for more information about srcML
+    Parameters
+    ----------
+    x_cords, y_cords : numpy.ndarray
+        fixation coordinates
 
-        The files: rectangle.tsv and vehicle.tsv should be in the same directory as the code.
+    lines : numpy.ndarray
+        sorted y coordinates of the lines, e.g. from line_positions
+
+    words : numpy.ndarray
+        x and y coordinates of the words in reading order, one row per word
+
+    Returns
+    -------
+    numpy.ndarray
+        line index of each fixation
+    """
+
+    x_cords = np.asarray(x_cords, dtype=np.float64)
+    y_cords = np.asarray(y_cords, dtype=np.float64)
+    words = np.asarray(words, dtype=np.float64).reshape(-1, 2)
+
+    if len(y_cords) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    fixation_path, word_path = dtw_path(np.hypot(x_cords[:, None] - words[None, :, 0],
+                                                 y_cords[:, None] - words[None, :, 1]))
+
+    # Votes of the aligned words, ties go to the upper line
+    votes = np.zeros((len(y_cords), len(lines)), dtype=np.int64)
+    np.add.at(votes, (fixation_path, nearest_line(words[word_path, 1], lines)), 1)
+
+    return votes.argmax(axis=1)
+
+
+def dtw_path(cost):
+    """Private function that finds the dynamic time warping path of a cost matrix
 
     Parameters
     ----------
-    aois_raw : pandas.Dataframe
-        the dataframe where AOIs are stored
-
-    srcML_path : string
-        the path of the srcML tags file
+    cost : numpy.ndarray
+        cost of matching each element of the first sequence (rows) with each element of the second (columns)
 
     Returns
     -------
-    pandas.DataFrame
-        AOI dataframe with srcML
+    tuple
+        row and column indices of the path, from the start of both sequences to their end
     """
 
-    image_name = aois_raw["image"][1]
+    n, m = cost.shape
+    total = np.empty((n, m))
 
-    # srcML rectangle files
-    if image_name == "rectangle_java.jpg":
-        file_name = "rectangle.tsv"
+    # Within a row D[j] = c[j] + min(above[j], D[j - 1]) unrolls into a running minimum over prefix sums
+    above = np.full(m, np.inf)
+    above[0] = 0
+    for i in range(n):
+        prefix = np.cumsum(cost[i])
+        total[i] = prefix + np.minimum.accumulate(above - (prefix - cost[i]))
+        above = np.minimum(total[i], np.concatenate(([np.inf], total[i, :-1])))
 
-    if image_name == "rectangle_java2.jpg":
-        file_name = "rectangle.tsv"
+    rows, columns = [n - 1], [m - 1]
+    i, j = n - 1, m - 1
+    while i > 0 or j > 0:
+        if i == 0:
+            j -= 1
+        elif j == 0:
+            i -= 1
+        else:
+            step = np.argmin((total[i - 1, j - 1], total[i - 1, j], total[i, j - 1]))
+            i, j = (i - 1, j - 1) if step == 0 else (i - 1, j) if step == 1 else (i, j - 1)
+        rows.append(i)
+        columns.append(j)
 
-    if image_name == "rectangle_python.jpg":
-        aois_raw["srcML_tag"] = 'na'
-        return aois_raw
+    return np.array(rows[::-1]), np.array(columns[::-1])
 
-    if image_name == "rectangle_scala.jpg":
-        aois_raw["srcML_tag"] = 'na'
-        return aois_raw
 
-    # srcML vehicle files
-    if image_name == "vehicle_java.jpg":
-        file_name = "vehicle.tsv"
+drift_algorithms = {"attach": drift_attach, "chain": drift_chain, "regress": drift_regress, "warp": drift_warp}
 
-    if image_name == "vehicle_java2.jpg":
-        file_name = "vehicle.tsv"
 
-    if image_name == "vehicle_python.jpg":
-        aois_raw["srcML_tag"] = 'na'
-        return aois_raw
+def correct_drift(trial, aois, algorithm="warp", words=None, **parameters):
+    """Corrects the vertical drift of the fixations of a trial by assigning each fixation to a line of code.
+        Unlike sample_offset, the correction can differ from one line to the next.
 
-    if image_name == "vehicle_scala.jpg":
-        aois_raw["srcML_tag"] = 'na'
-        return aois_raw
+    Parameters
+    ----------
+    trial : Trial
+        trial to correct, its current offset is taken into account
 
-    srcML_table = pd.read_csv(srcML_path + file_name, sep='\t')
+    aois : pandas.DataFrame
+        line AOIs of the trial image, e.g. from find_aoi(level="line")
 
-    aois_raw = aois_raw[aois_raw.kind == "sub-line"].copy()
+    algorithm : str, optional
+        "attach", "chain", "regress" or "warp"
 
-    # after the srcML file has been recognized
-    # we can attach tokens to correct AOI
+    words : pandas.DataFrame, optional
+        token AOIs of the trial image in reading order, e.g. from find_aoi(level="sub-line"), used by warp.
+        Without them the start and end of each line are used as the reading sequence.
 
-    tags = []
+    **parameters
+        passed to the algorithm, see drift_chain and drift_regress
 
-    for location in aois_raw["name"].iteritems():
-        found = False
+    Returns
+    -------
+    numpy.ndarray
+        corrected y coordinate of each fixation, the middle of the line it was assigned to
+    """
 
-        for srcML_row in srcML_table.itertuples(index=True, name='Pandas'):
-            # stimulus_file	token	AOI	syntactic_context
+    if algorithm not in drift_algorithms:
+        raise ValueError("unknown drift correction algorithm: " + str(algorithm))
 
-            if srcML_row.AOI == location[1]:
-                tags.append(srcML_row.syntactic_context)
-                found = True
+    return correct_image_drift(aois, words, [trial.get_fixations().records], algorithm, parameters)[0]
 
-        if not found:
-            tags.append("na")
 
-    aois_raw["srcML_tag"] = tags
+def reading_sequence(aois, line_ends=False):
+    """Private function that orders AOIs from top to bottom and left to right
 
-    return aois_raw
+    Parameters
+    ----------
+    aois : pandas.DataFrame
+        AOIs with x, y, width and height columns
 
+    line_ends : bool, optional
+        whether the start and end of each AOI are used instead of its middle
 
-def overlap(fix, AOI, radius=25):
-    """Checks if fixation is within radius distance or over an AOI. Returns True/False.
+    Returns
+    -------
+    numpy.ndarray
+        x and y coordinates in reading order, one row per point
+    """
+
+    x = aois['x'].to_numpy(dtype=np.float64)
+    y = aois['y'].to_numpy(dtype=np.float64) + aois['height'].to_numpy(dtype=np.float64) / 2
+    width = aois['width'].to_numpy(dtype=np.float64)
+
+    if line_ends:
+        x, y = np.column_stack((x, x + width)).ravel(), np.repeat(y, 2)
+    else:
+        x = x + width / 2
+
+    order = np.lexsort((x, y))
+
+    return np.column_stack((x[order], y[order]))
+
+
+def correct_dataset_drift(subjects, image_path=None, aois=None, words=None, algorithm="warp", workers=None,
+                          **parameters):
+    """Corrects the vertical drift of every trial of an Experiment or a dataset with correct_drift.
+        Trials are grouped by image and eye tracker, and images can be processed in a process pool.
 
     Parameters
     ----------
-    fix : Fixation
-        A single fixation in a trial being considered for overlapping with the AOI
+    subjects : Experiment or dict
+        an experiment, or a dictionary of experiments where the key is the subject ID
 
-    AOI : pandas.DataFrame
-        contains AOI #kind	name	x	y	width	height	local_id	image	token
+    image_path : str, optional
+        path for all images, when aois is not given AOIs are found with find_aoi and moved to where
+        the eye tracker of each trial shows the stimulus, see stimulus_location
 
-    radius : int, optional
-        radius around AOI to consider fixations in it within the AOI.
-        default is 25 pixel since the fixation filter groups samples within 25 pixels.
+    aois : dict, optional
+        line AOIs of each image name in the coordinates of the fixations
+
+    words : dict, optional
+        token AOIs of each image name used by warp, found like aois when image_path is given
+
+    algorithm : str, optional
+        "attach", "chain", "regress" or "warp"
+
+    workers : int, optional
+        number of processes, images are processed one at a time by default
+
+    **parameters
+        passed to the algorithm, see drift_chain and drift_regress
 
     Returns
     -------
-    bool
-        whether it overlaps
+    pandas.DataFrame
+        participant, trial, image, fixation order, x_cord, y_cord and corrected y_cord of each fixation
     """
 
-    box_x = AOI.x - (radius / 2)
-    box_y = AOI.y - (radius / 2)
-    box_w = AOI.width + (radius / 2)
-    box_h = AOI.height + (radius / 2)
+    if algorithm not in drift_algorithms:
+        raise ValueError("unknown drift correction algorithm: " + str(algorithm))
 
-    return box_x <= fix.x_cord <= box_x + box_w and box_y <= fix.y_cord <= box_y + box_h
+    if image_path is None and aois is None:
+        raise ValueError("image_path or aois should be given")
+
+    if isinstance(subjects, Experiment):
+        trials = subjects.trial
+    else:
+        trials = [trial for experiment in subjects.values() for trial in experiment.trial]
 
+    aois = stimulus_aois(trials, image_path, aois, level="line")
 
-def hit_test(trial, aois_tokens, radius=25):
-    """Checks if fixations are within AOI with a fixation radius of 25 px
-        (since each fix is a sum of samples within 25px)
+    if words is not None:
+        words = stimulus_aois(trials, aois=words)
+    elif image_path is not None and algorithm == "warp":
+        words = stimulus_aois([trial for trial in trials if (trial.image, trial.eye_tracker) in aois], image_path)
+
+    groups = {}
+    for trial in trials:
+        if (trial.image, trial.eye_tracker) in aois:
+            groups.setdefault((trial.image, trial.eye_tracker), []).append(trial)
+
+    tasks = [(aois[key], None if words is None else words.get(key),
+              [trial.get_fixations().records[['x_cord', 'y_cord']] for trial in image_trials],
+              algorithm, parameters)
+             for key, image_trials in groups.items()]
+
+    if workers is None or workers <= 1:
+        results = [correct_image_drift(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(correct_image_drift, *zip(*tasks)))
+
+    frames = []
+    for ((image, _), image_trials), corrected in zip(groups.items(), results):
+        for trial, y_cords in zip(image_trials, corrected):
+            fixations = trial.get_fixations().records
+            frames.append(pd.DataFrame({'participant': trial.participant_id,
+                                        'trial': trial.trial_id,
+                                        'image': image,
+                                        'order': fixations['order'],
+                                        'x_cord': fixations['x_cord'],
+                                        'y_cord': fixations['y_cord'],
+                                        'corrected_y_cord': y_cords}))
+
+    if not frames:
+        return pd.DataFrame(columns=['participant', 'trial', 'image', 'order', 'x_cord', 'y_cord',
+                                     'corrected_y_cord'])
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def correct_image_drift(aois, words, fixations, algorithm, parameters):
+    """Private function that corrects the drift of all trials of one image
 
     Parameters
     ----------
-    trial : Trial
-        contains fixations and other metadata (trial#, participant, code_file, code_language)
-            - fixation includes timestamp, duration, x_cord, y_cord
+    aois, words : pandas.DataFrame
+        line and token AOIs of the image, words can be None
 
-    aois_tokens : pandas.Dataframe
-        contains each AOI location and dimension and token text
+    fixations : list
+        structured arrays with x_cord and y_cord of each trial
 
-    radius : int, optional
-        radius of circle using in hit test
+    algorithm : str
+        name of the algorithm in drift_algorithms
+
+    parameters : dict
+        passed to the algorithm
 
     Returns
     -------
-    pandas.DataFrame
-        DataFrame with a record representing each fixation, each record contains:
-        trial, participant, code_file, code_language, timestamp, duration, x_cord, y_cord, token, length
+    list
+        corrected y coordinates of each trial
     """
 
-    header = ["trial",
-              "participant",
-              "code_file",
-              "code_language",
-              "timestamp",
-              "duration",
-              "x_cord",
-              "y_cord",
-              "aoi_x",
-              "aoi_y",
-              "aoi_width",
-              "aoi_height",
-              "token",
-              "length",
-              "srcML"]
-
-    result = pd.DataFrame(columns=header)
-    print("all fixations:", len(trial.get_fixations()))
-
-    for fix in trial.get_fixations().values():
-
-        for row in aois_tokens.itertuples(index=True, name='Pandas'):
-            # kind	name	x	y	width	height	local_id	image	token
-
-            if overlap(fix, row, radius):
-                df = pd.DataFrame([[fix.trial_id,
-                                    fix.participant_id,
-                                    row.image,
-                                    row.image,
-                                    fix.timestamp,
-                                    fix.duration,
-                                    fix.x_cord,
-                                    fix.y_cord,
-                                    row.x,
-                                    row.y,
-                                    row.width,
-                                    row.height,
-                                    row.token,
-                                    len(row.token),
-                                    row.srcML_tag], ], columns=header)
-
-                result = result.append(df, ignore_index=True)
-
-    return result
-
-
-def EMIP_dataset(path, sample_size=216):
+    lines = line_positions(aois)
+
+    if algorithm == "warp":
+        parameters = dict(parameters, words=reading_sequence(aois if words is None else words, words is None))
+
+    corrected = []
+    for records in fixations:
+        if len(lines) == 0:
+            corrected.append(records['y_cord'].astype(np.float64))
+        else:
+            corrected.append(lines[drift_algorithms[algorithm](records['x_cord'], records['y_cord'], lines,
+                                                               **parameters)])
+
+    return corrected
+
+
+def EMIP_dataset(path, sample_size=216, workers=None, cache=None):
     """Import the EMIP dataset
 
     Parameters
@@ -1572,34 +4791,30 @@ def EMIP_dataset(path, sample_size=216):
     sample_size : int, optional
         the number of subjects to be processed, the default is 216
 
+    workers : int, optional
+        number of processes used to parse participant files, files are parsed one at a time by default
+
+    cache : ExperimentCache or str, optional
+        parse cache or its directory, see ExperimentCache
+
     Returns
     -------
     dict
         a dictionary of experiments where the key is the subject ID
     """
 
-    subject = {}
-    count = 0
+    files = {}
 
     # go over .tsv files in the rawdata directory add files and count them
-    # r = root, d = directories, f = files
-    for r, d, f in os.walk(path):
-        for file in f:
-            if '.tsv' in file:
-                participant_id = file.split('/')[-1].split('_')[0]
-
-                if subject.get(participant_id, -1) == -1:
-                    subject[participant_id] = read_SMIRed250(os.path.join(r, file), filetype="tsv")
-                else:
-                    print("Error, experiment already in dictionary")
+    for file_path in dataset_files(path, '.tsv', sample_size):
+        participant_id = os.path.basename(file_path).split('_')[0]
 
-            count += 1
+        if participant_id not in files:
+            files[participant_id] = file_path
+        else:
+            logger.error("Error, experiment already in dictionary: %s", file_path)
 
-            # breaks after sample_size
-            if count == sample_size:
-                break
-
-    return subject
+    return parse_dataset_files(files, read_SMIRed250, "tsv", workers, cache)
 
 
 def corrected_EMIP_dataset(path, sample_size=216):
@@ -1635,7 +4850,8 @@ def corrected_EMIP_dataset(path, sample_size=216):
     return subject            
 
 
-def AlMadi_dataset(path, sample_size=216):
+def AlMadi_dataset(path, sample_size=216, workers=None, cache=None, samples=True, root="datasets/AlMadi2018/",
+                   manifest=None):
     """Import the Al Madi's dataset
 
     Parameters
@@ -1646,32 +4862,136 @@ def AlMadi_dataset(path, sample_size=216):
     sample_size : int, optional
         the number of subjects to be processed, the default is 216
 
+    workers : int, optional
+        number of processes used to parse participant files, files are parsed one at a time by default
+
+    cache : ExperimentCache or str, optional
+        parse cache or its directory, see ExperimentCache
+
+    samples : bool, optional
+        whether raw samples are kept, see read_EyeLink1000
+
+    root : str, optional
+        dataset directory that contains runtime/dataviewer/ with the trial graphics files
+
+    manifest : str, optional
+        JSON file that keeps the trial images between runs, see VCLIndex
+
     Returns
     -------
     dict
         a dictionary of experiments where the key is the subject ID
     """
-    subject = {}
-    count = 0
 
-    # go over .tsv files in the rawdata directory add files and count them
+    files = {}
+
+    # go over .asc files in the rawdata directory add files and count them
+    for file_path in dataset_files(path, '.asc', sample_size):
+        participant_id = os.path.basename(file_path).split('.')[0]
+
+        if participant_id not in files:
+            files[participant_id] = file_path
+        else:
+            logger.error("Error, experiment already in dictionary: %s", file_path)
+
+    # Trial images of all participants are found before parsing, so workers receive them
+    vcl_index = VCLIndex(root, manifest)
+    for participant_id in files:
+        vcl_index.scan(participant_id)
+    vcl_index.save()
+
+    return parse_dataset_files(files, read_EyeLink1000, "asc", workers, cache, samples=samples,
+                               vcl_index=vcl_index)
+
+
+def dataset_files(path, extension, sample_size):
+    """Private function that lists raw data files of a dataset in a deterministic order
+
+    Parameters
+    ----------
+    path : str
+        path to the dataset raw data directory
+
+    extension : str
+        extension of the raw data files, e.g. ".tsv"
+
+    sample_size : int
+        the number of files to be listed
+
+    Returns
+    -------
+    list
+        paths of the first sample_size raw data files, sorted by directory and name
+    """
+
+    files = []
+
     # r = root, d = directories, f = files
     for r, d, f in os.walk(path):
-        for file in f:
-            if '.asc' in file:
+        d.sort()
 
-                participant_id = file.split('.')[0]
+        for file in sorted(f):
+            if extension in file:
+                files.append(os.path.join(r, file))
 
-                if subject.get(participant_id, -1) == -1:
-                    subject[participant_id] = read_EyeLink1000(r+"/"+file, filetype="asc")
-                else:
-                    print("Error, experiment already in dictionary")
+            # stops after sample_size
+            if len(files) == sample_size:
+                return files
 
-            count += 1
+    return files
 
-            # breaks after sample_size
-            if count == sample_size:
-                break
+
+def parse_dataset_files(files, reader, filetype, workers=None, cache=None, **options):
+    """Private function that parses participant files, in a process pool when workers is given.
+        A file that fails to parse is logged with its error and left out of the result.
+
+    Parameters
+    ----------
+    files : dict
+        raw data file path for each participant id
+
+    reader : function
+        read_SMIRed250 or read_EyeLink1000
+
+    filetype : str
+        type of the files, e.g. "tsv"
+
+    workers : int, optional
+        number of processes, files are parsed in this process if it is None or 1
+
+    cache : ExperimentCache or str, optional
+        parse cache passed to the reader
+
+    **options
+        other reader parameters
+
+    Returns
+    -------
+    dict
+        a dictionary of experiments where the key is the subject ID, in the same order as files
+    """
+
+    subject = {}
+
+    if workers is None or workers <= 1:
+        for participant_id, file_path in files.items():
+            try:
+                subject[participant_id] = reader(file_path, filetype=filetype, cache=cache, **options)
+            except Exception as error:
+                logger.error("Error parsing %s: %r", file_path, error)
+
+        return subject
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {participant_id: executor.submit(reader, file_path, filetype=filetype, cache=cache, **options)
+                   for participant_id, file_path in files.items()}
+
+        # Collect in submission order so the result does not depend on scheduling
+        for participant_id, future in futures.items():
+            try:
+                subject[participant_id] = future.result()
+            except Exception as error:
+                logger.error("Error parsing %s: %r", files[participant_id], error)
 
     return subject
 
@@ -1734,7 +5054,7 @@ def download(dataset_name):
 
     # Check if dataset has already been downloaded
     if not check_downloaded(dataset_name):
-        print('Downloading...')
+        logger.info('Downloading...')
         
         #creates a zip file of the data if unzipped
         if is_zipped == False:
@@ -1744,14 +5064,14 @@ def download(dataset_name):
                 f.write(r.content)
 
     if not check_unzipped(dataset_name):
-        print('unzipping...')
+        logger.info('unzipping...')
 
         #extract all data
         with zipfile.ZipFile('./datasets/' + dataset_name + '.zip', 'r') as data_zip:
 
             data_zip.extractall('./datasets/' + dataset_name)
 
-    print('Please cite this paper: ', citation)
+    logger.info('Please cite this paper: %s', citation)
 
     return './datasets/' + dataset_name
 